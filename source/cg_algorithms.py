@@ -5,10 +5,94 @@
 import math
 
 
-def draw_line(p_list, algorithm):
+def _step_range(start, sign, n, lo, hi):
+    """ 第i步(0 <= i < n)的坐标为start + sign * i，返回坐标落在[lo, hi]内的步数范围[i0, i1) """
+    if sign > 0:
+        i0, i1 = lo - start, hi - start + 1
+    else:
+        i0, i1 = start - hi, start - lo + 1
+    return max(i0, 0), min(i1, n)
+
+
+def merge_spans(spans):
+    """ 合并同一扫描线上重叠或相邻的区段
+    :param spans: (list of list of int: [(y, x_start, x_end), ...]) 区段列表（含两端），可以无序、重复
+    :return: (list of list of int: [(y, x_start, x_end), ...]) 按(y, x_start)排序、互不相交且不相邻的区段列表
+    """
+    result = []
+    span_y, x_start, x_end = None, 0, 0  # 正在合并的区段
+    for y, x0, x1 in sorted(spans):
+        if y == span_y and x0 <= x_end + 1:
+            if x1 > x_end:
+                x_end = x1
+            continue
+        if span_y is not None:
+            result.append((span_y, x_start, x_end))
+        span_y, x_start, x_end = y, x0, x1
+    if span_y is not None:
+        result.append((span_y, x_start, x_end))
+    return result
+
+
+def to_spans(pixels):
+    """ 将像素点列表转化为区段列表：先把前后相邻的同行像素点连成区段，再按扫描线合并去重
+    :param pixels: (list of list of int: [(x_0, y_0), (x_1, y_1), ...]) 像素点坐标列表
+    :return: (list of list of int: [(y, x_start, x_end), ...]) 区段列表，见merge_spans
+    """
+    runs = []
+    run_y, x_start, x_end = None, 0, 0  # 正在连接的区段
+    for x, y in pixels:
+        if y == run_y:
+            if x == x_end + 1:
+                x_end = x
+                continue
+            if x == x_start - 1:
+                x_start = x
+                continue
+            if x_start <= x <= x_end:  # 重复的像素点
+                continue
+        if run_y is not None:
+            runs.append((run_y, x_start, x_end))
+        run_y, x_start, x_end = y, x, x
+    if run_y is not None:
+        runs.append((run_y, x_start, x_end))
+    return merge_spans(runs)
+
+
+def _bresenham_spans(x0, y0, sign_x, sign_y, dx, dy, i0, i1, rows=None):
+    """ 斜率绝对值不超过1的Bresenham线段第[i0, i1)步的区段：第i步位于第k = (2 * dy * i + dx) // (2 * dx)行，
+    第k行从第ceil((2 * dx * k - dx) / (2 * dy))步开始，每行只需常数次计算
+    :param rows: (list of int: [y_min, y_max]) 只生成这些行的区段，默认不限
+    """
+    result = []
+    if i0 >= i1:
+        return result
+    k0 = (2 * dy * i0 + dx) // (2 * dx)
+    k1 = (2 * dy * (i1 - 1) + dx) // (2 * dx) + 1
+    if rows is not None:
+        k_min, k_max = _step_range(y0, sign_y, k1, rows[0], rows[1])
+        k0, k1 = max(k0, k_min), k_max
+    for k in range(k0, k1):
+        if dy > 0:
+            a = max(i0, -((dx - 2 * dx * k) // (2 * dy)))
+            b = min(i1, -((dx - 2 * dx * (k + 1)) // (2 * dy)))
+        else:
+            a, b = i0, i1
+        if a < b:
+            xa, xb = x0 + sign_x * a, x0 + sign_x * (b - 1)
+            result.append((y0 + sign_y * k, min(xa, xb), max(xa, xb)))
+    if sign_y < 0:
+        result.reverse()
+    return result
+
+
+def draw_line(p_list, algorithm, region=None, spans=False):
     """ 绘制线段
     :param p_list: (list of list of int: [(x0, y0), (x1, y1)]) 线段的起点和终点坐标
     :param algorithm: (string) 绘制使用的算法，包括'DDA'和'Bresenham'
+    :param region: (list of int: [x_min, y_min, x_max, y_max]) 裁剪区域（含边界），只计算并返回区域内的像素点，
+                   沿主方向只遍历落在区域内的步数，默认不裁剪
+    :param spans: (bool) 是否以区段列表的形式返回结果，见to_spans
     :return: (list of list of int: [(x_0, y_0), (x_1, y_1), (x_2, y_2), ...]) 绘制结果的像素点坐标列表
     """
     if len(p_list) < 2:
@@ -21,11 +105,25 @@ def draw_line(p_list, algorithm):
         if dis > 0:
             dx = (x1 - x0) / dis
             dy = (y1 - y0) / dis
-            x, y = x0, y0
-            for i in range(dis):
-                result.append((round(x), round(y)))
+            x_major = abs(x1 - x0) >= abs(y1 - y0)
+            i0, i1 = 0, dis
+            if region is not None:  # 主方向每步恰好移动一个像素，可以直接算出区域内的步数范围
+                x_min, y_min, x_max, y_max = region
+                if x_major:
+                    i0, i1 = _step_range(x0, 1 if x1 > x0 else -1, dis, x_min, x_max)
+                else:
+                    i0, i1 = _step_range(y0, 1 if y1 > y0 else -1, dis, y_min, y_max)
+            # 从第i0步开始逐步累加步长：不裁剪时i0 = 0，与逐步累加的结果完全一致；裁剪时第i0步的坐标直接由起点算出，
+            # 计算量只与区域内的步数有关，累加的舍入误差不同，个别像素点可能与不裁剪时相差一个像素
+            x, y = x0 + i0 * dx, y0 + i0 * dy
+            for i in range(i0, i1):
+                px, py = round(x), round(y)
+                if region is None or (x_min <= px <= x_max and y_min <= py <= y_max):
+                    result.append((px, py))
                 x += dx
                 y += dy
+            if spans:
+                return to_spans(result)
     elif algorithm == 'Bresenham':
         # 对于y = mx+b(0<m<1): (xk,yk)的下一个是(1+xk,yk)或(1+xk,1+yk), y = m(1+xk)+b,
         # dd = d_lower-d_upper = (y-yk)-((1+yk)-y) = 2m(1+xk)-2yk+2b-1, >0 则绘制上方像素(+1), <0 则绘制下方像素(0)
@@ -46,29 +144,48 @@ def draw_line(p_list, algorithm):
         # sign 必须放在交换之后计算
         sign_x = (1 if x1 > x0 else (-1))
         sign_y = (1 if y1 > y0 else (-1))
-        x, y = x0, y0
-        p = 2 * dy - dx
+        i0, i1 = 0, dx
+        if region is not None:
+            x_min, y_min, x_max, y_max = region
+            if is_swapped:
+                x_min, y_min, x_max, y_max = y_min, x_min, y_max, x_max
+            i0, i1 = _step_range(x0, sign_x, dx, x_min, x_max)
+        # 第i步时y已经移动了k = (2 * dy * i + dx) // (2 * dx)次，pi = 2 * dy * (i + 1) - dx - 2 * dx * k，可以直接从第i0步开始
+        k = (2 * dy * i0 + dx) // (2 * dx) if dx > 0 else 0
+        x, y = x0 + sign_x * i0, y0 + sign_y * k
+        p = 2 * dy * (i0 + 1) - dx - 2 * dx * k
+        if spans and not is_swapped:  # 斜率绝对值不超过1时，不必逐点生成，直接求出每一行的区段
+            return _bresenham_spans(x0, y0, sign_x, sign_y, dx, dy, i0, i1,
+                                    (y_min, y_max) if region is not None else None)
         dy_2 = 2 * dy
         dy_dx_2 = 2 * (dy - dx)
-        for i in range(dx):
-            if is_swapped:
-                result.append((y, x))
-            else:
-                result.append((x, y))
+        for i in range(i0, i1):
+            if region is None or y_min <= y <= y_max:
+                if is_swapped:
+                    result.append((y, x))
+                else:
+                    result.append((x, y))
             x += sign_x
             if p < 0:
                 p += dy_2
             else:
                 y += sign_y
                 p += dy_dx_2
+    if spans:  # 主方向为y的线段，每一步各占一行
+        runs = [(y, x, x) for x, y in result]
+        if len(runs) > 1 and runs[0][0] > runs[-1][0]:
+            runs.reverse()
+        return runs
     return result
 
 
-def draw_polygon(p_list, algorithm, is_closed):
+def draw_polygon(p_list, algorithm, is_closed, region=None, spans=False):
     """ 绘制多边形
     :param is_closed: 是否闭合
     :param p_list: (list of list of int: [(x0, y0), (x1, y1), (x2, y2), ...]) 多边形的顶点坐标列表
     :param algorithm: (string) 绘制使用的算法，包括'DDA'和'Bresenham'
+    :param region: (list of int: [x_min, y_min, x_max, y_max]) 裁剪区域，见draw_line
+    :param spans: (bool) 是否以区段列表的形式返回结果（顶点处重复的像素点会被合并）
     :return: (list of list of int: [(x_0, y_0), (x_1, y_1), (x_2, y_2), ...]) 绘制结果的像素点坐标列表
     """
     result = []
@@ -76,15 +193,16 @@ def draw_polygon(p_list, algorithm, is_closed):
     for i in range(v_num):
         if i == v_num - 1:  # 最后一个
             if is_closed:  # 闭合多边形
-                result += draw_line([p_list[i], p_list[0]], algorithm)
+                result += draw_line([p_list[i], p_list[0]], algorithm, region, spans)
         else:
-            result += draw_line([p_list[i], p_list[i + 1]], algorithm)
-    return result
+            result += draw_line([p_list[i], p_list[i + 1]], algorithm, region, spans)
+    return merge_spans(result) if spans else result
 
 
-def draw_ellipse(p_list):
+def draw_ellipse(p_list, spans=False):
     """绘制椭圆（采用中点圆生成算法）
     :param p_list: (list of list of int: [(x0, y0), (x1, y1)]) 椭圆的矩形包围框左上角和右下角顶点坐标
+    :param spans: (bool) 是否以区段列表的形式返回结果
     :return: (list of list of int: [(x_0, y_0), (x_1, y_1), (x_2, y_2), ...]) 绘制结果的像素点坐标列表
     """
     x0, y0 = p_list[0]
@@ -102,6 +220,20 @@ def draw_ellipse(p_list):
     x, y = 0, ry
     xl, yl = x, y  # 上一个点
     p = ry * ry - rx * rx * ry + rx * rx / 4
+    runs = []  # 输出区段且xc为整数时，区域1中y不变的各段[xa, xb]直接对应四个区段，不必逐点生成
+    xa = 0
+    while spans and (x0 + x1) % 2 == 0 and ry * ry * x < rx * rx * y:
+        xl, yl = x, y
+        x += 1
+        if p < 0:
+            p += ry * ry * (2 * x + 1)
+        else:
+            runs.append((yl, xa, xl))
+            xa = x
+            y -= 1
+            p += ry * ry * (2 * x + 1) - 2 * rx * rx * y
+    if x > 0 and xa <= xl:
+        runs.append((yl, xa, xl))
     while ry * ry * x < rx * rx * y:
         result.append((round(xc - x), round(yc + y)))
         result.append((round(xc - x), round(yc - y)))
@@ -128,21 +260,48 @@ def draw_ellipse(p_list):
         else:
             x += 1
             p += 2 * ry * ry * x + rx * rx * (1 - 2 * y)
-    return result
+    if spans and (x0 + x1) % 2 == 0:
+        xc = int(xc)
+        return merge_spans([(y, x, x) for x, y in result] +
+                           [(round(yc + y), xc - xb, xc - xa) for y, xa, xb in runs] +
+                           [(round(yc - y), xc - xb, xc - xa) for y, xa, xb in runs] +
+                           [(round(yc + y), xc + xa, xc + xb) for y, xa, xb in runs] +
+                           [(round(yc - y), xc + xa, xc + xb) for y, xa, xb in runs])
+    return to_spans(result) if spans else result
 
 
-def draw_curve(p_list, algorithm):
+def draw_curve(p_list, algorithm, samples=100, region=None, spans=False):
     """绘制曲线
     :param p_list: (list of list of int: [(x0, y0), (x1, y1), (x2, y2), ...]) 曲线的控制点坐标列表
     :param algorithm: (string) 绘制使用的算法，包括'Bezier'和'B-spline'（三次均匀B样条曲线，曲线不必经过首末控制点）
+    :param samples: (int) 每段曲线的采样数（t的步长为1/samples），越小越粗糙、越快
+    :param region: (list of int: [x_min, y_min, x_max, y_max]) 裁剪区域，见draw_line
+    :param spans: (bool) 是否以区段列表的形式返回结果（相邻两段折线共用的像素点会被合并）
     :return: (list of list of int: [(x_0, y_0), (x_1, y_1), (x_2, y_2), ...]) 绘制结果的像素点坐标列表
     """
-    p_num = len(p_list)
     result = []
-    p_key = []  # 得到的所有点，需要用直线连接后作为曲线
+    p_key = curve_points(p_list, algorithm, samples)  # 得到的所有点，需要用直线连接后作为曲线
+    # 开始连接
+    for i in range(len(p_key) - 1):
+        line = draw_line([p_key[i], p_key[i + 1]], 'Bresenham', region, spans)
+        result += line
+    return merge_spans(result) if spans else result
+
+
+def curve_points(p_list, algorithm, samples=100):
+    """曲线上的采样点，依次用直线连接即为曲线
+    :param p_list: (list of list of int: [(x0, y0), (x1, y1), (x2, y2), ...]) 曲线的控制点坐标列表
+    :param algorithm: (string) 'Bezier'或'B-spline'，见draw_curve
+    :param samples: (int) 每段曲线的采样数，见draw_curve
+    :return: (list of list of int: [(x_0, y_0), (x_1, y_1), ...]) 采样点（坐标取整）
+    """
+    p_num = len(p_list)
+    p_key = []
+    dt = 1 / samples
+    t_end = 1 + dt / 10
     if algorithm == 'Bezier':
         t = 0
-        while t < 1.001:
+        while t < t_end:
             p = []
             for i in range(p_num):  # 初始化P0点集
                 p.append(p_list[i])
@@ -158,33 +317,138 @@ def draw_curve(p_list, algorithm):
                     p[j] = p_tmp[j]
             # 现在，得到了最终的点，p[0]
             p_key.append((int(p[0][0]), int(p[0][1])))
-            t += 0.01
+            t += dt
     elif algorithm == 'B-spline':
         for i in range(p_num - 3):  # 每4个点为一组：[p0, p(n-4)] ~ [p3, p(n-1)]
-            p0, p1, p2, p3 = p_list[i], p_list[i + 1], p_list[i + 2], p_list[i + 3]
-            x0, x1, x2, x3 = p0[0], p1[0], p2[0], p3[0]
-            y0, y1, y2, y3 = p0[1], p1[1], p2[1], p3[1]
-            a0 = (x0 + 4 * x1 + x2) / 6
-            a1 = - (x0 - x2) / 2
-            a2 = (x0 - 2 * x1 + x2) / 2
-            a3 = - (x0 - 3 * x1 + 3 * x2 - x3) / 6
-            b0 = (y0 + 4 * y1 + y2) / 6
-            b1 = - (y0 - y2) / 2
-            b2 = (y0 - 2 * y1 + y2) / 2
-            b3 = - (y0 - 3 * y1 + 3 * y2 - y3) / 6
-            t = 0
-            while t < 1.001:
-                xt = a0 + a1 * t + a2 * t * t + a3 * t * t * t
-                yt = b0 + b1 * t + b2 * t * t + b3 * t * t * t
-                p_key.append((int(xt), int(yt)))
-                t += 0.01
-    # 开始连接
-    for i in range(len(p_key) - 1):
-        line = draw_line([p_key[i], p_key[i + 1]], 'Bresenham')
-        result += line
+            p_key += b_spline_samples(p_list[i:i + 4], samples)
+    return p_key
+
+
+def b_spline_samples(p_list, samples=100):
+    """三次均匀B样条曲线一段上的采样点，每段只取决于4个控制点
+    :param p_list: (list of list of int: [(x0, y0), (x1, y1), (x2, y2), (x3, y3)]) 该段的4个控制点
+    :param samples: (int) 采样数，见draw_curve
+    :return: (list of list of int: [(x_0, y_0), (x_1, y_1), ...]) t = 0, 1/samples, ..., 1处的点（坐标取整）
+    """
+    result = []
+    dt = 1 / samples
+    t_end = 1 + dt / 10
+    p0, p1, p2, p3 = p_list
+    x0, x1, x2, x3 = p0[0], p1[0], p2[0], p3[0]
+    y0, y1, y2, y3 = p0[1], p1[1], p2[1], p3[1]
+    a0 = (x0 + 4 * x1 + x2) / 6
+    a1 = - (x0 - x2) / 2
+    a2 = (x0 - 2 * x1 + x2) / 2
+    a3 = - (x0 - 3 * x1 + 3 * x2 - x3) / 6
+    b0 = (y0 + 4 * y1 + y2) / 6
+    b1 = - (y0 - y2) / 2
+    b2 = (y0 - 2 * y1 + y2) / 2
+    b3 = - (y0 - 3 * y1 + 3 * y2 - y3) / 6
+    t = 0
+    while t < t_end:
+        xt = a0 + a1 * t + a2 * t * t + a3 * t * t * t
+        yt = b0 + b1 * t + b2 * t * t + b3 * t * t * t
+        result.append((int(xt), int(yt)))
+        t += dt
     return result
 
 
+def _clamp_rows(y_top, y_bottom, region):
+    """ 像素中心落在[y_top, y_bottom)内的扫描线范围，有裁剪区域时只取区域内的扫描线 """
+    y0, y1 = math.ceil(y_top), math.ceil(y_bottom)
+    if region is not None:
+        y0, y1 = max(y0, region[1]), min(y1, region[3] + 1)
+    return range(y0, y1)
+
+
+def _append_span(result, y, x_left, x_right, region):
+    """ 将像素中心落在[x_left, x_right)内的像素作为第y行的区段加入result，有裁剪区域时只取区域内的部分 """
+    x0, x1 = math.ceil(x_left), math.ceil(x_right) - 1
+    if region is not None:
+        x0, x1 = max(x0, region[0]), min(x1, region[2])
+    if x0 <= x1:
+        result.append((y, x0, x1))
+
+
+def _capsule_spans(p0, p1, r, region, result):
+    """ 线段p0p1加粗为半径r的胶囊形（两端为半圆），逐行求其与扫描线相交的区间
+    胶囊形是凸的，每行的交集是两端圆与中间矩形各自区间的并，仍为一个区间；结果追加到result
+    """
+    x0, y0 = p0
+    x1, y1 = p1
+    dx, dy = x1 - x0, y1 - y0
+    length = math.hypot(dx, dy)
+    for y in _clamp_rows(min(y0, y1) - r, max(y0, y1) + r, region):
+        x_left, x_right = math.inf, -math.inf
+        for cx, cy in (p0, p1):  # 两端的圆
+            h = r * r - (y - cy) * (y - cy)
+            if h >= 0:
+                h = math.sqrt(h)
+                x_left, x_right = min(x_left, cx - h), max(x_right, cx + h)
+        if length > 0:
+            # 中间的矩形：到中心线的距离 |-dy * (x - x0) + dx * (y - y0)| <= r * length，
+            # 且投影落在线段上 0 <= dx * (x - x0) + dy * (y - y0) <= length * length，两者都是x的线性不等式
+            lo, hi = -math.inf, math.inf
+            for a, b, c0, c1 in ((-dy, dx * (y - y0) + dy * x0, -r * length, r * length),
+                                 (dx, dy * (y - y0) - dx * x0, 0, length * length)):
+                if a == 0:
+                    if not c0 <= b <= c1:
+                        lo, hi = math.inf, -math.inf
+                elif a > 0:
+                    lo, hi = max(lo, (c0 - b) / a), min(hi, (c1 - b) / a)
+                else:
+                    lo, hi = max(lo, (c1 - b) / a), min(hi, (c0 - b) / a)
+            if lo <= hi:
+                x_left, x_right = min(x_left, lo), max(x_right, hi)
+        _append_span(result, y, x_left, x_right, region)
+
+
+def draw_stroke(p_list, width, is_closed=False, region=None):
+    """绘制粗线：折线的每一段加粗为胶囊形后逐行扫描转换，相邻两段在顶点处自然形成圆角连接，两端为圆头
+    直接生成填充的区段而不是逐点盖印画笔，计算量只与笔画覆盖的面积（行数）有关
+    :param p_list: (list of list of int: [(x0, y0), (x1, y1), ...]) 折线的顶点坐标列表（线段为两个端点，曲线为curve_points的采样点）
+    :param width: (int) 线宽（像素），水平或竖直的线段恰好覆盖width行或列
+    :param is_closed: (bool) 是否闭合（多边形）
+    :param region: (list of int: [x_min, y_min, x_max, y_max]) 裁剪区域，只生成区域内的区段
+    :return: (list of list of int: [(y, x_start, x_end), ...]) 区段列表，见merge_spans
+    """
+    points = [p for i, p in enumerate(p_list) if i == 0 or p != p_list[i - 1]]  # 去掉连续重复的点
+    if is_closed and len(points) > 2:
+        points.append(points[0])
+    r = width / 2
+    result = []
+    if len(points) == 1:
+        _capsule_spans(points[0], points[0], r, region, result)
+    for i in range(len(points) - 1):
+        _capsule_spans(points[i], points[i + 1], r, region, result)
+    return merge_spans(result)
+
+
+def draw_thick_ellipse(p_list, width, region=None):
+    """绘制粗椭圆：取与原椭圆同心、半轴分别加减width / 2的两个椭圆之间的环，逐行扫描转换（每行至多两个区段）
+    :param p_list: (list of list of int: [(x0, y0), (x1, y1)]) 椭圆的矩形包围框左上角和右下角顶点坐标
+    :param width: (int) 线宽（像素）
+    :param region: (list of int: [x_min, y_min, x_max, y_max]) 裁剪区域，只生成区域内的区段
+    :return: (list of list of int: [(y, x_start, x_end), ...]) 区段列表，见merge_spans
+    """
+    (x0, y0), (x1, y1) = p_list
+    xc, yc = (x0 + x1) / 2, (y0 + y1) / 2
+    r = width / 2
+    a_out, b_out = abs(x1 - x0) / 2 + r, abs(y1 - y0) / 2 + r  # 外椭圆的半轴
+    a_in, b_in = abs(x1 - x0) / 2 - r, abs(y1 - y0) / 2 - r  # 内椭圆的半轴，不为正时没有内孔
+    result = []
+    for y in _clamp_rows(yc - b_out, yc + b_out, region):
+        t = y - yc
+        x_out = a_out * math.sqrt(max(1 - t * t / (b_out * b_out), 0))
+        if a_in > 0 and b_in > 0 and abs(t) < b_in:
+            x_in = a_in * math.sqrt(1 - t * t / (b_in * b_in))
+            _append_span(result, y, xc - x_out, xc - x_in, region)
+            _append_span(result, y, xc + x_in, xc + x_out, region)
+        else:
+            _append_span(result, y, xc - x_out, xc + x_out, region)
+    return merge_spans(result)
+
+
 def translate(p_list, dx, dy):
     """平移变换
     :param p_list: (list of list of int: [(x0, y0), (x1, y1), (x2, y2), ...]) 图元参数
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 批量图元变换：将多个图元的参数拼接为一个数组，一次完成变换
+# 计算方式与cg_algorithms中对应的单图元变换逐点一致
+# 以及区段（光栅化结果的行程编码，见cg_algorithms.to_spans）的批量转换和写入
+import math
+import bisect
+import numpy as np
+
+SLICE_MIN = 16
+""" 写入区段时，长度不小于此值的区段逐个切片赋值，更短的展开成像素点一次写入 """
+
+
+def pack(p_lists):
+    """将多个图元参数拼接为一个点数组
+    :param p_lists: (list of list of list of int) 多个图元的参数
+    :return: (ndarray [N, 2], list of int) 拼接后的点数组，以及每个图元的点数
+    """
+    counts = [len(p_list) for p_list in p_lists]
+    if sum(counts) == 0:
+        return np.zeros([0, 2], np.int64), counts
+    points = np.array([p for p_list in p_lists for p in p_list], np.int64).reshape(-1, 2)
+    return points, counts
+
+
+def unpack(points, counts):
+    """将点数组按图元拆分为图元参数
+    :param points: (ndarray [N, 2]) 点数组
+    :param counts: (list of int) 每个图元的点数
+    :return: (list of list of list of int) 多个图元的参数
+    """
+    flat = list(map(tuple, points.tolist()))
+    p_lists = []
+    start = 0
+    for n in counts:
+        p_lists.append(flat[start:start + n])
+        start += n
+    return p_lists
+
+
+def translate(p_lists, dx, dy):
+    """批量平移变换
+    :param p_lists: (list of list of list of int) 多个图元的参数
+    :param dx: (int) 水平方向平移量
+    :param dy: (int) 垂直方向平移量
+    :return: (list of list of list of int) 变换后的图元参数
+    """
+    points, counts = pack(p_lists)
+    points += np.array([dx, dy], np.int64)
+    return unpack(points, counts)
+
+
+def rotate(p_lists, x, y, r):
+    """批量旋转变换（除椭圆外）
+    :param p_lists: (list of list of list of int) 多个图元的参数
+    :param x: (int) 旋转中心x坐标
+    :param y: (int) 旋转中心y坐标
+    :param r: (int) 顺时针旋转角度（°）
+    :return: (list of list of list of int) 变换后的图元参数
+    """
+    points, counts = pack(p_lists)
+    angle = math.pi * r / 180
+    cos, sin = math.cos(angle), math.sin(angle)
+    x0, y0 = points[:, 0], points[:, 1]
+    x1 = cos * (x0 - x) - sin * (y0 - y) + x
+    y1 = cos * (y0 - y) + sin * (x0 - x) + y
+    points = np.stack([np.rint(x1), np.rint(y1)], axis=1).astype(np.int64)
+    return unpack(points, counts)
+
+
+def scale(p_lists, x, y, s):
+    """批量缩放变换
+    :param p_lists: (list of list of list of int) 多个图元的参数
+    :param x: (int) 缩放中心x坐标
+    :param y: (int) 缩放中心y坐标
+    :param s: (float) 缩放倍数
+    :return: (list of list of list of int) 变换后的图元参数
+    """
+    points, counts = pack(p_lists)
+    center = np.array([x, y], np.int64)
+    points = np.rint(center + s * (points - center)).astype(np.int64)
+    return unpack(points, counts)
+
+
+def clip(p_lists, x_min, y_min, x_max, y_max, algorithm):
+    """批量线段裁剪
+    :param p_lists: (list of list of list of int: [[(x0, y0), (x1, y1)], ...]) 多条线段的起点和终点坐标
+    :param x_min: 裁剪窗口左上角x坐标
+    :param y_min: 裁剪窗口左上角y坐标
+    :param x_max: 裁剪窗口右下角x坐标
+    :param y_max: 裁剪窗口右下角y坐标
+    :param algorithm: (string) 使用的裁剪算法，包括'Cohen-Sutherland'和'Liang-Barsky'
+    :return: (list of list of list of int) 裁剪后各线段的起点和终点坐标，完全在窗口外的线段为[]
+    """
+    if x_min > x_max:  # 保证x_min < x_max
+        x_min, x_max = x_max, x_min
+    if y_min > y_max:  # 保证y_min < y_max
+        y_min, y_max = y_max, y_min
+    result = [[] for _ in p_lists]
+    index = [i for i in range(len(p_lists)) if len(p_lists[i]) == 2]  # 已被裁没的线段不再处理
+    if len(index) == 0:
+        return result
+    lines = np.array([p_lists[i] for i in index], np.float64).reshape(-1, 4)
+    x1, y1, x2, y2 = lines[:, 0].copy(), lines[:, 1].copy(), lines[:, 2].copy(), lines[:, 3].copy()
+    if algorithm == 'Cohen-Sutherland':
+        x1, y1, x2, y2, keep = _clip_cohen_sutherland(x1, y1, x2, y2, x_min, y_min, x_max, y_max)
+    elif algorithm == 'Liang-Barsky':
+        x1, y1, x2, y2, keep = _clip_liang_barsky(x1, y1, x2, y2, x_min, y_min, x_max, y_max)
+    else:
+        return [list(p_list) for p_list in p_lists]
+    clipped = np.stack([x1, y1, x2, y2], axis=1).astype(np.int64).tolist()
+    for k, i in enumerate(index):
+        if keep[k]:
+            x3, y3, x4, y4 = clipped[k]
+            result[i] = [(x3, y3), (x4, y4)]
+    return result
+
+
+def _outcode(x, y, x_min, y_min, x_max, y_max):
+    """ Cohen-Sutherland区域码：左0b0001，右0b0010，下0b0100，上0b1000 """
+    code = np.zeros(x.shape, np.int64)
+    code |= np.where(x < x_min, 0b0001, 0)
+    code |= np.where(x > x_max, 0b0010, 0)
+    code |= np.where(y < y_min, 0b0100, 0)
+    code |= np.where(y > y_max, 0b1000, 0)
+    return code
+
+
+def _clip_cohen_sutherland(x1, y1, x2, y2, x_min, y_min, x_max, y_max):
+    """ 对所有未决线段同时执行一轮Cohen-Sutherland裁剪，直到全部线段被接受或舍弃 """
+    keep = np.zeros(x1.shape, bool)
+    active = np.ones(x1.shape, bool)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        while active.any():
+            p1 = _outcode(x1, y1, x_min, y_min, x_max, y_max)
+            p2 = _outcode(x2, y2, x_min, y_min, x_max, y_max)
+            inside = active & ((p1 | p2) == 0)  # 完全在区域内
+            outside = active & ((p1 & p2) != 0)  # 完全在区域外
+            keep |= inside
+            active &= ~(inside | outside)
+            p = p1 | p2  # 为1的位表示与该位对应的边界相交
+            # 左 -> 右
+            m = active & (x1 != x2)
+            swap = m & (x1 > x2)  # 保证x1<x2
+            x1, y1, x2, y2 = np.where(swap, x2, x1), np.where(swap, y2, y1), np.where(swap, x1, x2), np.where(swap, y1, y2)
+            left = m & (p & 0b0001 > 0)
+            y_left = np.rint((y1 - y2) * (x_min - x1) / (x1 - x2) + y1)
+            x1, y1 = np.where(left, x_min, x1), np.where(left, y_left, y1)
+            right = m & (x1 != x2) & (p & 0b0010 > 0)
+            y_right = np.rint((y1 - y2) * (x_max - x1) / (x1 - x2) + y1)
+            x2, y2 = np.where(right, x_max, x2), np.where(right, y_right, y2)
+            # 下 -> 上
+            m = active & (y1 != y2)
+            swap = m & (y1 > y2)  # 保证y1<y2
+            x1, y1, x2, y2 = np.where(swap, x2, x1), np.where(swap, y2, y1), np.where(swap, x1, x2), np.where(swap, y1, y2)
+            bottom = m & (p & 0b0100 > 0)
+            x_bottom = np.rint((x1 - x2) * (y_min - y1) / (y1 - y2) + x1)
+            x1, y1 = np.where(bottom, x_bottom, x1), np.where(bottom, y_min, y1)
+            top = m & (y1 != y2) & (p & 0b1000 > 0)
+            x_top = np.rint((x1 - x2) * (y_max - y1) / (y1 - y2) + x1)
+            x2, y2 = np.where(top, x_top, x2), np.where(top, y_max, y2)
+    return x1, y1, x2, y2, keep
+
+
+def _clip_liang_barsky(x1, y1, x2, y2, x_min, y_min, x_max, y_max):
+    """ 对所有线段同时执行Liang-Barsky裁剪 """
+    dx, dy = x2 - x1, y2 - y1
+    p = [-dx, dx, -dy, dy]                                  # 左、右、下、上
+    q = [x1 - x_min, x_max - x1, y1 - y_min, y_max - y1]
+    u1 = np.zeros(x1.shape)
+    u2 = np.ones(x1.shape)
+    keep = np.ones(x1.shape, bool)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(4):
+            keep &= ~((p[i] == 0) & (q[i] < 0))  # 与坐标轴平行且在边界外，舍弃
+            u = q[i] / p[i]
+            u1 = np.where(p[i] < 0, np.maximum(u1, u), u1)  # 是入边交点，取最大值
+            u2 = np.where(p[i] > 0, np.minimum(u2, u), u2)  # 是出边交点，取最小值
+    keep &= u1 <= u2
+    return np.rint(x1 + u1 * dx), np.rint(y1 + u1 * dy), np.rint(x1 + u2 * dx), np.rint(y1 + u2 * dy), keep
+
+
+def to_spans(pixels):
+    """将像素点转化为区段，结果与cg_algorithms.to_spans相同
+    :param pixels: (ndarray [N, 2]) 像素点坐标，可以无序、重复
+    :return: (ndarray [M, 3]) 区段，每行为(y, x_start, x_end)，按(y, x_start)排序
+    """
+    if len(pixels) == 0:
+        return np.zeros([0, 3], np.int64)
+    x, y = pixels[:, 0], pixels[:, 1]
+    order = np.lexsort((x, y))  # 按(y, x)排序
+    x, y = x[order], y[order]
+    keep = np.ones(len(x), bool)
+    keep[1:] = (y[1:] != y[:-1]) | (x[1:] != x[:-1])  # 去重
+    x, y = x[keep], y[keep]
+    is_start = np.ones(len(x), bool)
+    is_start[1:] = (y[1:] != y[:-1]) | (x[1:] != x[:-1] + 1)
+    starts = np.flatnonzero(is_start)
+    ends = np.append(starts[1:], len(x)) - 1
+    return np.stack([y[starts], x[starts], x[ends]], axis=1)
+
+
+def draw_spans(canvas, spans, color):
+    """将区段写入画布，不绘制出界部分。长区段逐个切片赋值；
+    短区段（如陡峭线段的每一行）逐个赋值的开销太大，展开成像素点后一次写入
+    :param canvas: (ndarray [h, w, 3]) 画布
+    :param spans: (ndarray [M, 3]) 区段，每行为(y, x_start, x_end)
+    :param color: (r, g, b) 颜色
+    """
+    h, w = canvas.shape[:2]
+    y, x_start, x_end = spans[:, 0], np.maximum(spans[:, 1], 0), np.minimum(spans[:, 2], w - 1)
+    inside = (0 <= y) & (y < h) & (x_start <= x_end)
+    y, x_start, x_end = y[inside], x_start[inside], x_end[inside]
+    length = x_end - x_start + 1
+    is_long = length >= SLICE_MIN
+    for row, x0, x1 in zip(y[is_long].tolist(), x_start[is_long].tolist(), x_end[is_long].tolist()):
+        canvas[row, x0:x1 + 1] = color
+    y, x_start, length = y[~is_long], x_start[~is_long], length[~is_long]
+    offset = np.arange(length.sum()) - np.repeat(np.cumsum(length) - length, length)  # 每个像素点在所属区段中的位置
+    canvas[np.repeat(y, length), np.repeat(x_start, length) + offset] = color
+
+
+def expand_spans(spans):
+    """将区段展开为像素点
+    :param spans: (ndarray [M, 3]) 区段，每行为(y, x_start, x_end)
+    :return: (ndarray [N, 2]) 像素点坐标，按区段顺序逐行从左到右
+    """
+    y, x_start, length = spans[:, 0], spans[:, 1], spans[:, 2] - spans[:, 1] + 1
+    offset = np.arange(length.sum()) - np.repeat(np.cumsum(length) - length, length)
+    return np.stack([np.repeat(x_start, length) + offset, np.repeat(y, length)], axis=1)
+
+
+def draw_pixels(canvas, pixels, color):
+    """将像素点写入画布，不绘制出界部分。平均每行的像素点足够多时先转化为区段再写入，否则直接写入
+    :param canvas: (ndarray [h, w, 3]) 画布
+    :param pixels: (ndarray [N, 2]) 像素点坐标
+    :param color: (r, g, b) 颜色
+    """
+    if len(pixels) == 0:
+        return
+    x, y = pixels[:, 0], pixels[:, 1]
+    if len(pixels) >= SLICE_MIN * (y.max() - y.min() + 1):
+        draw_spans(canvas, to_spans(pixels), color)
+        return
+    h, w = canvas.shape[:2]
+    inside = (0 <= x) & (x < w) & (0 <= y) & (y < h)
+    canvas[y[inside], x[inside]] = color
+
+
+def _row_runs(canvas_row, target):
+    """一行中与target颜色相同的各段：[starts, ends, filled]，分别为每段的起点、终点（含）和是否已经填充"""
+    mask = np.zeros(len(canvas_row) + 2, bool)  # 两端各补一个不可填充的像素
+    if canvas_row.ndim == 1:  # 索引画布
+        mask[1:-1] = canvas_row == target
+    else:
+        mask[1:-1] = (canvas_row[:, 0] == target[0]) & (canvas_row[:, 1] == target[1]) & (canvas_row[:, 2] == target[2])
+    edges = np.flatnonzero(mask[1:] != mask[:-1])
+    starts, ends = edges[0::2].tolist(), (edges[1::2] - 1).tolist()
+    return starts, ends, [False] * len(starts)
+
+
+def fill(canvas, x, y, color):
+    """以(x, y)为种子点，将与之颜色相同且四连通的区域填充为color（扫描线种子填充）。
+    栈中保存的是待填充的整段像素而不是单个像素，每行的各段由NumPy一次求出，且只在扫描到该行时计算；
+    填充的区段最后一次写入画布
+    :param canvas: (ndarray [h, w, 3]) 画布，也可以是索引画布(ndarray [h, w])
+    :param x: (int) 种子点x坐标
+    :param y: (int) 种子点y坐标
+    :param color: (r, g, b) 填充颜色，索引画布为(int) 调色板序号
+    :return: (ndarray [M, 3]) 填充的区段，每行为(y, x_start, x_end)，按(y, x_start)排序
+    """
+    h, w = canvas.shape[:2]
+    if not (0 <= x < w and 0 <= y < h) or (canvas[y, x] == np.array(color)).all():
+        return np.zeros([0, 3], np.int64)
+    target = canvas[y, x].copy()
+    rows = {y: _row_runs(canvas[y], target)}  # 已扫描的行：{y: _row_runs}
+    stack = [(y, bisect.bisect_right(rows[y][0], x) - 1)]  # 待填充的段：(y, 该行中的段号)
+    result = []
+    while len(stack) > 0:
+        y, i = stack.pop()
+        starts, ends, filled = rows[y]
+        if filled[i]:
+            continue
+        filled[i] = True
+        x_start, x_end = starts[i], ends[i]
+        result.append((y, x_start, x_end))
+        for ny in (y - 1, y + 1):  # 上下两行中与该段相接的段
+            if 0 <= ny < h:
+                if ny not in rows:
+                    rows[ny] = _row_runs(canvas[ny], target)
+                n_starts, n_ends, n_filled = rows[ny]
+                for j in range(bisect.bisect_left(n_ends, x_start), bisect.bisect_right(n_starts, x_end)):
+                    if not n_filled[j]:
+                        stack.append((ny, j))
+    result.sort()
+    spans = np.array(result, np.int64).reshape(-1, 3)
+    draw_spans(canvas, spans, color)
+    return spans
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# cg_cli的端到端扩展性测试：用cg_workload生成规模递增的场景，每个规模在独立的子进程中完整执行一次，
+# 报告吞吐量（指令/秒、保存的像素/秒）、子进程的峰值内存及各阶段耗时，便于在不同版本之间比较扩展曲线
+# 用法：python cg_bench.py [--scales 1000,2000,4000,8000] [--json results.json] [cg_workload的选项（--items除外）]
+#   --scales为各次测试的图元数；--json把本次结果追加到results.json（JSON列表，每次运行一项）
+import sys
+import os
+import json
+import time
+import subprocess
+import tempfile
+from cg_input import open_binary
+from cg_workload import generate, write, option, workload_options
+
+PHASES = {
+    'draw': ('drawLine', 'drawPolygon', 'drawEllipse', 'drawCurve', 'fill'),
+    'transform': ('translate', 'rotate', 'scale', 'clip', 'delete'),
+    'history': ('undo', 'redo'),
+    'render': ('saveCanvas', 'renderFrames'),
+}
+""" 各阶段包括的指令；render为合成画布的时间，不含编码保存位图（encode）；其余指令计入other """
+
+
+def run_child(input_file, output_dir):
+    """ 子进程：执行指令文件，统计各阶段耗时，以一行JSON写到标准输出 """
+    start = time.perf_counter()
+    import cg_cli
+    times = dict.fromkeys(list(PHASES) + ['other', 'encode'], 0.0)
+    times['import'] = time.perf_counter() - start
+    save_image = cg_cli.save_image
+
+    def timed_save_image(*args):
+        t = time.perf_counter()
+        save_image(*args)
+        times['encode'] += time.perf_counter() - t
+    cg_cli.save_image = timed_save_image  # Session.execute调用模块中的save_image
+
+    phase_of = {command: phase for phase, commands in PHASES.items() for command in commands}
+    session = cg_cli.Session(output_dir)
+    with open_binary(input_file) as fp:
+        for line in fp:
+            line = line.decode('utf-8')
+            t = time.perf_counter()
+            session.execute(line)
+            times[phase_of.get(line.split(' ', 1)[0].strip(), 'other')] += time.perf_counter() - t
+    session.close()
+    times['render'] -= times['encode']
+    times['total'] = time.perf_counter() - start
+    print(json.dumps(times))
+
+
+def run_scale(params, work_dir):
+    """ 生成一个规模的场景并在子进程中执行
+    :return: (dict) 指令数、保存的像素数、耗时、峰值内存(MB)及各阶段耗时
+    """
+    input_file = os.path.join(work_dir, 'workload_%d.txt' % params['items'])
+    commands = write(input_file, generate(**params))
+    output_dir = os.path.join(work_dir, 'outputs_%d' % params['items'])
+    saves = params['items'] // params['save_every'] + 1 if params['save_every'] > 0 else 1
+    start = time.perf_counter()
+    child = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--child', input_file, output_dir],
+                             stdout=subprocess.PIPE)
+    output = child.stdout.read()
+    _, status, usage = os.wait4(child.pid, 0)  # 只取该子进程的资源使用
+    wall = time.perf_counter() - start
+    child.returncode = os.waitstatus_to_exitcode(status)
+    if child.returncode != 0:
+        raise RuntimeError('cg_cli failed on %d items (exit code %d)' % (params['items'], child.returncode))
+    phases = json.loads(output)
+    return {'items': params['items'], 'commands': commands, 'pixels': saves * params['width'] * params['height'],
+            'wall': wall, 'startup': wall - phases.pop('total'), 'peak_rss_mb': usage.ru_maxrss / 1024, 'phases': phases}
+
+
+def report(results):
+    """ 打印各规模的吞吐量、峰值内存和各阶段耗时（秒） """
+    names = ['import'] + list(PHASES) + ['encode', 'other']
+    print('%8s %9s %8s %10s %9s %8s ' % ('items', 'commands', 'wall(s)', 'cmds/s', 'Mpix/s', 'RSS(MB)') +
+          ' '.join('%9s' % name for name in ['startup'] + names))
+    for r in results:
+        print('%8d %9d %8.2f %10.0f %9.2f %8.1f ' % (r['items'], r['commands'], r['wall'], r['commands'] / r['wall'],
+                                                      r['pixels'] / r['wall'] / 1e6, r['peak_rss_mb']) +
+              ' '.join('%9.3f' % t for t in [r['startup']] + [r['phases'][name] for name in names]))
+
+
+def revision():
+    """ 当前代码的git版本，不在git仓库中时为None """
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    if '--child' in sys.argv:
+        i = sys.argv.index('--child')
+        run_child(sys.argv[i + 1], sys.argv[i + 2])
+        sys.exit(0)
+    params = workload_options(sys.argv)
+    scales = [int(s) for s in option(sys.argv, 'scales', '1000,2000,4000,8000').split(',')]
+    results = []
+    with tempfile.TemporaryDirectory(prefix='cg_bench_') as work_dir:
+        for items in scales:
+            results.append(run_scale(dict(params, items=items), work_dir))
+    report(results)
+    json_file = option(sys.argv, 'json', '')
+    if json_file != '':
+        history = []
+        if os.path.exists(json_file):
+            with open(json_file) as fp:
+                history = json.load(fp)
+        history.append({'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'revision': revision(),
+                        'params': dict(params, items=None), 'results': results})
+        with open(json_file, 'w') as fp:
+            json.dump(history, fp, indent=1)
@@ -3,121 +3,605 @@
 
 import sys
 import os
+import math
+import time
+import pickle
+import bisect
+import fnmatch
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import cg_algorithms as alg
+import cg_batch as batch
+from cg_history import History, restore_order
+from cg_input import open_binary, skip_input
+from cg_delta import STREAM_NAME, KEYFRAME_INTERVAL, DeltaWriter
 import numpy as np
 from PIL import Image
 
 
+CHECKPOINT_NAME = '.cg_cli.checkpoint'
+""" 检查点文件名（在输出目录下） """
+
+CHECKPOINT_INTERVAL = 60
+""" 默认每隔多少秒保存一次检查点 """
+
+CHECKPOINT_FIELDS = ('item_dict', 'group_dict', 'palette', 'palette_index', 'pen_color', 'pen_width', 'indexed',
+                     'output_mode', 'keyframe_interval', 'delta_size', 'tracks', 'history', 'width', 'height', 'saved')
+""" 检查点中保存的会话状态（Session的属性） """
+
+
+def select_items(item_dict, group_dict, selector, visited=None):
+    """ 解析图元选择器，返回匹配的图元id列表（按出现顺序去重）
+    :param selector: (string) 单个id、逗号分隔的id列表（如 line1,line2）、通配符（如 line*）或图元组（如 @layer1）
+    :param visited: (set) 已展开的图元组，组之间循环引用时每个组只展开一次
+    """
+    if visited is None:
+        visited = set()
+    result = []
+    for token in selector.split(','):
+        if token.startswith('@'):  # 图元组，组成员本身也是选择器
+            if token in visited:
+                continue
+            visited.add(token)
+            for member in group_dict.get(token[1:], []):
+                result += select_items(item_dict, group_dict, member, visited)
+        elif any(c in token for c in '*?['):  # 通配符
+            result += fnmatch.filter(item_dict.keys(), token)
+        elif token in item_dict:
+            result.append(token)
+    return list(dict.fromkeys(result))
+
+
+def get_state(item):
+    """ 图元的不可变状态，用于撤销/重做（点坐标元组与图元共享） """
+    if item is None:
+        return None
+    item_type, p_list, algorithm, color, pen_width = item
+    return item_type, tuple(p_list), algorithm, color, pen_width
+
+
+def record_changes(history, item_dict, item_ids, befores, positions=None):
+    """ 将item_ids中图元从befores到当前状态的变化记录为一步，positions见History.record """
+    history.record([(item_id, before, get_state(item_dict.get(item_id))) for item_id, before in zip(item_ids, befores)],
+                   positions)
+
+
+def get_positions(item_dict, item_ids):
+    """ item_ids中图元在图元序列（绘制顺序）中的位置：{item_id: index} """
+    item_ids = set(item_ids)
+    return {item_id: i for i, item_id in enumerate(item_dict) if item_id in item_ids}
+
+
+def apply_history(item_dict, action):
+    """ 执行History.undo/redo返回的操作 """
+    if action is None:
+        return
+    if action[0] == 'translate':
+        _, item_ids, dx, dy = action
+        p_lists = batch.translate([item_dict[i][1] for i in item_ids], dx, dy)
+        for item_id, p_list in zip(item_ids, p_lists):
+            item_dict[item_id][1] = p_list
+    else:
+        _, states, positions = action
+        for item_id, state in states.items():
+            if state is None:
+                item_dict.pop(item_id, None)
+            else:
+                item_type, p_list, algorithm, color, pen_width = state
+                item_dict[item_id] = [item_type, list(p_list), algorithm, color, pen_width]
+        if len(positions) > 0:  # 撤销删除：恢复的图元移回原来的位置，保持绘制顺序
+            items = {item_id: item_dict[item_id] for item_id in restore_order(list(item_dict), positions)}
+            item_dict.clear()
+            item_dict.update(items)
+
+
+def rasterize(item_type, p_list, algorithm, width, height, pen_width=1):
+    """ 将图元转化为画布内的区段：包围盒完全在画布外的图元直接跳过；
+    线段、多边形和曲线部分在画布外时先裁剪到画布再光栅化，计算量只与画布内的部分有关
+    :param pen_width: (int) 线宽，大于1时按粗线扫描转换（见cg_algorithms.draw_stroke），线段不再区分DDA和Bresenham
+    :return: (list of list of int: [(y, x_start, x_end), ...]) 画布内的区段列表，见cg_algorithms.to_spans
+    """
+    if len(p_list) == 0:
+        return []
+    xs, ys = zip(*p_list)
+    # 曲线在控制点的凸包内；椭圆的中点算法可能超出包围框一个像素
+    margin = 1 if item_type == 'ellipse' else 0
+    if pen_width > 1:  # 粗线超出中心线半个线宽
+        margin = math.ceil(pen_width / 2)
+    x_min, y_min, x_max, y_max = min(xs) - margin, min(ys) - margin, max(xs) + margin, max(ys) + margin
+    if x_max < 0 or y_max < 0 or x_min >= width or y_min >= height:  # 完全在画布外
+        return []
+    region = None
+    if x_min < 0 or y_min < 0 or x_max >= width or y_max >= height:  # 部分在画布外
+        region = [0, 0, width - 1, height - 1]
+    spans = []
+    if pen_width > 1:
+        if item_type == 'ellipse':
+            spans = alg.draw_thick_ellipse(p_list, pen_width, region)
+        elif item_type == 'curve':
+            spans = alg.draw_stroke(alg.curve_points(p_list, algorithm), pen_width, False, region)
+        else:
+            spans = alg.draw_stroke(p_list, pen_width, item_type == 'polygon', region)
+    elif item_type == 'line':
+        spans = alg.draw_line(p_list, algorithm, region, spans=True)
+    elif item_type == 'polygon':
+        spans = alg.draw_polygon(p_list, algorithm, True, region, spans=True)
+    elif item_type == 'ellipse':
+        spans = alg.draw_ellipse(p_list, spans=True)
+        if region is not None:  # 椭圆不裁剪，只截掉画布外的部分
+            spans = [(y, max(x_start, 0), min(x_end, width - 1)) for y, x_start, x_end in spans
+                     if 0 <= y < height and x_start < width and x_end >= 0]
+    elif item_type == 'curve':
+        spans = alg.draw_curve(p_list, algorithm, region=region, spans=True)
+    return spans
+
+
+def draw_item(canvas, item_type, p_list, algorithm, color, pen_width=1):
+    """ 将一个图元画到画布上
+    :param color: 画布上的颜色，索引画布为位图调色板中的序号
+    :param pen_width: (int) 线宽，见rasterize
+    """
+    if item_type == 'fill':  # 填充：在已绘制的画布上从种子点填充
+        batch.fill(canvas, p_list[0][0], p_list[0][1], color)
+    else:  # 绘制：将图元转化为区段（只包括画布内的部分），每个区段一次写入一行中连续的像素
+        spans = rasterize(item_type, p_list, algorithm, canvas.shape[1], canvas.shape[0], pen_width)
+        batch.draw_spans(canvas, np.array(spans, np.int64).reshape(-1, 3), color)
+
+
+def save_image(canvas, palette, path):
+    """ 保存画布为位图，索引画布保存为8位索引位图
+    :param palette: (list of (r, g, b)) 索引画布的位图调色板，24位画布忽略
+    """
+    image = Image.fromarray(canvas)
+    if canvas.ndim == 2:  # 灰度图加上调色板即为索引图
+        image.putpalette([c for color in palette for c in color])
+    image.save(path + '.tmp', 'bmp')  # 先写临时文件再替换，中途被杀死时不会留下不完整的位图（见Session.resumed）
+    os.replace(path + '.tmp', path)
+
+
+def interpolate(keyframes, frame):
+    """ 在关键帧之间线性插值
+    :param keyframes: (list of (int, tuple of float)) 按帧号排序的关键帧[(frame, values), ...]
+    :return: (tuple of float) 第frame帧的值，第一个关键帧之前和最后一个关键帧之后保持不变
+    """
+    i = bisect.bisect_right([f for f, values in keyframes], frame)
+    if i == 0:
+        return keyframes[0][1]
+    if i == len(keyframes):
+        return keyframes[-1][1]
+    (f0, v0), (f1, v1) = keyframes[i - 1], keyframes[i]
+    t = (frame - f0) / (f1 - f0)
+    return tuple(a + (b - a) * t for a, b in zip(v0, v1))
+
+
+def animate(item_type, p_list, tracks, frame):
+    """ 图元在第frame帧的参数：在原参数上依次施加缩放、旋转（忽略椭圆）、平移
+    :param tracks: (dict) 图元的变换轨迹：{'translate'|'rotate'|'scale': keyframes}，keyframes见interpolate
+    """
+    p_list = list(p_list)
+    if 'scale' in tracks:
+        x, y, s = interpolate(tracks['scale'], frame)
+        p_list = alg.scale(p_list, round(x), round(y), s)
+    if 'rotate' in tracks and item_type != 'ellipse':
+        x, y, r = interpolate(tracks['rotate'], frame)
+        p_list = alg.rotate(p_list, round(x), round(y), r)
+    if 'translate' in tracks:
+        dx, dy = interpolate(tracks['translate'], frame)
+        p_list = alg.translate(p_list, round(dx), round(dy))
+    return p_list
+
+
+def render_frame(job, frame):
+    """ 渲染并保存动画的一帧，见Session.render_frames
+    :param job: (background, layers, palette, path_format) 背景画布、背景之上的各图元、位图调色板、保存路径的格式
+    :return: (string) 保存路径
+    """
+    background, layers, palette, path_format = job
+    canvas = background.copy()
+    for layer in layers:
+        if layer[0] == 'spans':  # 静止图元：直接写入光栅化好的区段
+            _, spans, color = layer
+            batch.draw_spans(canvas, spans, color)
+        else:
+            _, item_type, p_list, algorithm, color, pen_width, tracks = layer
+            draw_item(canvas, item_type, animate(item_type, p_list, tracks, frame), algorithm, color, pen_width)
+    path = path_format % frame
+    save_image(canvas, palette, path)
+    return path
+
+
+_frame_job = None
+""" 工作进程中待渲染的动画（由_init_frame_worker设置），只需在进程启动时传递一次 """
+
+
+def _init_frame_worker(job):
+    global _frame_job
+    _frame_job = job
+
+
+def _render_frame_in_worker(frame):
+    return render_frame(_frame_job, frame)
+
+
+class Session:
+    """
+    一个绘图会话：保存画布状态，逐条执行绘图指令。
+    命令行直接运行时只有一个会话；cg_server中每个客户端连接各有一个会话，互不影响
+    """
+    def __init__(self, output_dir):
+        """
+        :param output_dir: saveCanvas保存位图的目录
+        """
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+
+        self.item_dict = {}
+        """ 当前画布上的图元：{item_id: [item_type, p_list, algorithm, color, pen_width], ...}，color为颜色在调色板中的序号 """
+
+        self.group_dict = {}
+        """ 已定义的图元组：{group_name: [selector, ...], ...} """
+
+        self.palette = [(255, 255, 255), (0, 0, 0)]
+        """ 调色板：setColor用过的所有颜色(r, g, b)，0号为背景白色，1号为默认的画笔颜色黑色；只增不减，历史中的序号始终有效 """
+        self.palette_index = {color: i for i, color in enumerate(self.palette)}
+        """ 颜色在调色板中的序号：{(r, g, b): index} """
+
+        self.pen_color = 1
+        """ 当前画笔颜色（调色板序号） """
+        self.pen_width = 1
+        """ 当前线宽（像素） """
+
+        self.indexed = False
+        """ saveCanvas是否保存为8位索引位图（画布上的颜色超过256种时自动改为24位位图），默认为24位位图，可用setOutputMode修改 """
+
+        self.output_mode = 'bmp'
+        """ saveCanvas的输出方式：'bmp'每次保存完整的位图，'delta'追加到输出目录下的帧流（见cg_delta），可用setOutputMode修改 """
+        self.keyframe_interval = KEYFRAME_INTERVAL
+        """ 帧流的关键帧间隔（帧数） """
+        self.delta_size = 0
+        """ 帧流中已写入的字节数，从检查点恢复时丢弃之后（中断前）写入的内容 """
+        self.delta_writer = None
+        """ 帧流的写入端（DeltaWriter），以delta方式保存时打开，改为bmp方式或会话结束时关闭（见close） """
+
+        self.tracks = {}
+        """ 图元的变换轨迹（关键帧）：{item_id: {'translate'|'rotate'|'scale': keyframes}, ...}，keyframes见interpolate """
+
+        self.history = History()
+        """ 撤销/重做历史 """
+
+        self.saved = set()
+        """ 已执行过的saveCanvas的位图名 """
+        self.resumed = False
+        """ 是否在恢复中断的执行（见load_checkpoint）：为True时，本次执行中第一次保存、且检查点之前未保存过的位图已在磁盘上，
+        说明中断前已在检查点之后保存过，内容相同，跳过 """
+
+        self.width = 0
+        """ 画布尺寸（宽） """
+        self.height = 0
+        """ 画布尺寸（高） """
+
+    def new_canvas(self, stable=False):
+        """ 按当前图元用到的颜色新建空白画布：保存索引位图且颜色不超过256种时（含背景）为索引画布，每个像素只存1字节
+        :param stable: 是否使用整个调色板，画布上的序号即调色板序号，在各帧之间不变（用于帧流的差分帧）
+        :return: (canvas, colors, palette) 画布、调色板序号到画布上颜色的映射、索引画布的位图调色板（只包括用到的颜色）
+        """
+        if stable:
+            used = list(range(len(self.palette)))
+        else:
+            used = sorted({item[3] for item in self.item_dict.values()} | {0})
+        if self.indexed and len(used) <= 256:
+            canvas = np.zeros([self.height, self.width], np.uint8)
+            return canvas, {color: i for i, color in enumerate(used)}, [self.palette[color] for color in used]
+        canvas = np.zeros([self.height, self.width, 3], np.uint8)
+        canvas.fill(255)
+        return canvas, self.palette, []
+
+    def render_frames(self, name, first, last):
+        """ 渲染动画的第first到第last帧，第frame帧保存为name_frame.bmp（帧号至少4位）。
+        第一个有变换轨迹的图元之前的图元只合成一次作为背景；之后的静止图元只光栅化一次，每帧直接写入区段；
+        各帧由多个进程并行渲染和编码；工作进程以spawn方式启动，cg_server的多线程进程中fork可能复制其它线程持有的锁
+        """
+        canvas, colors, palette = self.new_canvas()
+        items = list(self.item_dict.items())
+        start = next((i for i, (item_id, item) in enumerate(items) if item_id in self.tracks), len(items))
+        for item_id, (item_type, p_list, algorithm, color, pen_width) in items[:start]:
+            draw_item(canvas, item_type, p_list, algorithm, colors[color], pen_width)
+        layers = []
+        for item_id, (item_type, p_list, algorithm, color, pen_width) in items[start:]:
+            tracks = self.tracks.get(item_id, {})
+            if len(tracks) == 0 and item_type != 'fill':  # 填充的结果取决于下面的图元，每帧重新计算
+                spans = rasterize(item_type, p_list, algorithm, self.width, self.height, pen_width)
+                layers.append(('spans', np.array(spans, np.int64).reshape(-1, 3), colors[color]))
+            else:
+                layers.append(('item', item_type, list(p_list), algorithm, colors[color], pen_width, tracks))
+        job = (canvas, layers, palette, os.path.join(self.output_dir, name + '_%04d.bmp'))
+        frames = range(first, last + 1)
+        workers = min(os.cpu_count() or 1, len(frames))
+        if workers <= 1:
+            for frame in frames:
+                render_frame(job, frame)
+        else:
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=_init_frame_worker, initargs=(job,)) as executor:
+                list(executor.map(_render_frame_in_worker, frames, chunksize=max(len(frames) // (workers * 4), 1)))
+
+    def save_checkpoint(self, path, offset):
+        """ 保存检查点：会话状态及已执行到的输入位置。先写临时文件再替换，保存时被杀死不会破坏上一个检查点
+        :param offset: (int) 已执行的指令在输入中的字节数（解压后）
+        """
+        state = {name: getattr(self, name) for name in CHECKPOINT_FIELDS}
+        with open(path + '.tmp', 'wb') as fp:
+            pickle.dump((offset, state), fp, pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    def load_checkpoint(self, path):
+        """ 从检查点恢复会话状态，之后的saveCanvas跳过中断前已保存的位图（见resumed）
+        :return: (int) 检查点的输入位置，检查点不存在时为0（从头执行）
+        """
+        self.resumed = True
+        if not os.path.exists(path):
+            return 0
+        with open(path, 'rb') as fp:
+            offset, state = pickle.load(fp)
+        for name, value in state.items():
+            setattr(self, name, value)
+        return offset
+
+    def run(self, fp, checkpoint_path=None, interval=CHECKPOINT_INTERVAL, offset=0):
+        """ 依次执行fp中的每一行指令
+        :param fp: 以二进制方式打开的指令输入，见cg_input.open_binary
+        :param checkpoint_path: (string) 检查点文件路径，每隔interval秒（在一行指令执行完之后）保存一次，全部执行完后删除；
+            为None时不保存检查点
+        :param offset: (int) fp当前位置在输入中的字节偏移（从检查点恢复时为检查点的输入位置）
+        """
+        last = time.monotonic()
+        try:
+            for line in fp:
+                offset += len(line)
+                self.execute(line.decode('utf-8'))
+                if checkpoint_path is not None and time.monotonic() - last >= interval:
+                    self.save_checkpoint(checkpoint_path, offset)
+                    last = time.monotonic()
+        finally:
+            self.close()
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+    def close(self):
+        """ 结束会话：关闭帧流（run结束时自动调用；逐条调用execute时由调用者调用） """
+        if self.delta_writer is not None:
+            self.delta_writer.close()
+            self.delta_writer = None
+
+    def execute(self, line):
+        """ 执行一行指令 """
+        line = line.strip().split(' ')
+        if line[0].startswith('#'):
+            """ # ...: 注释（cg_gui录制的界面事件也以#开头），忽略 """
+            pass
+        elif line[0] == 'resetCanvas':
+            """ resetCanvas width height: 清空当前画布，并重新设置宽高 """
+            self.width = int(line[1])
+            self.height = int(line[2])
+            self.history.record([(item_id, get_state(item), None) for item_id, item in self.item_dict.items()])
+            self.item_dict.clear()
+            self.tracks.clear()
+        elif line[0] == 'saveCanvas':
+            """ saveCanvas name: 仅在此步骤将图元对象转化为像素点，保存画布为位图name.bmp（恢复执行时可能跳过，见resumed），
+            或作为名为name的一帧追加到帧流（见setOutputMode） """
+            save_name = line[1]
+            path = os.path.join(self.output_dir, save_name + '.bmp')
+            skip = self.output_mode == 'bmp' and self.resumed and save_name not in self.saved and os.path.exists(path)
+            self.saved.add(save_name)
+            if not skip:
+                canvas, colors, palette = self.new_canvas(stable=self.output_mode == 'delta')
+                for item_type, p_list, algorithm, color, pen_width in self.item_dict.values():
+                    draw_item(canvas, item_type, p_list, algorithm, colors[color], pen_width)
+                if self.output_mode == 'delta':
+                    if self.delta_writer is None:
+                        self.delta_writer = DeltaWriter(os.path.join(self.output_dir, STREAM_NAME), self.delta_size,
+                                                        self.keyframe_interval)
+                    self.delta_writer.write(save_name, canvas, palette)
+                    self.delta_size = self.delta_writer.tell()
+                else:
+                    save_image(canvas, palette, path)
+        elif line[0] == 'setColor':
+            """ setColor R G B: 设置画笔颜色，新的颜色加入调色板 """
+            color = (int(line[1]), int(line[2]), int(line[3]))
+            if color not in self.palette_index:
+                self.palette_index[color] = len(self.palette)
+                self.palette.append(color)
+            self.pen_color = self.palette_index[color]
+        elif line[0] == 'setPenWidth':
+            """ setPenWidth w: 设置线宽（默认1），之后绘制的线段、多边形、椭圆和曲线按此宽度加粗（填充不受影响） """
+            self.pen_width = max(int(line[1]), 1)
+        elif line[0] == 'setOutputMode':
+            """ setOutputMode bmp|delta [rgb|indexed] [keyframe_interval]: saveCanvas保存完整的位图（默认），或追加到输出目录下的帧流frames.cgd：
+            每隔keyframe_interval帧（默认100）写一个完整的关键帧，其余帧只写与上一帧不同的像素；用cg_delta.py还原为位图。
+            rgb为24位位图（默认），indexed为8位索引位图（画布上的颜色不超过256种时），每像素只占1字节 """
+            self.output_mode = line[1]
+            self.indexed = 'indexed' in line[2:]
+            if self.output_mode != 'delta':  # 之后改回delta时从已写入的位置续写（见delta_size）
+                self.close()
+            for option in line[2:]:
+                if option != 'indexed' and option != 'rgb':
+                    self.keyframe_interval = int(option)
+                    if self.delta_writer is not None:
+                        self.delta_writer.keyframe_interval = self.keyframe_interval
+        elif line[0] == 'drawLine':
+            """ drawLine id x0 y0 x1 y1 algorithm: 绘制线段 """
+            item_id = line[1]
+            x0 = int(line[2])
+            y0 = int(line[3])
+            x1 = int(line[4])
+            y1 = int(line[5])
+            algorithm = line[6]
+            before = get_state(self.item_dict.get(item_id))
+            self.item_dict[item_id] = ['line', [(x0, y0), (x1, y1)], algorithm, self.pen_color, self.pen_width]
+            record_changes(self.history, self.item_dict, [item_id], [before])
+        elif line[0] == 'drawPolygon':
+            """ drawPolygon id x0 y0 x1 y1 x2 y2 ... algorithm: 绘制多边形 """
+            item_id = line[1]
+            points = []
+            n = len(line)
+            for i in range(2, n - 1, 2):
+                points.append((int(line[i]), int(line[i + 1])))
+            algorithm = line[n - 1]
+            before = get_state(self.item_dict.get(item_id))
+            self.item_dict[item_id] = ['polygon', points, algorithm, self.pen_color, self.pen_width]
+            record_changes(self.history, self.item_dict, [item_id], [before])
+        elif line[0] == 'drawEllipse':
+            """ drawEllipse id x0 y0 x1 y1: 绘制椭圆（中点圆生成算法） """
+            item_id = line[1]
+            x0 = int(line[2])
+            y0 = int(line[3])
+            x1 = int(line[4])
+            y1 = int(line[5])
+            before = get_state(self.item_dict.get(item_id))
+            self.item_dict[item_id] = ['ellipse', [(x0, y0), (x1, y1)], '', self.pen_color, self.pen_width]
+            record_changes(self.history, self.item_dict, [item_id], [before])
+        elif line[0] == 'drawCurve':
+            """ drawCurve id x0 y0 x1 y1 x2 y2 ... algorithm: 绘制曲线 """
+            item_id = line[1]
+            points = []
+            n = len(line)
+            for i in range(2, n - 1, 2):
+                points.append((int(line[i]), int(line[i + 1])))
+            algorithm = line[n - 1]
+            before = get_state(self.item_dict.get(item_id))
+            self.item_dict[item_id] = ['curve', points, algorithm, self.pen_color, self.pen_width]
+            record_changes(self.history, self.item_dict, [item_id], [before])
+        elif line[0] == 'fill':
+            """ fill [id] x y: 以(x, y)为种子点，将与之颜色相同且四连通的区域填充为画笔颜色（保存画布时按绘制顺序在已绘制的内容上填充，
+            之后可像其他图元一样被平移、删除或撤销）；省略id时自动命名为fill1、fill2... """
+            if len(line) > 3:
+                item_id = line[1]
+            else:
+                n = 1
+                while 'fill%d' % n in self.item_dict:
+                    n += 1
+                item_id = 'fill%d' % n
+            x = int(line[-2])
+            y = int(line[-1])
+            before = get_state(self.item_dict.get(item_id))
+            self.item_dict[item_id] = ['fill', [(x, y)], '', self.pen_color, 1]
+            record_changes(self.history, self.item_dict, [item_id], [before])
+        elif line[0] == 'keyframe':
+            """ keyframe selector frame translate dx dy | rotate x y r | scale x y s: 为图元的一种变换设置第frame帧的关键帧，
+            renderFrames时每帧的变换在相邻关键帧之间线性插值（见animate）；关键帧不记入撤销历史，删除图元及resetCanvas时清空 """
+            frame = int(line[2])
+            kind = line[3]
+            values = tuple(float(v) for v in line[4:])
+            for item_id in select_items(self.item_dict, self.group_dict, line[1]):
+                keyframes = self.tracks.setdefault(item_id, {}).setdefault(kind, [])
+                keyframes[:] = [k for k in keyframes if k[0] != frame]  # 同一帧的关键帧以最后一次为准
+                bisect.insort(keyframes, (frame, values))
+        elif line[0] == 'clearKeyframes':
+            """ clearKeyframes selector: 删除图元的所有关键帧 """
+            for item_id in select_items(self.item_dict, self.group_dict, line[1]):
+                self.tracks.pop(item_id, None)
+        elif line[0] == 'renderFrames':
+            """ renderFrames name first last: 渲染动画的第first到第last帧，保存为name_0000.bmp、name_0001.bmp...（见render_frames） """
+            self.render_frames(line[1], int(line[2]), int(line[3]))
+        elif line[0] == 'group':
+            """ group name selector0 selector1 ...: 定义图元组，之后可用 @name 选中组内的所有图元（resetCanvas后仍保留） """
+            self.group_dict[line[1]] = line[2:]
+        elif line[0] == 'translate':
+            """ translate selector dx dy: 平移（selector见select_items，下同） """
+            item_ids = select_items(self.item_dict, self.group_dict, line[1])
+            dx = int(line[2])
+            dy = int(line[3])
+            self.history.record_translate(item_ids, dx, dy)
+            if len(item_ids) == 1:
+                self.item_dict[item_ids[0]][1] = alg.translate(self.item_dict[item_ids[0]][1], dx, dy)
+            elif len(item_ids) > 1:  # 多个图元：一次完成全部图元的变换
+                p_lists = batch.translate([self.item_dict[i][1] for i in item_ids], dx, dy)
+                for item_id, p_list in zip(item_ids, p_lists):
+                    self.item_dict[item_id][1] = p_list
+        elif line[0] == 'scale':
+            """ scale selector x y s: 缩放 """
+            item_ids = select_items(self.item_dict, self.group_dict, line[1])
+            x = int(line[2])
+            y = int(line[3])
+            s = float(line[4])
+            befores = [get_state(self.item_dict[i]) for i in item_ids]
+            if len(item_ids) == 1:
+                self.item_dict[item_ids[0]][1] = alg.scale(self.item_dict[item_ids[0]][1], x, y, s)
+            elif len(item_ids) > 1:
+                p_lists = batch.scale([self.item_dict[i][1] for i in item_ids], x, y, s)
+                for item_id, p_list in zip(item_ids, p_lists):
+                    self.item_dict[item_id][1] = p_list
+            record_changes(self.history, self.item_dict, item_ids, befores)
+        elif line[0] == 'rotate':
+            """ rotate selector x y r: 旋转（忽略椭圆） """
+            item_ids = [i for i in select_items(self.item_dict, self.group_dict, line[1]) if self.item_dict[i][0] != 'ellipse']
+            x = int(line[2])
+            y = int(line[3])
+            r = float(line[4])
+            befores = [get_state(self.item_dict[i]) for i in item_ids]
+            if len(item_ids) == 1:
+                self.item_dict[item_ids[0]][1] = alg.rotate(self.item_dict[item_ids[0]][1], x, y, r)
+            elif len(item_ids) > 1:
+                p_lists = batch.rotate([self.item_dict[i][1] for i in item_ids], x, y, r)
+                for item_id, p_list in zip(item_ids, p_lists):
+                    self.item_dict[item_id][1] = p_list
+            record_changes(self.history, self.item_dict, item_ids, befores)
+        elif line[0] == 'clip':
+            """ clip selector x_min y_min x_max y_max algorithm: 裁剪（仅线段），完全在窗口外的线段被删除（与cg_gui一致），其关键帧一并删除 """
+            item_ids = [i for i in select_items(self.item_dict, self.group_dict, line[1]) if self.item_dict[i][0] == 'line']
+            x_min = int(line[2])
+            y_min = int(line[3])
+            x_max = int(line[4])
+            y_max = int(line[5])
+            algorithm = line[6]
+            befores = [get_state(self.item_dict[i]) for i in item_ids]
+            positions = get_positions(self.item_dict, item_ids)
+            if len(item_ids) == 1:
+                self.item_dict[item_ids[0]][1] = alg.clip(self.item_dict[item_ids[0]][1], x_min, y_min, x_max, y_max, algorithm)
+            elif len(item_ids) > 1:
+                p_lists = batch.clip([self.item_dict[i][1] for i in item_ids], x_min, y_min, x_max, y_max, algorithm)
+                for item_id, p_list in zip(item_ids, p_lists):
+                    self.item_dict[item_id][1] = p_list
+            for item_id in item_ids:
+                if len(self.item_dict[item_id][1]) == 0:
+                    del self.item_dict[item_id]
+                    self.tracks.pop(item_id, None)
+            record_changes(self.history, self.item_dict, item_ids, befores, positions)
+        elif line[0] == 'delete':
+            """ delete selector: 删除图元（及其关键帧） """
+            item_ids = select_items(self.item_dict, self.group_dict, line[1])
+            positions = get_positions(self.item_dict, item_ids)
+            self.history.record([(item_id, get_state(self.item_dict.pop(item_id)), None) for item_id in item_ids], positions)
+            for item_id in item_ids:  # 关键帧不记入撤销历史，随图元一起删除
+                self.tracks.pop(item_id, None)
+        elif line[0] == 'undo':
+            """ undo [n]: 撤销n步（默认1步） """
+            for i in range(int(line[1]) if len(line) > 1 else 1):
+                apply_history(self.item_dict, self.history.undo())
+        elif line[0] == 'redo':
+            """ redo [n]: 重做n步（默认1步） """
+            for i in range(int(line[1]) if len(line) > 1 else 1):
+                apply_history(self.item_dict, self.history.redo())
+        elif line[0] == 'setHistoryLimit':
+            """ setHistoryLimit n: 设置可撤销的最大步数（默认1000） """
+            self.history.set_limit(int(line[1]))
+
+
 if __name__ == '__main__':
+    # 用法：python cg_cli.py input_file output_dir [--checkpoint-interval seconds] [--resume]
+    #   input_file为'-'时从标准输入读取，可以是gzip/bz2/xz压缩的（见cg_input）
+    #   执行期间每隔seconds秒（默认60，0表示不保存）在输出目录下保存检查点，正常结束后删除；
+    #   --resume从输出目录下的检查点继续执行中断的运行（输入须与中断前相同），没有检查点时从头执行，都跳过已保存的位图
     input_file = sys.argv[1]
     output_dir = sys.argv[2]
-    os.makedirs(output_dir, exist_ok=True)
-
-    item_dict = {}
-    """ 当前画布上的图元：{item_id: [item_type, p_list, algorithm, color], ...} """
-
-    pen_color = np.zeros(3, np.uint8)
-    """ 当前画笔颜色 """
-
-    width = 0
-    """ 画布尺寸（宽） """
-    height = 0
-    """ 画布尺寸（高） """
-
-    with open(input_file, 'r') as fp:
-        line = fp.readline()
-        while line:
-            line = line.strip().split(' ')
-            if line[0] == 'resetCanvas':
-                """ resetCanvas width height: 清空当前画布，并重新设置宽高 """
-                width = int(line[1])
-                height = int(line[2])
-                item_dict.clear()
-            elif line[0] == 'saveCanvas':
-                """ saveCanvas name: 仅在此步骤将图元对象转化为像素点，保存画布为位图name.bmp """
-                save_name = line[1]
-                canvas = np.zeros([height, width, 3], np.uint8)
-                canvas.fill(255)
-                for item_type, p_list, algorithm, color in item_dict.values():
-                    # 绘制：将图元转化为像素点
-                    pixels = []
-                    if item_type == 'line':
-                        pixels = alg.draw_line(p_list, algorithm)
-                    elif item_type == 'polygon':
-                        pixels = alg.draw_polygon(p_list, algorithm, True)
-                    elif item_type == 'ellipse':
-                        pixels = alg.draw_ellipse(p_list)
-                    elif item_type == 'curve':
-                        pixels = alg.draw_curve(p_list, algorithm)
-                    for x, y in pixels:
-                        canvas[y, x] = color
-                Image.fromarray(canvas).save(os.path.join(output_dir, save_name + '.bmp'), 'bmp')
-            elif line[0] == 'setColor':
-                """ setColor R G B: 设置画笔颜色 """
-                pen_color[0] = int(line[1])
-                pen_color[1] = int(line[2])
-                pen_color[2] = int(line[3])
-            elif line[0] == 'drawLine':
-                """ drawLine id x0 y0 x1 y1 algorithm: 绘制线段 """
-                item_id = line[1]
-                x0 = int(line[2])
-                y0 = int(line[3])
-                x1 = int(line[4])
-                y1 = int(line[5])
-                algorithm = line[6]
-                item_dict[item_id] = ['line', [(x0, y0), (x1, y1)], algorithm, np.array(pen_color)]
-            elif line[0] == 'drawPolygon':
-                """ drawPolygon id x0 y0 x1 y1 x2 y2 ... algorithm: 绘制多边形 """
-                item_id = line[1]
-                points = []
-                n = len(line)
-                for i in range(2, n - 1, 2):
-                    points.append((int(line[i]), int(line[i + 1])))
-                algorithm = line[n - 1]
-                item_dict[item_id] = ['polygon', points, algorithm, np.array(pen_color)]
-            elif line[0] == 'drawEllipse':
-                """ drawEllipse id x0 y0 x1 y1: 绘制椭圆（中点圆生成算法） """
-                item_id = line[1]
-                x0 = int(line[2])
-                y0 = int(line[3])
-                x1 = int(line[4])
-                y1 = int(line[5])
-                item_dict[item_id] = ['ellipse', [(x0, y0), (x1, y1)], '', np.array(pen_color)]
-            elif line[0] == 'drawCurve':
-                """ drawCurve id x0 y0 x1 y1 x2 y2 ... algorithm: 绘制曲线 """
-                item_id = line[1]
-                points = []
-                n = len(line)
-                for i in range(2, n - 1, 2):
-                    points.append((int(line[i]), int(line[i + 1])))
-                algorithm = line[n - 1]
-                item_dict[item_id] = ['curve', points, algorithm, np.array(pen_color)]
-            elif line[0] == 'translate':
-                item_id = line[1]
-                dx = int(line[2])
-                dy = int(line[3])
-                item_dict[item_id][1] = alg.translate(item_dict[item_id][1], dx, dy)
-            elif line[0] == 'scale':
-                item_id = line[1]
-                x = int(line[2])
-                y = int(line[3])
-                s = float(line[4])
-                item_dict[item_id][1] = alg.scale(item_dict[item_id][1], x, y, s)
-            elif line[0] == 'rotate':
-                item_id = line[1]
-                if item_dict[item_id][0] != 'ellipse':
-                    x = int(line[2])
-                    y = int(line[3])
-                    r = float(line[4])
-                    item_dict[item_id][1] = alg.rotate(item_dict[item_id][1], x, y, r)
-            elif line[0] == 'clip':
-                item_id = line[1]
-                if item_dict[item_id][0] == 'line':
-                    x_min = int(line[2])
-                    y_min = int(line[3])
-                    x_max = int(line[4])
-                    y_max = int(line[5])
-                    algorithm = line[6]
-                    item_dict[item_id][1] = alg.clip(item_dict[item_id][1], x_min, y_min, x_max, y_max, algorithm)
-            line = fp.readline()
-
+    interval = CHECKPOINT_INTERVAL
+    if '--checkpoint-interval' in sys.argv:
+        interval = float(sys.argv[sys.argv.index('--checkpoint-interval') + 1])
+    session = Session(output_dir)
+    checkpoint_path = os.path.join(output_dir, CHECKPOINT_NAME)
+    with open_binary(input_file) as fp:
+        offset = 0
+        if '--resume' in sys.argv:
+            offset = session.load_checkpoint(checkpoint_path)
+            skip_input(fp, offset)
+        session.run(fp, checkpoint_path if interval > 0 else None, interval, offset)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# cg_cli的客户端，用法与cg_cli.py相同：python cg_client.py input_file output_dir（input_file同样可以是'-'或压缩文件）
+# 把指令文件交给常驻的cg_server执行，省去每次启动时加载NumPy/PIL的时间；服务未启动时在本进程内执行
+# 协议：客户端先发送一行输出目录的绝对路径，再发送指令文件的内容，然后关闭写端；
+#      服务端执行完毕后回复一行，'OK'表示成功，否则为'ERROR 错误信息'；压缩的指令文件由客户端解压后发送
+# 检查点（--checkpoint-interval、--resume）只有cg_cli支持，客户端不接受这两个选项
+# 本文件只依赖标准库，保证客户端启动足够快
+import sys
+import os
+import io
+import stat
+import socket
+from cg_input import CHUNK_SIZE, open_binary
+
+DEFAULT_SOCKET = os.environ.get('CG_CLI_SOCKET', '/tmp/cg_cli.sock')
+""" 默认的套接字路径，可用环境变量CG_CLI_SOCKET修改 """
+
+
+def run_remote(fp, output_dir, socket_path=DEFAULT_SOCKET):
+    """ 将指令文件发送给cg_server执行
+    :param fp: 以二进制方式打开的指令文件（见cg_input.open_binary）
+    :param output_dir: (string) 保存位图的目录
+    :param socket_path: (string) cg_server监听的套接字路径
+    :return: (string) 服务端的回复
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall((os.path.abspath(output_dir) + '\n').encode('utf-8'))
+        if isinstance(fp, io.BufferedReader) and stat.S_ISREG(os.fstat(fp.fileno()).st_mode):  # 未压缩的普通文件由内核直接发送
+            sock.sendfile(fp)
+        else:  # 管道等标准输入（sendfile不能读取），或解压后的数据流（其fileno是压缩文件本身）
+            for chunk in iter(lambda: fp.read(CHUNK_SIZE), b''):
+                sock.sendall(chunk)
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile('r', encoding='utf-8') as reply:
+            return reply.readline().strip()
+
+
+if __name__ == '__main__':
+    if '--checkpoint-interval' in sys.argv or '--resume' in sys.argv:
+        print('cg_client does not support checkpoints, use cg_cli.py for --checkpoint-interval/--resume', file=sys.stderr)
+        sys.exit(1)
+    input_file = sys.argv[1]
+    output_dir = sys.argv[2]
+
+    with open_binary(input_file) as fp:
+        try:
+            reply = run_remote(fp, output_dir)
+        except (FileNotFoundError, ConnectionRefusedError):  # 服务未启动，在本进程内执行（连接失败时尚未读取输入）
+            reply = None
+        if reply is None:
+            from cg_cli import Session
+            Session(output_dir).run(fp)
+    if reply is not None and reply != 'OK':
+        print(reply if reply else 'ERROR 服务端连接中断', file=sys.stderr)
+        sys.exit(1)
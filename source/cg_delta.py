@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 帧流：cg_cli在setOutputMode delta时把每次saveCanvas的画布追加到输出目录下的帧流文件（STREAM_NAME），
+# 第一帧及每隔若干帧写完整的关键帧，其余帧只写与上一帧相比发生变化的像素，连续小幅编辑的各帧只占很少的空间
+# 用法：python cg_delta.py stream_file [--list] [name ...] [--output dir]
+#   还原帧流中名为name的帧（同名多次保存时取最后一次）为标准位图dir/name.bmp（默认为帧流所在目录），不给出name时还原全部帧；
+#   --list列出帧流中的所有帧
+#
+# 帧流由依次追加的记录组成，每条记录：
+#   MAGIC, 类型(uint8: 0关键帧/1差分帧), 帧名长度(uint16), 帧名(utf-8), 宽(uint32), 高(uint32), 每像素字节数(uint8: 1索引/3 RGB),
+#   调色板颜色数(uint16), 调色板(每种颜色3字节), 数据长度(uint32), 数据(zlib压缩)
+#   关键帧的数据为整个画布；差分帧相对前一条记录，数据为变化的像素段数n(uint32)、各段起点(uint32 * n，按行展开后的像素序号)、
+#   各段长度(uint32 * n)、各段的新像素值
+import sys
+import os
+import struct
+import zlib
+import numpy as np
+
+STREAM_NAME = 'frames.cgd'
+""" 帧流在输出目录下的文件名 """
+
+KEYFRAME_INTERVAL = 100
+""" 默认每隔多少帧写一个关键帧，限制还原一帧时需要依次应用的差分帧数 """
+
+MAGIC = b'CGDF'
+KEYFRAME, DELTA = 0, 1
+_HEAD = struct.Struct('<4sBH')     # MAGIC, 类型, 帧名长度
+_FRAME = struct.Struct('<IIBH')    # 宽, 高, 每像素字节数, 调色板颜色数
+_LENGTH = struct.Struct('<I')
+
+
+def diff_runs(previous, canvas):
+    """ 两帧之间发生变化的像素段（画布按行展开为一维）
+    :return: (ndarray, ndarray) 各段的起点、长度
+    """
+    changed = previous != canvas
+    if changed.ndim == 3:
+        changed = changed.any(axis=2)
+    d = np.diff(changed.ravel().astype(np.int8), prepend=0, append=0)
+    starts = np.flatnonzero(d == 1)
+    return starts, np.flatnonzero(d == -1) - starts
+
+
+def _run_indices(starts, lengths):
+    """ 像素段展开为像素序号 """
+    offset = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offset
+
+
+class DeltaWriter:
+    """
+    帧流的写入端：保留上一帧的画布，新的一帧与之尺寸、格式相同且变化的像素不到一半时写差分帧，否则写关键帧
+    """
+    def __init__(self, path: str, size: int = 0, keyframe_interval: int = KEYFRAME_INTERVAL):
+        """
+        :param path: 帧流文件路径
+        :param size: 保留帧流中前size字节（之前写入的完整记录），之后的内容丢弃；0表示新建。
+            帧流不存在或不足size字节时（如恢复执行前被删除）抛出ValueError，不会补零生成无法读取的帧流
+        :param keyframe_interval: 关键帧的间隔（帧数）
+        """
+        if size > 0:
+            if not os.path.exists(path) or os.path.getsize(path) < size:
+                raise ValueError('%s: cannot resume the frame stream, expected at least %d bytes' % (path, size))
+            self.fp = open(path, 'r+b')
+            self.fp.truncate(size)
+            self.fp.seek(size)
+        else:
+            self.fp = open(path, 'wb')
+        self.keyframe_interval = keyframe_interval
+        self.previous = None  # 上一帧的画布，续写已有的帧流时下一帧总是关键帧
+        self.count = 0        # 上一个关键帧之后的帧数
+
+    def write(self, name, canvas, palette):
+        """ 追加一帧并写入磁盘
+        :param canvas: (ndarray [h, w] 索引画布或[h, w, 3] RGB画布)
+        :param palette: (list of (r, g, b)) 索引画布的调色板，RGB画布为空列表
+        """
+        kind = KEYFRAME
+        if self.previous is not None and self.previous.shape == canvas.shape and self.count < self.keyframe_interval:
+            starts, lengths = diff_runs(self.previous, canvas)
+            if lengths.sum() * 2 < canvas.shape[0] * canvas.shape[1]:
+                kind = DELTA
+        if kind == KEYFRAME:
+            data = canvas.tobytes()
+            self.count = 0
+        else:
+            values = canvas.reshape(canvas.shape[0] * canvas.shape[1], -1)[_run_indices(starts, lengths)]
+            data = _LENGTH.pack(len(starts)) + starts.astype('<u4').tobytes() + lengths.astype('<u4').tobytes() + values.tobytes()
+        self.count += 1
+        name = name.encode('utf-8')
+        channels = 1 if canvas.ndim == 2 else 3
+        data = zlib.compress(data, 6)
+        self.fp.write(_HEAD.pack(MAGIC, kind, len(name)) + name +
+                      _FRAME.pack(canvas.shape[1], canvas.shape[0], channels, len(palette)) +
+                      bytes(c for color in palette for c in color) + _LENGTH.pack(len(data)) + data)
+        self.fp.flush()
+        self.previous = canvas
+
+    def tell(self) -> int:
+        """ 已写入的字节数（均为完整的记录） """
+        return self.fp.tell()
+
+    def close(self):
+        self.fp.close()
+
+
+def read_index(path):
+    """ 读取帧流中各条记录的头部（跳过数据）
+    :return: (list of dict) 按写入顺序的记录：{'name', 'kind', 'width', 'height', 'channels', 'palette', 'offset', 'length'}，
+        offset为数据的位置；文件末尾不完整的记录（写入时被中断）忽略
+    """
+    records = []
+    size = os.path.getsize(path)
+    with open(path, 'rb') as fp:
+        while True:
+            head = fp.read(_HEAD.size)
+            if len(head) < _HEAD.size:
+                break
+            magic, kind, name_length = _HEAD.unpack(head)
+            if magic != MAGIC:
+                raise ValueError('%s: bad record at byte %d' % (path, fp.tell() - _HEAD.size))
+            name = fp.read(name_length).decode('utf-8')
+            frame = fp.read(_FRAME.size)
+            if len(frame) < _FRAME.size:
+                break
+            width, height, channels, colors = _FRAME.unpack(frame)
+            palette = fp.read(colors * 3)
+            length = fp.read(_LENGTH.size)
+            if len(length) < _LENGTH.size:
+                break
+            length = _LENGTH.unpack(length)[0]
+            offset = fp.tell()
+            if fp.seek(length, os.SEEK_CUR) > size:
+                break
+            records.append({'name': name, 'kind': kind, 'width': width, 'height': height, 'channels': channels,
+                            'palette': [tuple(palette[i:i + 3]) for i in range(0, len(palette), 3)],
+                            'offset': offset, 'length': length})
+    return records
+
+
+def read_frame(path, name, records=None):
+    """ 还原帧流中名为name的帧（同名多次保存时取最后一次）：从它之前最近的关键帧开始依次应用差分帧
+    :param records: read_index的结果，还原多帧时可以复用
+    :return: (canvas, palette) 画布及索引画布的调色板，见DeltaWriter.write
+    """
+    if records is None:
+        records = read_index(path)
+    last = max((i for i, record in enumerate(records) if record['name'] == name), default=None)
+    if last is None:
+        raise KeyError('%s: no frame named %s' % (path, name))
+    first = max(i for i in range(last + 1) if records[i]['kind'] == KEYFRAME)
+    canvas = None
+    with open(path, 'rb') as fp:
+        for record in records[first:last + 1]:
+            fp.seek(record['offset'])
+            data = zlib.decompress(fp.read(record['length']))
+            shape = (record['height'], record['width']) + ((3,) if record['channels'] == 3 else ())
+            if record['kind'] == KEYFRAME:
+                canvas = np.frombuffer(data, np.uint8).reshape(shape).copy()
+                continue
+            n = _LENGTH.unpack_from(data)[0]
+            runs = np.frombuffer(data, '<u4', 2 * n, _LENGTH.size).astype(np.int64)
+            starts, lengths = runs[:n], runs[n:]
+            values = np.frombuffer(data, np.uint8, offset=_LENGTH.size + 8 * n).reshape(-1, record['channels'])
+            canvas.reshape(record['height'] * record['width'], -1)[_run_indices(starts, lengths)] = values
+    return canvas, records[last]['palette']
+
+
+if __name__ == '__main__':
+    from cg_cli import save_image
+    stream_file = sys.argv[1]
+    records = read_index(stream_file)
+    if '--list' in sys.argv:
+        for record in records:
+            print('%-24s %-8s %dx%d %s' % (record['name'], 'keyframe' if record['kind'] == KEYFRAME else 'delta',
+                                           record['width'], record['height'], 'indexed' if record['channels'] == 1 else 'rgb'))
+        sys.exit(0)
+    output_dir = os.path.dirname(stream_file)
+    if '--output' in sys.argv:
+        output_dir = sys.argv[sys.argv.index('--output') + 1]
+    os.makedirs(output_dir or '.', exist_ok=True)
+    names = [a for i, a in enumerate(sys.argv[2:], 2) if not a.startswith('--') and sys.argv[i - 1] != '--output']
+    for name in names or list(dict.fromkeys(record['name'] for record in records)):
+        try:
+            canvas, palette = read_frame(stream_file, name, records)
+        except KeyError as e:
+            print(e.args[0], file=sys.stderr)
+            sys.exit(1)
+        save_image(canvas, palette, os.path.join(output_dir, name + '.bmp'))
@@ -3,39 +3,248 @@
 
 import sys
 import os
+import math
+from collections import OrderedDict
 import cg_algorithms as alg
+import cg_batch as batch
+from cg_history import History, restore_order
 import numpy as np
 from PIL import Image
 from typing import Optional
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, qApp, QGraphicsScene, QGraphicsView, QGraphicsItem, QStyleOptionGraphicsItem,
-    QWidget, QListWidget, QColorDialog, QDialog, QInputDialog, QMessageBox,
+    QWidget, QListView, QAbstractItemView, QColorDialog, QDialog, QInputDialog, QMessageBox,
     QHBoxLayout, QVBoxLayout, QLabel, QLineEdit, QPushButton)
-from PyQt5.QtGui import QPainter, QMouseEvent, QKeyEvent, QColor, QDoubleValidator, QIntValidator
-from PyQt5.QtCore import QRectF, Qt
+from PyQt5.QtGui import (
+    QPainter, QMouseEvent, QKeyEvent, QWheelEvent, QKeySequence, QColor, QImage, QTransform, QDoubleValidator, QIntValidator)
+from PyQt5.QtCore import (
+    QRectF, QPointF, Qt, QObject, QAbstractListModel, QModelIndex, QItemSelectionModel, QRunnable, QThreadPool, QTimer, pyqtSignal)
+
+TILE_SIZE = 256     # 图块边长（屏幕像素）
+ZOOM_MIN = -3       # 最小缩放级别，显示比例为2 ** ZOOM_MIN
+ZOOM_MAX = 3        # 最大缩放级别
+OUTSIDE_COLOR = (160, 160, 160)  # 画布以外区域的颜色
+PIECE_MIN = 16      # 顶点/控制点数不少于该值的多边形和B样条曲线才逐条边/逐段缓存光栅化结果
+LOD_THRESHOLD = 8   # 控制点数不少于该值的曲线才在绘制/编辑中降低精度
+LOD_SAMPLES = 10    # 绘制/编辑中的曲线每段的采样数（完整精度为100）
+LOD_DELAY = 200     # 鼠标停止移动多少毫秒后恢复完整精度
+
+
+def rasterize(item_type, p_list, algorithm, poly_closed, lod_samples=0, pen_width=1):
+    """ 将图元转化为像素点
+    :param lod_samples: 曲线每段的采样数，0表示完整精度
+    :param pen_width: 线宽，大于1时按粗线扫描转换为区段后展开（与cg_cli一致）
+    :return: (ndarray [N, 2]) 像素点坐标
+    """
+    pixels = []
+    if len(p_list) == 0:  # 无效图元
+        pass
+    elif pen_width > 1:
+        if item_type == 'ellipse':
+            spans = alg.draw_thick_ellipse(p_list, pen_width)
+        elif item_type == 'curve':
+            points = alg.curve_points(p_list, algorithm, lod_samples) if lod_samples > 0 else alg.curve_points(p_list, algorithm)
+            spans = alg.draw_stroke(points, pen_width)
+        else:
+            spans = alg.draw_stroke(p_list, pen_width, item_type == 'polygon' and poly_closed)
+        return batch.expand_spans(np.array(spans, np.int64).reshape(-1, 3))
+    elif item_type == 'line':
+        pixels = alg.draw_line(p_list, algorithm)
+    elif item_type == 'polygon':
+        pixels = alg.draw_polygon(p_list, algorithm, poly_closed)
+    elif item_type == 'ellipse':
+        pixels = alg.draw_ellipse(p_list)
+    elif item_type == 'curve':
+        pixels = alg.draw_curve(p_list, algorithm, lod_samples) if lod_samples > 0 else alg.draw_curve(p_list, algorithm)
+    return np.array(pixels, np.int64).reshape(-1, 2)
+
+
+def uses_pieces(item_type, p_list, algorithm, pen_width=1):
+    """ 图元是否逐条边/逐段光栅化，见rasterize_pieces；粗线的相邻边/段互相重叠，整体光栅化 """
+    return (item_type == 'polygon' or (item_type == 'curve' and algorithm == 'B-spline')) and len(p_list) >= PIECE_MIN \
+        and pen_width == 1
+
+
+def rasterize_pieces(item_type, p_list, algorithm, poly_closed, lod_samples, cache):
+    """ 逐条边（多边形）或逐段（B样条曲线，每段只取决于相邻的4个控制点）光栅化，参数未变化的边/段直接复用上一次的结果，
+    移动一个顶点/控制点时只需重新光栅化与之相邻的O(1)条边/段。像素点与rasterize相同（顺序可能不同）
+    :param cache: (dict) 上一次的各边/段的光栅化结果，只读（可能正被其他线程使用）
+    :return: (ndarray [N, 2], dict) 像素点坐标，本次的各边/段的光栅化结果
+    """
+    pieces = {}
+    result = []
+    if item_type == 'polygon':
+        edges = list(zip(p_list, p_list[1:]))
+        if poly_closed:
+            edges.append((p_list[-1], p_list[0]))
+        for p0, p1 in edges:
+            key = (p0, p1, algorithm)
+            pixels = pieces.get(key)
+            if pixels is None:
+                pixels = cache.get(key)
+                if pixels is None:
+                    pixels = np.array(alg.draw_line([p0, p1], algorithm), np.int64).reshape(-1, 2)
+                pieces[key] = pixels
+            result.append(pixels)
+    else:
+        # B样条曲线：每段的采样点之间连成折线（与cg_algorithms.draw_curve一致），相邻两段之间再用一条线段连接
+        samples = lod_samples if lod_samples > 0 else 100
+        last = None  # 上一段的最后一个采样点
+        for i in range(len(p_list) - 3):
+            key = (tuple(p_list[i:i + 4]), samples)
+            piece = pieces.get(key)
+            if piece is None:
+                piece = cache.get(key)
+                if piece is None:
+                    points = alg.b_spline_samples(p_list[i:i + 4], samples)
+                    lines = [alg.draw_line([points[j], points[j + 1]], 'Bresenham') for j in range(len(points) - 1)]
+                    piece = (points[0], points[-1], np.array([p for line in lines for p in line], np.int64).reshape(-1, 2))
+                pieces[key] = piece
+            if last is not None:
+                join = (last, piece[0])
+                pixels = pieces.get(join)
+                if pixels is None:
+                    pixels = cache.get(join)
+                    if pixels is None:
+                        pixels = np.array(alg.draw_line(list(join), 'Bresenham'), np.int64).reshape(-1, 2)
+                    pieces[join] = pixels
+                result.append(pixels)
+            result.append(piece[2])
+            last = piece[1]
+    pixels = np.concatenate(result) if len(result) > 0 else np.zeros([0, 2], np.int64)
+    return pixels, pieces
+
+
+def union_region(r1, r2):
+    """ 两个区域(x0, y0, x1, y1)的并（包围盒），None表示空区域 """
+    if r1 is None:
+        return r2
+    if r2 is None:
+        return r1
+    return min(r1[0], r2[0]), min(r1[1], r2[1]), max(r1[2], r2[2]), max(r1[3], r2[3])
+
+
+def intersects(r1, r2):
+    """ 两个区域(x0, y0, x1, y1)是否相交 """
+    return r1 is not None and r2 is not None and r1[0] < r2[2] and r2[0] < r1[2] and r1[1] < r2[3] and r2[1] < r1[3]
+
+
+class SessionRecorder:
+    """
+    操作录制：把画布上每个已提交的操作写成cg_cli指令，录制的文件可直接交给cg_cli执行；
+    可选地把鼠标/键盘事件和菜单操作写成以'#@'开头的行（cg_cli视为注释），供cg_replay逐事件回放
+    """
+    def __init__(self, path: str, record_events: bool = False):
+        """
+        :param path: 录制文件路径
+        :param record_events: 是否录制界面事件（包括每一次鼠标移动）
+        """
+        self.fp = open(path, 'w', buffering=1)  # 按行写入，程序异常退出时已录制的内容不丢失
+        self.record_events = record_events
+        self.pen_color = None  # cg_cli中当前的画笔颜色
+        self.pen_width = 1     # cg_cli中当前的线宽
+
+    def command(self, *words):
+        """ 写入一条cg_cli指令 """
+        self.fp.write(' '.join(str(w) for w in words) + '\n')
+
+    def event(self, *words):
+        """ 写入一个界面事件 """
+        if self.record_events:
+            self.command('#@', *words)
+
+    def draw(self, item):
+        """ 写入绘制（或以同样的Id重新绘制）图元的指令 """
+        color = (item.color.red(), item.color.green(), item.color.blue())
+        if color != self.pen_color:
+            self.command('setColor', *color)
+            self.pen_color = color
+        if item.item_type != 'fill' and item.pen_width != self.pen_width:
+            self.command('setPenWidth', item.pen_width)
+            self.pen_width = item.pen_width
+        points = [c for p in item.p_list for c in p]
+        if item.item_type == 'line':
+            self.command('drawLine', item.id, *points, item.algorithm)
+        elif item.item_type == 'polygon':
+            self.command('drawPolygon', item.id, *points, item.algorithm)
+        elif item.item_type == 'ellipse':
+            self.command('drawEllipse', item.id, *points)
+        elif item.item_type == 'curve':
+            self.command('drawCurve', item.id, *points, item.algorithm)
+        elif item.item_type == 'fill':
+            self.command('fill', item.id, *points)
+
+    def start(self, canvas):
+        """ 写入画布的当前状态，回放从这里开始 """
+        rect = canvas.sceneRect()
+        self.command('setHistoryLimit', canvas.history.undo_steps.maxlen)
+        self.command('resetCanvas', int(rect.width()), int(rect.height()))
+        for item in canvas.item_dict.values():
+            self.draw(item)
+
+    def close(self):
+        self.fp.close()
+
 
 class MyCanvas(QGraphicsView):
     """
-    画布窗体类，继承自QGraphicsView，采用QGraphicsView、QGraphicsScene、QGraphicsItem的绘图框架
+    画布窗体类，继承自QGraphicsView，采用QGraphicsView、QGraphicsScene、QGraphicsItem的绘图框架。
+    显示：各缩放级别下按图块合成图元的像素点并缓存（见render_tile），只重新绘制图元发生变化的图块；
+    导出：在后台线程中由图元的快照重新合成整个画布（见get_snapshot、ExportTask），不读取显示用的图块。
+    两者不共享一整块画布大小的帧缓冲：大画布缩小显示时不必合成全部像素，导出时可以继续编辑
     """
+    export_progress = pyqtSignal(int)  # 后台导出进度（%）
+    export_finished = pyqtSignal(str)  # 后台导出完成，参数为保存路径
+    export_failed = pyqtSignal(str)    # 后台导出失败，参数为错误信息
+
     def __init__(self, *args):
         super().__init__(*args)
 
         self.main_window = None            # 指向应用的主窗口，等待MainWindow类的赋值
-        self.list_widget = None            # 指向应用的图元清单，等待MainWindow类的赋值
+        self.list_view = None              # 指向应用的图元清单，等待MainWindow类的赋值
+        self.item_model = None             # 图元清单的数据模型，等待MainWindow类的赋值
         self.item_dict = {}                # 图元列表
         self.selected_id = ''              # 当前选中图元的Id
+        self.selected_ids = []             # 当前选中的所有图元的Id（多选时用于批量变换，包括selected_id）
         self.status = ''                   # 当前绘制状态：无任务/正在绘制Line/...
         self.is_drawing = False            # 当前绘制状态：是否某个图元正绘制一半
         self.is_editing = False            # 当前状态：是否正在编辑图元
         self.press_pos = (0, 0)            # 点击鼠标时鼠标位置
         self.temp_color = QColor(0, 0, 0)  # 当前画笔颜色
+        self.temp_width = 1                # 当前线宽
         self.temp_algorithm = ''           # 当前绘制的一个图形所采用的算法，随图形的绘制而更新
         self.temp_id = ''                  # 当前绘制的一个图形的Id，随图形的绘制而更新
         self.temp_item = None              # 当前绘制的一个图形图元，随图形的绘制而更新
         self.temp_vnum = 0                 # 当前绘制的如果是多边形/曲线，记录顶点/控制点数
         self.temp_v = 0                    # 当前绘制的如果是多边形/曲线，记录已经确认的顶点/控制点数
         self.item_no = 0                   # 图形的序号
+        self.zoom_level = 0                # 缩放级别，显示比例为2 ** zoom_level
+        self.tile_cache = OrderedDict()    # 图块缓存：{(zoom_level, tx, ty): (ndarray, QImage)}，最近使用的在末尾
+        self.tile_limit = 512              # 最多缓存的图块数
+        self.pan_pos = None                # 中键拖动画面时上一次的鼠标位置
+        self.scene().changed.connect(self.invalidate_tiles)
+        self.scene().sceneRectChanged.connect(lambda rect: self.tile_cache.clear())
+        self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
+        self.horizontalScrollBar().valueChanged.connect(self.scrolled)
+        self.verticalScrollBar().valueChanged.connect(self.scrolled)
+        self.output_dir = '../outputs'     # 保存画布的目录
+        self.thread_pool = QThreadPool(self)  # 后台导出的线程池
+        self.export_tasks = []             # 进行中的导出任务
+        self.raster_pool = QThreadPool(self)  # 后台光栅化的线程池，与导出分开，避免被长时间的导出占满
+        self.raster_tasks = []             # 进行中的光栅化任务（包括结果已过时的）
+        self.move_pos = None               # 最近一次鼠标移动的位置，尚未处理时不为None
+        self.frame_timer = QTimer(self)    # 帧定时器：鼠标移动事件合并到每帧处理一次
+        refresh_rate = QApplication.primaryScreen().refreshRate() if QApplication.primaryScreen() else 0
+        self.frame_timer.setInterval(round(1000 / refresh_rate) if refresh_rate > 0 else 16)
+        self.frame_timer.timeout.connect(self.frame_tick)
+        self.history = History(1000)       # 撤销/重做历史
+        self.lod_item = None               # 当前降低精度绘制的图元
+        self.lod_timer = QTimer(self)      # 鼠标停止移动一段时间后恢复完整精度
+        self.lod_timer.setSingleShot(True)
+        self.lod_timer.setInterval(LOD_DELAY)
+        self.lod_timer.timeout.connect(self.end_lod)
+        self.edit_before = None            # 编辑模式下，按下鼠标时选中图元的状态
+        self.recorder = None               # 操作录制（SessionRecorder），为None时不录制
 
     def get_item_no(self):
         self.item_no += 1
@@ -66,6 +275,10 @@ class MyCanvas(QGraphicsView):
         self.temp_v = 0
         self.is_drawing = True
 
+    def start_fill(self):
+        """ 开始填充，更改当前状态为填充中 """
+        self.status = 'fill'
+
     def start_clip(self, algorithm):
         """ 开始裁剪线段 """
         self.status = 'clip'
@@ -74,61 +287,159 @@ class MyCanvas(QGraphicsView):
     def is_valid_selection(self):
         return self.selected_id != '' and self.item_dict.__contains__(self.selected_id)
 
+    def start_recording(self, path, record_events=False):
+        """ 开始录制操作，见SessionRecorder """
+        self.stop_recording()
+        self.recorder = SessionRecorder(path, record_events)
+        self.recorder.start(self)
+        self.record_event('pen', self.temp_color.red(), self.temp_color.green(), self.temp_color.blue())
+        self.record_event('pen_width', self.temp_width)
+
+    def stop_recording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def record(self, *words):
+        """ 录制一条cg_cli指令（未在录制时忽略） """
+        if self.recorder is not None:
+            self.recorder.command(*words)
+
+    def record_event(self, *words):
+        """ 录制一个界面事件（未在录制时忽略） """
+        if self.recorder is not None:
+            self.recorder.event(*words)
+
+    def get_selected_items(self):
+        """ 当前选中的所有图元 """
+        return [self.item_dict[i] for i in self.selected_ids if i in self.item_dict]
+
     def translate_selected_item(self, dx, dy):
-        """ 平移 """
+        """ 平移（所有选中图元） """
         if self.is_valid_selection():
-            selected_item = self.item_dict[self.selected_id]
-            selected_item.p_list = alg.translate(selected_item.p_list, dx, dy)
+            selected_items = self.get_selected_items()
+            self.history.record_translate([item.id for item in selected_items], dx, dy)
+            self.record('translate', ','.join(item.id for item in selected_items), dx, dy)
+            p_lists = batch.translate([item.p_list for item in selected_items], dx, dy)
+            for item, p_list in zip(selected_items, p_lists):
+                item.prepareGeometryChange()
+                item.p_list = p_list
+            self.refresh_fills()
             self.updateScene([self.sceneRect()])
 
     def scale_selected_item(self, cx, cy, s):
-        """ 缩放 """
+        """ 缩放（所有选中图元） """
         if self.is_valid_selection():
-            selected_item = self.item_dict[self.selected_id]
-            selected_item.p_list = alg.scale(selected_item.p_list, cx, cy, s)
+            selected_items = self.get_selected_items()
+            befores = [item.get_state() for item in selected_items]
+            p_lists = batch.scale([item.p_list for item in selected_items], cx, cy, s)
+            for item, p_list in zip(selected_items, p_lists):
+                item.prepareGeometryChange()
+                item.p_list = p_list
+            self.history.record([(item.id, before, item.get_state()) for item, before in zip(selected_items, befores)])
+            self.record('scale', ','.join(item.id for item in selected_items), cx, cy, s)
+            self.refresh_fills()
             self.updateScene([self.sceneRect()])
 
     def rotate_selected_item(self, cx, cy, r):
-        """ 旋转 """
+        """ 旋转（所有选中图元，忽略椭圆） """
         if self.is_valid_selection():
-            selected_item = self.item_dict[self.selected_id]
-            selected_item.p_list = alg.rotate(selected_item.p_list, cx, cy, r)
+            selected_items = [item for item in self.get_selected_items() if item.item_type != 'ellipse']
+            befores = [item.get_state() for item in selected_items]
+            p_lists = batch.rotate([item.p_list for item in selected_items], cx, cy, r)
+            for item, p_list in zip(selected_items, p_lists):
+                item.prepareGeometryChange()
+                item.p_list = p_list
+            self.history.record([(item.id, before, item.get_state()) for item, before in zip(selected_items, befores)])
+            if len(selected_items) > 0:
+                self.record('rotate', ','.join(item.id for item in selected_items), cx, cy, r)
+            self.refresh_fills()
             self.updateScene([self.sceneRect()])
 
+    def clip_selected_item(self, x_min, y_min, x_max, y_max, algorithm):
+        """ 裁剪（所有选中线段），裁剪没了的线段从画布和图元清单中移除 """
+        selected_lines = [item for item in self.get_selected_items() if item.item_type == 'line']
+        if len(selected_lines) == 0:
+            return
+        befores = [item.get_state() for item in selected_lines]
+        p_lists = batch.clip([item.p_list for item in selected_lines], x_min, y_min, x_max, y_max, algorithm)
+        for item, p_list in zip(selected_lines, p_lists):
+            item.prepareGeometryChange()
+            item.p_list = p_list
+        afters = [item.get_state() if len(item.p_list) > 0 else None for item in selected_lines]
+        self.history.record([(item.id, before, after) for item, before, after in zip(selected_lines, befores, afters)],
+                            self.get_positions([item.id for item in selected_lines]))
+        self.record('clip', ','.join(item.id for item in selected_lines), x_min, y_min, x_max, y_max, algorithm)
+        for item in selected_lines:
+            if len(item.p_list) == 0:
+                self.delete_item(item.id)
+        self.refresh_fills()
+
     def clear_selection(self):
         """ 清空所选图元 """
         if self.is_valid_selection():
-            self.list_widget.selectionModel().clear()
-            self.item_dict[self.selected_id].selected = False
-            self.item_dict[self.selected_id].update()
+            self.list_view.selectionModel().clear()
+            for item in self.get_selected_items():
+                item.selected = False
+                item.update()
             self.selected_id = ''
+            self.selected_ids = []
             self.updateScene([self.sceneRect()])
 
     def selection_changed(self, selected):
         """ 更改所选图元 """
-        if selected != '' and selected != self.selected_id and self.item_dict.__contains__(selected):
-            self.main_window.statusBar().showMessage('图元选择： %s  (Ctrl+T[Win]/Cmd+T[Mac]进入编辑模式)' % selected)
-            if self.is_valid_selection():
-                self.item_dict[self.selected_id].selected = False
-                self.item_dict[self.selected_id].update()
-            self.selected_id = selected
-            self.item_dict[selected].selected = True
-            self.item_dict[selected].update()
-            self.status = ''
-            self.updateScene([self.sceneRect()])
+        if selected != '' and self.selected_ids != [selected] and self.item_dict.__contains__(selected):
+            self.multi_selection_changed([selected])
+
+    def multi_selection_changed(self, selected_list):
+        """ 更改所选图元（可多选），第一个图元作为当前图元用于编辑/裁剪 """
+        selected_list = [i for i in selected_list if self.item_dict.__contains__(i)]
+        if len(selected_list) == 0 or selected_list == self.selected_ids:
+            return
+        if len(selected_list) == 1:
+            self.main_window.statusBar().showMessage('图元选择： %s  (Ctrl+T[Win]/Cmd+T[Mac]进入编辑模式)' % selected_list[0])
+        else:
+            self.main_window.statusBar().showMessage('图元选择： %s 等%d个图元' % (selected_list[0], len(selected_list)))
+        for item in self.get_selected_items():
+            item.selected = False
+        self.selected_id = selected_list[0]
+        self.selected_ids = selected_list
+        for item in self.get_selected_items():
+            item.selected = True
+        self.status = ''
+        self.updateScene([self.sceneRect()])
+
+    def delete_item(self, item_id):
+        """ 删除一个图元，并从图元清单和选择中移除 """
+        if self.item_dict.__contains__(item_id):
+            self.scene().removeItem(self.item_dict.pop(item_id))
+            self.item_model.remove_id(item_id)
+            if item_id in self.selected_ids:
+                self.selected_ids.remove(item_id)
+                self.selected_id = self.selected_ids[0] if len(self.selected_ids) > 0 else ''
+
+    def get_positions(self, item_ids):
+        """ 图元在绘制顺序中的位置：{item_id: index}，删除时记入历史，撤销后插回原处 """
+        item_ids = set(item_ids)
+        return {item_id: i for i, item_id in enumerate(self.item_dict) if item_id in item_ids}
 
     def delete_selected_item(self):
+        """ 删除（所有选中图元） """
         if self.is_valid_selection():
-            selected_item = self.item_dict.pop(self.selected_id)
-            self.scene().removeItem(selected_item)
-            selected_row = self.list_widget.selectedItems()[0]
-            self.list_widget.takeItem(self.list_widget.row(selected_row))
-            self.list_widget.selectionModel().clear()
-            self.clear_selection()
+            self.history.record([(item.id, item.get_state(), None) for item in self.get_selected_items()],
+                                self.get_positions(self.selected_ids))
+            self.record('delete', ','.join(item.id for item in self.get_selected_items()))
+            self.list_view.selectionModel().clear()  # 先清空清单中的选择，避免每删除一行都触发一次选择变化
+            for item_id in list(self.selected_ids):
+                self.delete_item(item_id)
+            self.refresh_fills()
+            self.updateScene([self.sceneRect()])
             self.main_window.statusBar().showMessage('空闲')
 
     def reset_all(self):
         self.clear_selection()
+        self.history.record([(item_id, item.get_state(), None) for item_id, item in self.item_dict.items()])
+        self.record('resetCanvas', int(self.sceneRect().width()), int(self.sceneRect().height()))
         for item in self.item_dict.values():
             self.scene().removeItem(item)
         self.item_dict.clear()
@@ -140,25 +451,283 @@ class MyCanvas(QGraphicsView):
         self.temp_item = None
         self.temp_vnum = 0
         self.temp_v = 0
-        self.item_no = 0
+        # 图形的序号不清零，避免撤销重置后与新绘制的图元Id重复
         self.updateScene([self.sceneRect()])
 
-    def save_all(self, filename):
-        # 只支持保存 600 * 600 的画布
-        canvas = np.zeros([600, 600, 3], np.uint8)
-        canvas.fill(255)
+    def add_item(self, item):
+        """ 将绘制完成的图元加入画布和图元清单，并记录到历史 """
+        self.end_lod()
+        before = self.item_dict[item.id].get_state() if self.item_dict.__contains__(item.id) else None
+        self.item_dict[item.id] = item
+        self.item_model.add_id(item.id)  # 已在清单中的Id会被忽略
+        self.history.record([(item.id, before, item.get_state())])
+        if self.recorder is not None:
+            self.recorder.draw(item)
+        self.refresh_fills()
+
+    def refresh_fills(self):
+        """ 重新计算填充图元的区段：按绘制顺序在白色画布上合成各图元，遇到填充图元时从种子点填充（与cg_cli保存画布的结果一致）。
+        只重新计算依赖的输入（见fill_inputs）发生变化的填充图元；需要时才合成画布，且只合成到最后一个需要重新计算的填充图元，
+        与所有填充区域都不相交的编辑不必合成画布 """
+        items = list(self.item_dict.values())
+        rect = self.sceneRect()
+        size = (int(rect.width()), int(rect.height()))
+        canvas = None
+        drawn = 0  # 已合成到canvas上的图元数
+        for i, item in enumerate(items):
+            if item.item_type != 'fill' or self.fill_inputs(item, items[:i], size) == item.fill_inputs:
+                continue
+            if canvas is None:
+                canvas = np.full([size[1], size[0], 3], 255, np.uint8)
+            for below in items[drawn:i]:
+                color = (below.color.red(), below.color.green(), below.color.blue())
+                if below.item_type == 'fill':  # 未变化的填充图元直接写入已有的区段
+                    batch.draw_spans(canvas, below.fill_spans, color)
+                else:
+                    batch.draw_pixels(canvas, below.rasterize(), color)
+            color = (item.color.red(), item.color.green(), item.color.blue())
+            item.set_fill_spans(batch.fill(canvas, item.p_list[0][0], item.p_list[0][1], color))
+            drawn = i + 1
+            item.fill_inputs = self.fill_inputs(item, items[:i], size)  # 按填充后的区域记录
+
+    @staticmethod
+    def fill_inputs(fill, below, size):
+        """ 决定填充结果的输入：画布尺寸、种子点，以及下方包围盒与填充区域（向外扩展一个像素，即区域的边界）相交的各图元的
+        参数和颜色（填充图元为其区段的版本）；填充只检查区域及其边界上的像素，其它图元的变化不影响结果
+        :param below: (list of MyItem) 绘制顺序在fill之前的图元
+        """
+        inputs = [size, fill.p_version]
+        if fill.pixel_bounds is not None:
+            x0, y0, x1, y1 = fill.pixel_bounds
+            area = QRectF(x0 - 2, y0 - 2, x1 - x0 + 4, y1 - y0 + 4)
+            inputs += [(item, item.p_version, item.algorithm, item.poly_closed, item.pen_width, item.mov_dis,
+                        item.color.rgb(), item.fill_version) for item in below if item.boundingRect().intersects(area)]
+        return inputs
+
+    def apply_history(self, action):
+        """ 执行History.undo/redo返回的操作 """
+        if action is None:
+            return
+        self.clear_selection()
+        if action[0] == 'translate':
+            _, item_ids, dx, dy = action
+            items = [self.item_dict[i] for i in item_ids]
+            p_lists = batch.translate([item.p_list for item in items], dx, dy)
+            for item, p_list in zip(items, p_lists):
+                item.prepareGeometryChange()
+                item.p_list = p_list
+        else:
+            for item_id, state in action[1].items():
+                if state is None:
+                    self.delete_item(item_id)
+                    continue
+                item_type, p_list, algorithm, color, poly_closed, pen_width = state
+                if self.item_dict.__contains__(item_id):
+                    item = self.item_dict[item_id]
+                    item.prepareGeometryChange()
+                    item.p_list = list(p_list)
+                else:
+                    item = MyItem(item_id, item_type, list(p_list), color, algorithm)
+                    self.scene().addItem(item)
+                    self.item_dict[item_id] = item
+                    self.item_model.add_id(item_id)
+                item.poly_closed = poly_closed
+                item.pen_width = pen_width
+            if len(action[2]) > 0:  # 撤销删除：恢复的图元移回原来的位置，绘制和叠放顺序不变
+                order = restore_order(list(self.item_dict), action[2])
+                items = {item_id: self.item_dict[item_id] for item_id in order}
+                self.item_dict.clear()
+                self.item_dict.update(items)
+                rank = {item_id: i for i, item_id in enumerate(order)}
+                for i in sorted((rank[item_id] for item_id in action[2]), reverse=True):
+                    if i + 1 < len(order):  # 场景中叠放在后一个图元之下（从后往前，后一个图元已在正确的位置）
+                        items[order[i]].stackBefore(items[order[i + 1]])
+        self.refresh_fills()
+        self.updateScene([self.sceneRect()])
+
+    def undo(self):
+        """ 撤销 """
+        self.record('undo')
+        self.apply_history(self.history.undo())
+
+    def redo(self):
+        """ 重做 """
+        self.record('redo')
+        self.apply_history(self.history.redo())
+
+    def render_tile(self, level, tx, ty):
+        """ 绘制缩放级别level下的图块(tx, ty)：场景中以(tx, ty) * size为左上角、边长为size = TILE_SIZE / 2 ** level的区域
+        放大时先按场景像素绘制再把每个像素放大为方块，缩小时落在同一屏幕像素上的像素点以后绘制的图元为准
+        :return: (ndarray [TILE_SIZE, TILE_SIZE, 3], QImage) 图块及与之共享内存的QImage
+        """
+        size = TILE_SIZE >> level if level >= 0 else TILE_SIZE << -level
+        shift = max(-level, 0)  # 缩小时场景坐标到图块坐标的右移位数
+        x0, y0 = tx * size, ty * size
+        tile = np.full([size >> shift, size >> shift, 3], OUTSIDE_COLOR, np.uint8)
+        rect = self.sceneRect()
+        region = (max(x0, int(rect.left())), max(y0, int(rect.top())),
+                  min(x0 + size, int(rect.right())), min(y0 + size, int(rect.bottom())))  # 图块与画布相交的部分
+        if region[0] < region[2] and region[1] < region[3]:
+            tile[(region[1] - y0) >> shift:-(-(region[3] - y0) >> shift),
+                 (region[0] - x0) >> shift:-(-(region[2] - x0) >> shift)] = 255
+            # 由场景索引找出可能落在图块内的图元，按绘制顺序从下到上
+            for item in self.scene().items(QRectF(x0, y0, size, size), Qt.IntersectsItemBoundingRect, Qt.AscendingOrder):
+                if not isinstance(item, MyItem):
+                    continue
+                pixels = self.get_pixels(item)
+                if not intersects(item.pixel_bounds, region):
+                    continue
+                color = (item.color.red(), item.color.green(), item.color.blue())
+                if item.item_type == 'fill':  # 填充图元按区段绘制，区段裁剪到图块内后缩放到图块坐标
+                    spans = item.fill_spans
+                    spans = spans[(region[1] <= spans[:, 0]) & (spans[:, 0] < region[3])]
+                    x_start, x_end = np.maximum(spans[:, 1], region[0]), np.minimum(spans[:, 2], region[2] - 1)
+                    spans = np.stack([spans[:, 0] - y0, x_start - x0, x_end - x0], axis=1)[x_start <= x_end]
+                    batch.draw_spans(tile, spans >> shift, color)
+                    continue
+                x, y = pixels[:, 0], pixels[:, 1]
+                inside = (region[0] <= x) & (x < region[2]) & (region[1] <= y) & (y < region[3])
+                tile[(y[inside] - y0) >> shift, (x[inside] - x0) >> shift] = color
+        if level > 0:
+            tile = np.repeat(np.repeat(tile, 1 << level, axis=0), 1 << level, axis=1)
+        return tile, QImage(tile.data, TILE_SIZE, TILE_SIZE, 3 * TILE_SIZE, QImage.Format_RGB888)
+
+    def get_pixels(self, item):
+        """ 绘制图块时取图元的像素点：已提交图元的参数变化后交给后台线程光栅化，结果返回之前显示占位（见MyItem.placeholder）；
+        正在绘制或编辑的图元仍在这里同步光栅化（绘制/编辑中的曲线已降低精度） """
+        if item.raster_valid() or len(item.p_list) == 0 or self.item_dict.get(item.id) is not item or item.editing:
+            return item.rasterize()
+        self.request_raster(item)
+        return item.placeholder()
+
+    def request_raster(self, item):
+        """ 提交图元当前参数的后台光栅化任务，已提交过相同参数的任务时什么也不做 """
+        key = item.get_raster_key()
+        if item.raster_task is not None:
+            if item.raster_task.key == key:
+                return
+            if self.raster_pool.tryTake(item.raster_task):  # 过时的任务尚未开始，直接取消
+                self.raster_tasks.remove(item.raster_task)
+        item.raster_gen += 1
+        task = RasterTask(item, item.raster_gen, key)
+        task.signals.finished.connect(lambda pixels, pieces: self.raster_finished(task, pixels, pieces))
+        item.raster_task = task
+        self.raster_tasks.append(task)
+        self.raster_pool.start(task)
+
+    def raster_finished(self, task, pixels, pieces):
+        """ 后台光栅化完成：丢弃过时的结果（图元在光栅化期间又变化了，或已被同步光栅化），否则更新图元并重绘占位和结果所在的区域 """
+        self.raster_tasks.remove(task)
+        item = task.item
+        if task.generation != item.raster_gen:
+            return
+        item.raster_task = None
+        if item.raster_valid() or item.scene() is None:
+            return
+        old_bounds = item.pixel_bounds
+        item.set_base_pixels(task.key, pixels)
+        item.piece_cache = pieces
+        item.rasterize()
+        region = union_region(old_bounds, item.pixel_bounds)
+        if region is not None:
+            self.scene().update(QRectF(region[0], region[1], region[2] - region[0], region[3] - region[1]))
+
+    def get_tile(self, level, tx, ty):
+        """ 取图块对应的QImage，不在缓存中时绘制，缓存满时丢弃最久未使用的图块 """
+        key = (level, tx, ty)
+        tile = self.tile_cache.get(key)
+        if tile is None:
+            tile = self.render_tile(level, tx, ty)
+            self.tile_cache[key] = tile
+            if len(self.tile_cache) > self.tile_limit:
+                self.tile_cache.popitem(last=False)
+        else:
+            self.tile_cache.move_to_end(key)
+        return tile[1]
+
+    def invalidate_tiles(self, rects):
+        """ 场景内容变化时（QGraphicsScene.changed），丢弃各缩放级别下与变化区域相交的图块 """
+        if len(self.tile_cache) == 0:
+            return
+        levels = {key[0] for key in self.tile_cache}
+        dirty = set()
+        for rect in rects:
+            for level in levels:
+                size = TILE_SIZE / 2 ** level
+                tx0, ty0 = math.floor((rect.left() - 2) / size), math.floor((rect.top() - 2) / size)
+                tx1, ty1 = math.floor((rect.right() + 2) / size), math.floor((rect.bottom() + 2) / size)
+                if (tx1 - tx0 + 1) * (ty1 - ty0 + 1) > len(self.tile_cache):  # 区域很大时直接检查缓存中的图块
+                    dirty.update(key for key in self.tile_cache
+                                 if key[0] == level and tx0 <= key[1] <= tx1 and ty0 <= key[2] <= ty1)
+                else:
+                    dirty.update((level, tx, ty) for tx in range(tx0, tx1 + 1) for ty in range(ty0, ty1 + 1))
+        for key in dirty:
+            self.tile_cache.pop(key, None)
+
+    def drawBackground(self, painter: QPainter, rect: QRectF) -> None:
+        """ 绘制背景：拼接当前缩放级别下覆盖rect的图块，只有新露出或内容变化的图块才需要绘制 """
+        size = TILE_SIZE / 2 ** self.zoom_level
+        transform = painter.transform()
+        painter.save()
+        painter.resetTransform()  # 图块与屏幕像素一一对应，直接按屏幕坐标绘制，避免缩放
+        for ty in range(math.floor(rect.top() / size), math.ceil(rect.bottom() / size)):
+            for tx in range(math.floor(rect.left() / size), math.ceil(rect.right() / size)):
+                pos = transform.map(QPointF(tx * size, ty * size))
+                painter.drawImage(round(pos.x()), round(pos.y()), self.get_tile(self.zoom_level, tx, ty))
+        painter.restore()
+
+    def set_zoom(self, level):
+        """ 设置缩放级别（显示比例为2 ** level），鼠标在画布上时以鼠标位置为中心缩放 """
+        level = min(max(level, ZOOM_MIN), ZOOM_MAX)
+        if level != self.zoom_level:
+            self.record_event('zoom', level)
+            self.zoom_level = level
+            self.setTransform(QTransform.fromScale(2 ** level, 2 ** level))
+
+    def scrolled(self):
+        """ 画面滚动（滚动条、滚轮、中键拖动或缩放） """
+        self.record_event('scroll', self.horizontalScrollBar().value(), self.verticalScrollBar().value())
+
+    def wheelEvent(self, event: QWheelEvent) -> None:
+        """ Ctrl+滚轮缩放，滚轮滚动画面 """
+        if event.modifiers() == Qt.ControlModifier:
+            self.set_zoom(self.zoom_level + (1 if event.angleDelta().y() > 0 else -1))
+        else:
+            super().wheelEvent(event)
+
+    def get_snapshot(self):
+        """ 已提交图元的不可变快照：[(item_type, p_list, algorithm, poly_closed, pen_width, color, pixels), ...]
+        光栅化结果仍有效时一并带上（pixels只会被整体替换，不会被原地修改），否则pixels为None """
+        snapshot = []
         for item in self.item_dict.values():
-            pixels = item.item_pixels
-            for x, y in pixels:
-                if 0 <= x < 600 and 0 <= y < 600:  # 不绘制出界部分
-                    canvas[y, x] = np.array([item.color.red(), item.color.green(), item.color.blue()])
-        output_dir = '../outputs'
-        os.makedirs(output_dir, exist_ok=True)
-        Image.fromarray(canvas).save(os.path.join(output_dir, filename), 'bmp')
+            p_list = tuple(item.p_list)
+            pixels = item.base_pixels if item.raster_key == (p_list, item.algorithm, item.poly_closed, 0, item.pen_width) else None
+            color = (item.color.red(), item.color.green(), item.color.blue())
+            snapshot.append((item.item_type, p_list, item.algorithm, item.poly_closed, item.pen_width, color, pixels))
+        return snapshot
+
+    def save_all(self, filename):
+        """ 在后台线程中导出画布（尺寸与场景一致），进度和结果通过export_*信号通知 """
+        self.record('saveCanvas', os.path.splitext(filename)[0])
+        rect = self.sceneRect()
+        task = ExportTask(self.get_snapshot(), (int(rect.width()), int(rect.height())),
+                          os.path.join(self.output_dir, filename))
+        task.signals.progress.connect(self.export_progress)
+        task.signals.finished.connect(self.export_finished)
+        task.signals.failed.connect(self.export_failed)
+        task.signals.finished.connect(lambda path: self.export_tasks.remove(task))
+        task.signals.failed.connect(lambda error: self.export_tasks.remove(task))
+        self.export_tasks.append(task)
+        self.thread_pool.start(task)
 
     def mousePressEvent(self, event: QMouseEvent) -> None:
         """ 按下鼠标时的动作 """
-        if event.button() == Qt.LeftButton:
+        self.flush_move()
+        pos = self.mapToScene(event.localPos().toPoint())
+        self.record_event('press', int(pos.x()), int(pos.y()), int(event.button()), int(event.modifiers()))
+        if event.button() == Qt.MiddleButton:  # 中键：拖动画面
+            self.pan_pos = event.pos()
+        elif event.button() == Qt.LeftButton:
             # 左键：开始绘制，或选择图元
             pos = self.mapToScene(event.localPos().toPoint())
             x = int(pos.x())
@@ -168,13 +737,27 @@ class MyCanvas(QGraphicsView):
                 if self.is_editing:  # 选择锚点（编辑模式）
                     self.press_pos = (x, y)
                     self.item_dict[self.selected_id].set_rect_key((x, y))
-                else:  # 选择图元（非编辑模式）
-                    for item in self.item_dict.values():
-                        if item.judge_select((x, y)):
-                            select_items = self.list_widget.findItems(item.id, Qt.MatchExactly)
-                            if select_items and len(select_items) > 0:
-                                self.list_widget.setCurrentItem(select_items[0])
+                    self.edit_before = self.item_dict[self.selected_id].get_state()
+                else:  # 选择图元（非编辑模式），按住Ctrl可多选
+                    is_multi = event.modifiers() == Qt.ControlModifier
+                    # 只检查选择框在点击位置附近的图元（由场景索引查找），按绘制顺序从下到上
+                    candidates = self.scene().items(QRectF(x - 2, y - 2, 4, 4), Qt.IntersectsItemBoundingRect,
+                                                    Qt.AscendingOrder)
+                    for item in candidates:
+                        if isinstance(item, MyItem) and self.item_dict.get(item.id) is item and item.judge_select((x, y)):
+                            index = self.item_model.index_of(item.id)
+                            if is_multi:
+                                self.list_view.selectionModel().select(index, QItemSelectionModel.Select)
+                                if item.id not in self.selected_ids:
+                                    self.multi_selection_changed(self.selected_ids + [item.id])
+                            else:
+                                self.list_view.setCurrentIndex(index)
                                 self.selection_changed(item.id)
+            elif self.status == 'fill':
+                # 填充状态 --> 以点击位置为种子点填充
+                item = MyItem('Fill' + str(self.get_item_no()), self.status, [(x, y)], self.temp_color)
+                self.scene().addItem(item)
+                self.add_item(item)
             elif self.status == 'clip':
                 # 线段裁剪状态 --> 画一个矩形裁剪框
                 self.temp_item = MyItem('', 'polygon', [(x, y), (x, y), (x, y), (x, y)], QColor(255, 0, 0), 'DDA')
@@ -185,12 +768,14 @@ class MyCanvas(QGraphicsView):
                 self.is_drawing = True
                 self.temp_id = 'Line' + str(self.get_item_no())
                 self.temp_item = MyItem(self.temp_id, self.status, [(x, y), (x, y)], self.temp_color, self.temp_algorithm)
+                self.temp_item.pen_width = self.temp_width
                 self.scene().addItem(self.temp_item)
             elif self.status == 'ellipse':
                 # 椭圆绘制状态 --> 选定长方形边界的左上角/右下角
                 self.is_drawing = True
                 self.temp_id = 'Ellipse' + str(self.get_item_no())
                 self.temp_item = MyItem(self.temp_id, self.status, [(x, y), (x, y)], self.temp_color)
+                self.temp_item.pen_width = self.temp_width
                 self.scene().addItem(self.temp_item)
             elif self.status == 'polygon' or self.status == 'curve':
                 # 多边形绘制状态 --> 确定多边形的一个顶点 / 曲线绘制状态 --> 确定曲线的一个控制点
@@ -201,26 +786,27 @@ class MyCanvas(QGraphicsView):
                         self.temp_id = 'Curve' + str(self.get_item_no())
                     # 先添加第一个和第二个顶点/控制点
                     self.temp_item = MyItem(self.temp_id, self.status, [(x, y), (x, y)], self.temp_color, self.temp_algorithm)
+                    self.temp_item.pen_width = self.temp_width
                     self.scene().addItem(self.temp_item)
                     self.setMouseTracking(True)
                     self.temp_v += 1
                 else:  # 其他顶点/控制点
+                    self.temp_item.prepareGeometryChange()
                     self.temp_item.p_list[self.temp_v] = (x, y)  # 确认当前顶点/控制点
+                    self.temp_item.p_list_changed()
                     self.temp_v += 1
                     if self.temp_v >= self.temp_vnum:  # 所有顶点/控制点绘制结束
-                        self.item_dict[self.temp_id] = self.temp_item
-                        # 如果列表中没有重复项，加入
-                        same_items = self.list_widget.findItems(self.temp_id, Qt.MatchExactly)
-                        if not same_items or len(same_items) == 0:
-                            self.list_widget.addItem(self.temp_id)
+                        self.add_item(self.temp_item)
                         self.setMouseTracking(False)
                         self.is_drawing = False
                         self.status = ''
                         self.main_window.statusBar().showMessage('空闲')
                     else:
                         self.temp_item.p_list.append((x, y))  # 添加下一个顶点/控制点
+                        self.temp_item.p_list_changed()
                         if self.status == 'polygon' and self.temp_v == self.temp_vnum - 1:  # 多边形的最后一个顶点，则闭合多边形
                             self.temp_item.poly_closed = True
+                            self.temp_item.update()
         elif event.button() == Qt.RightButton:
             # 右键：停止绘制并取消一切选择(非编辑模式)
             if not self.is_drawing and not self.is_editing:
@@ -231,10 +817,78 @@ class MyCanvas(QGraphicsView):
         super().mousePressEvent(event)
 
     def mouseMoveEvent(self, event: QMouseEvent) -> None:
-        """ 鼠标按住后移动时的动作 """
+        """ 鼠标按住后移动时的动作：只记录最新位置，由帧定时器按屏幕刷新率统一处理 """
+        if self.pan_pos is not None:  # 中键拖动画面
+            delta = event.pos() - self.pan_pos
+            self.pan_pos = event.pos()
+            self.horizontalScrollBar().setValue(self.horizontalScrollBar().value() - delta.x())
+            self.verticalScrollBar().setValue(self.verticalScrollBar().value() - delta.y())
+            return
         pos = self.mapToScene(event.localPos().toPoint())
-        x = int(pos.x())
-        y = int(pos.y())
+        self.move_pos = (int(pos.x()), int(pos.y()))
+        self.record_event('move', *self.move_pos)
+        if not self.frame_timer.isActive():
+            self.frame_timer.start()
+        super().mouseMoveEvent(event)
+
+    def frame_tick(self):
+        """ 帧定时器：处理这一帧内最近一次鼠标移动，没有新的移动时停止 """
+        if self.move_pos is None:
+            self.frame_timer.stop()
+        else:
+            self.flush_move()
+
+    def get_preview_item(self):
+        """ 鼠标移动时会改变的图元：编辑模式下为选中图元，绘制/裁剪时为正在绘制的图元/裁剪框 """
+        if self.is_editing:
+            return self.item_dict[self.selected_id]
+        elif self.temp_item is None or self.temp_item.scene() is None or self.item_dict.get(self.temp_item.id) is self.temp_item:
+            return None  # 没有正在绘制的图元（temp_item已绘制完成或已移除）
+        elif self.status == 'clip' or ((self.status == 'line' or self.status == 'ellipse') and self.is_drawing):
+            return self.temp_item
+        elif (self.status == 'polygon' or self.status == 'curve') and self.temp_v > 0:
+            return self.temp_item
+        return None
+
+    def flush_move(self):
+        """ 立即处理尚未处理的鼠标移动，只重绘预览图元变化前后的区域 """
+        if self.move_pos is None:
+            return
+        x, y = self.move_pos
+        self.move_pos = None
+        item = self.get_preview_item()
+        if item is None:
+            return
+        old_rect = item.boundingRect()
+        item.prepareGeometryChange()
+        self.move_preview(x, y)
+        self.start_lod(item)
+        new_rect = item.boundingRect()
+        self.updateScene([old_rect.united(new_rect).adjusted(-5, -5, 5, 5)])  # 包括编辑锚点
+
+    def start_lod(self, item):
+        """ 正在绘制或移动顶点的曲线降低精度，鼠标停止移动后恢复；逐段光栅化的B样条曲线每次只需重新光栅化相邻的几段，无需降低精度 """
+        if item.item_type != 'curve' or len(item.p_list) < LOD_THRESHOLD or uses_pieces(item.item_type, item.p_list, item.algorithm, item.pen_width):
+            return
+        if self.is_editing and not 0 <= item.edit_rect_key < len(item.p_list):
+            return  # 整体拖动直接平移已有的像素点，无需降低精度
+        if self.lod_item is not None and self.lod_item is not item:
+            self.end_lod()
+        item.lod_samples = LOD_SAMPLES
+        self.lod_item = item
+        self.lod_timer.start()
+
+    def end_lod(self):
+        """ 恢复完整精度 """
+        self.lod_timer.stop()
+        if self.lod_item is not None:
+            self.lod_item.lod_samples = 0
+            self.lod_item.update()
+            self.updateScene([self.lod_item.boundingRect()])
+            self.lod_item = None
+
+    def move_preview(self, x, y):
+        """ 根据鼠标位置更新预览图元 """
         if self.is_editing:  # 移动锚点（编辑模式）
             selected_item = self.item_dict[self.selected_id]
             rect_key = selected_item.edit_rect_key
@@ -265,53 +919,63 @@ class MyCanvas(QGraphicsView):
                     dx = x - self.press_pos[0]
                     dy = y - self.press_pos[1]
                     selected_item.mov_dis = (dx, dy)
+            selected_item.p_list_changed()
         elif self.status == 'clip':  # 线段裁剪框绘制
             x0, y0 = self.temp_item.p_list[0]
             self.temp_item.p_list[1] = (x0, y)
             self.temp_item.p_list[2] = (x, y)
             self.temp_item.p_list[3] = (x, y0)
+            self.temp_item.p_list_changed()
         elif self.status == 'line' or self.status == 'ellipse':
             self.temp_item.p_list[1] = (x, y)
+            self.temp_item.p_list_changed()
         elif self.status == 'polygon' or self.status == 'curve':
             self.temp_item.p_list[self.temp_v] = (x, y)
-        self.updateScene([self.sceneRect()])
-        super().mouseMoveEvent(event)
+            self.temp_item.p_list_changed()
 
     def mouseReleaseEvent(self, event: QMouseEvent) -> None:
         """ 释放鼠标时的动作 """
-        if event.button() == Qt.LeftButton:
+        self.flush_move()
+        pos = self.mapToScene(event.localPos().toPoint())
+        self.record_event('release', int(pos.x()), int(pos.y()), int(event.button()), int(event.modifiers()))
+        if event.button() == Qt.MiddleButton:
+            self.pan_pos = None
+        elif event.button() == Qt.LeftButton:
             if self.is_editing:  # 停止移动锚点（编辑模式）
                 selected_item = self.item_dict[self.selected_id]
                 for v in range(len(selected_item.p_list)):
                     sx, sy = selected_item.p_list[v]
                     dx, dy = selected_item.mov_dis
                     selected_item.p_list[v] = (sx + dx, sy + dy)
+                selected_item.p_list_changed()
                 selected_item.mov_dis = (0, 0)
                 selected_item.edit_rect_key = -1
-            elif self.status == 'clip':  # 裁剪并删除线段裁剪框
-                selected_line = self.item_dict[self.selected_id]
+                self.end_lod()
+                if self.edit_before is not None:
+                    if self.edit_before != selected_item.get_state():
+                        self.history.record([(selected_item.id, self.edit_before, selected_item.get_state())])
+                        if self.recorder is not None:
+                            self.recorder.draw(selected_item)
+                        self.refresh_fills()
+                    self.edit_before = None
+            elif self.status == 'clip':  # 裁剪（所有选中线段）并删除线段裁剪框
                 x_min, y_min = self.temp_item.p_list[0]
                 x_max, y_max = self.temp_item.p_list[2]
-                selected_line.p_list = alg.clip(selected_line.p_list, x_min, y_min, x_max, y_max, self.temp_algorithm)
                 self.scene().removeItem(self.temp_item)
-                # 如果线段裁剪没了，从图元列表中移除
-                if len(selected_line.p_list) == 0:
-                    self.delete_selected_item()
+                self.clip_selected_item(x_min, y_min, x_max, y_max, self.temp_algorithm)
+                if not self.is_valid_selection():
                     self.status = ''
                     self.main_window.statusBar().showMessage('空闲')
             elif self.status == 'line' or self.status == 'ellipse':
                 # 完成一个直线/椭圆的绘制
-                self.item_dict[self.temp_id] = self.temp_item
-                # 如果列表中没有重复项，加入
-                same_items = self.list_widget.findItems(self.temp_id, Qt.MatchExactly)
-                if not same_items or len(same_items) == 0:
-                    self.list_widget.addItem(self.temp_id)
+                self.add_item(self.temp_item)
                 self.is_drawing = False
         self.updateScene([self.sceneRect()])
         super().mouseReleaseEvent(event)
 
     def keyPressEvent(self, event: QKeyEvent) -> None:
         """ 一些键盘指令 """
+        self.record_event('key', int(event.key()), int(event.modifiers()))
         if self.is_editing:  # 编辑模式
             if event.key() == Qt.Key_Return or event.key() == Qt.Key_Enter:
                 # Enter/Return: 停止编辑
@@ -319,15 +983,15 @@ class MyCanvas(QGraphicsView):
                     self.main_window.statusBar().showMessage('图元选择： %s  (Ctrl+T[Win]/Cmd+T[Mac]进入编辑模式)' % self.selected_id)
                     self.is_editing = False
                     self.item_dict[self.selected_id].editing = False
-                    self.list_widget.setDisabled(False)
+                    self.list_view.setDisabled(False)
         else:  # 非编辑模式
-            if event.key() == Qt.Key_T and QApplication.keyboardModifiers() == Qt.ControlModifier:
+            if event.key() == Qt.Key_T and event.modifiers() == Qt.ControlModifier:
                 # Ctrl + T (Win) / Command + T (Mac): 编辑当前选中的图元，编辑模式禁止改变选中的图元
                 if self.status == '' and self.is_valid_selection():
                     self.main_window.statusBar().showMessage('图元编辑： %s  (回车退出编辑模式)' % self.selected_id)
                     self.is_editing = True
                     self.item_dict[self.selected_id].editing = True
-                    self.list_widget.setDisabled(True)
+                    self.list_view.setDisabled(True)
             elif event.key() == Qt.Key_Delete or event.key() == Qt.Key_Backspace:
                 # Delete/Backspace: 删除图元（非编辑模式）
                 self.delete_selected_item()
@@ -343,63 +1007,155 @@ class MyItem(QGraphicsItem):
                  parent: QGraphicsItem = None):
         """
         :param item_id: 图元ID
-        :param item_type: 图元类型，'line'、'polygon'、'ellipse'、'curve'等
-        :param p_list: 图元参数
+        :param item_type: 图元类型，'line'、'polygon'、'ellipse'、'curve'、'fill'等
+        :param p_list: 图元参数，填充图元为[种子点]
         :param algorithm: 绘制算法，'DDA'、'Bresenham'、'Bezier'、'B-spline'等
         :param parent:
         """
         super().__init__(parent)
         self.id = item_id             # 图元ID
         self.item_type = item_type    # 图元类型，'line'、'polygon'、'ellipse'、'curve'等
+        self.p_version = 0            # p_list的版本，替换p_list或原地修改后（见p_list_changed）加一
         self.p_list = p_list          # 图元参数
         self.algorithm = algorithm    # 绘制算法，'DDA'、'Bresenham'、'Bezier'、'B-spline'等
         self.color = color            # 画笔颜色
         self.selected = False         # 图元是否被选中
         self.editing = False          # 图元是否正在被编辑
-        self.item_pixels = []         # 图元的所有像素点，为列表内元组：[(x1,y1), (x2,y2), ...]
+        self.base_pixels = np.zeros([0, 2], np.int64)  # 按p_list光栅化得到的像素点(ndarray [N, 2])，不含编辑位移
+        self.base_bounds = None       # base_pixels的包围盒(x0, y0, x1, y1)，左闭右开，无像素点时为None
+        self.raster_key = None        # 上次光栅化时的图元参数，未变化则复用base_pixels
+        self.pixel_array = self.base_pixels  # 图元实际显示的像素点(ndarray [N, 2])，即base_pixels加上编辑位移
+        self.pixel_bounds = None      # pixel_array的包围盒
+        self.pixel_dis = (0, 0)       # pixel_array相对base_pixels的位移
+        self.lod_samples = 0          # 曲线每段的采样数，绘制/编辑中由画布调低，0表示完整精度
         self.rect_dict = {}           # 图元的可编辑锚点
         self.edit_rect_key = -1       # 当前如果处于编辑状态，正在编辑的锚点
         self.mov_dis = (0, 0)         # 当前如果处于编辑状态，图元位移
         self.poly_closed = False      # 图元如果是多边形，是否闭合
+        self.pen_width = 1            # 线宽（像素），填充图元忽略
+        self.fill_spans = np.zeros([0, 3], np.int64)  # 图元如果是填充，填充的区段(ndarray [M, 3])，由画布计算
+        self.fill_version = 0         # fill_spans的版本，区段变化时加一
+        self.fill_inputs = None       # 上次计算fill_spans时的输入，见MyCanvas.fill_inputs
+        self.raster_gen = 0           # 后台光栅化的代数，每提交一次光栅化任务加一，结果返回时代数不同则已过时
+        self.raster_task = None       # 尚未返回的后台光栅化任务
+        self.piece_cache = {}         # 逐条边/逐段光栅化的结果，见rasterize_pieces
+        self.p_bounds = (-1, None)    # 包围盒及计算时p_list的版本，用于boundingRect
+
+    @property
+    def p_list(self):
+        return self._p_list
+
+    @p_list.setter
+    def p_list(self, p_list):
+        self._p_list = p_list
+        self.p_version += 1
+
+    def p_list_changed(self):
+        """ 原地修改p_list后调用 """
+        self.p_version += 1
+
+    def get_raster_key(self):
+        """ 决定光栅化结果的图元参数 """
+        return tuple(self.p_list), self.algorithm, self.poly_closed, self.lod_samples, self.pen_width
+
+    def raster_valid(self) -> bool:
+        """ 上次的光栅化结果是否仍有效（填充图元没有像素点，总是有效） """
+        return self.item_type == 'fill' or self.raster_key == self.get_raster_key()
+
+    def set_base_pixels(self, key, pixels):
+        """ 设置按图元参数key光栅化得到的像素点（同步光栅化或后台光栅化的结果） """
+        self.base_pixels = pixels
+        if len(pixels) > 0:
+            x0, y0 = pixels.min(axis=0).tolist()
+            x1, y1 = pixels.max(axis=0).tolist()
+            self.base_bounds = (x0, y0, x1 + 1, y1 + 1)
+        else:
+            self.base_bounds = None
+        self.raster_key = key
+        self.pixel_dis = None  # pixel_array需要重新计算
+
+    def rasterize(self):
+        """ 将图元转化为像素点：图元参数未变化时复用上次的结果，编辑模式下的整体拖动只平移已有的像素点，松开鼠标后才重新光栅化 """
+        if self.item_type == 'fill':  # 填充图元只有区段，没有像素点
+            return self.pixel_array
+        key = self.get_raster_key()
+        mov_dis = self.mov_dis if self.editing else (0, 0)
+        if key != self.raster_key:
+            if uses_pieces(self.item_type, self.p_list, self.algorithm, self.pen_width):
+                pixels, self.piece_cache = rasterize_pieces(self.item_type, self.p_list, self.algorithm, self.poly_closed,
+                                                            self.lod_samples, self.piece_cache)
+            else:
+                pixels = rasterize(self.item_type, self.p_list, self.algorithm, self.poly_closed, self.lod_samples,
+                                   self.pen_width)
+                self.piece_cache = {}
+            self.set_base_pixels(key, pixels)
+        elif mov_dis == self.pixel_dis:
+            return self.pixel_array
+        dx, dy = mov_dis
+        if dx == 0 and dy == 0:
+            self.pixel_array = self.base_pixels
+            self.pixel_bounds = self.base_bounds
+        else:  # 整体拖动：平移像素点，不修改base_pixels（导出快照可能正在使用）
+            self.pixel_array = self.base_pixels + np.array([dx, dy], np.int64)
+            if self.base_bounds is not None:
+                x0, y0, x1, y1 = self.base_bounds
+                self.pixel_bounds = (x0 + dx, y0 + dy, x1 + dx, y1 + dy)
+            else:
+                self.pixel_bounds = None
+        self.pixel_dis = mov_dis
+        return self.pixel_array
+
+    def placeholder(self):
+        """ 等待后台光栅化时显示的占位：上一次的光栅化结果仍在图元选择框内时沿用，否则为选择框内侧的边框 """
+        rect = self.boundingRect()
+        x0, y0, x1, y1 = int(rect.left()) + 1, int(rect.top()) + 1, int(rect.right()) - 1, int(rect.bottom()) - 1
+        bounds = self.pixel_bounds
+        if self.raster_key is not None and self.pixel_dis is not None and \
+                (bounds is None or (x0 <= bounds[0] and y0 <= bounds[1] and bounds[2] <= x1 + 1 and bounds[3] <= y1 + 1)):
+            return self.pixel_array
+        xs, ys = np.arange(x0, x1 + 1), np.arange(y0, y1 + 1)
+        self.pixel_array = np.concatenate([np.stack([xs, np.full_like(xs, y0)], axis=1), np.stack([xs, np.full_like(xs, y1)], axis=1),
+                                           np.stack([np.full_like(ys, x0), ys], axis=1), np.stack([np.full_like(ys, x1), ys], axis=1)])
+        self.pixel_bounds = (x0, y0, x1 + 1, y1 + 1)
+        self.pixel_dis = None  # 不是光栅化结果，光栅化完成后需要重新计算
+        return self.pixel_array
+
+    def set_fill_spans(self, spans):
+        """ 更新填充图元的区段（见MyCanvas.refresh_fills），区段未变化时什么也不做 """
+        if np.array_equal(spans, self.fill_spans):
+            return
+        self.prepareGeometryChange()
+        self.fill_spans = spans
+        self.fill_version += 1
+        if len(spans) > 0:
+            self.pixel_bounds = (int(spans[:, 1].min()), int(spans[0, 0]), int(spans[:, 2].max()) + 1, int(spans[-1, 0]) + 1)
+        else:
+            self.pixel_bounds = None
+        self.update()
 
     def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: Optional[QWidget] = ...) -> None:
-        """ 图元绘制，每当update时调用 """
+        """ 图元绘制，每当update时调用；像素点由画布合成到图块中（见MyCanvas.render_tile），这里只绘制选择框和锚点 """
         if len(self.p_list) == 0: return  # 无效图元
-        p_list_real = []
-        if self.editing:  # 编辑模式，有位移
-            for v in range(len(self.p_list)):
-                x, y = self.p_list[v]
-                p_list_real.append((x + self.mov_dis[0], y + self.mov_dis[1]))
-        else:  # 非编辑模式，直接用p_list
-            p_list_real = self.p_list
-        if self.item_type == 'line':
-            self.item_pixels = alg.draw_line(p_list_real, self.algorithm)
-        elif self.item_type == 'polygon':
-            self.item_pixels = alg.draw_polygon(p_list_real, self.algorithm, self.poly_closed)
-        elif self.item_type == 'ellipse':
-            self.item_pixels = alg.draw_ellipse(p_list_real)
-        elif self.item_type == 'curve':
-            self.item_pixels = alg.draw_curve(p_list_real, self.algorithm)
-        for p in self.item_pixels:
-            painter.setPen(self.color)
-            painter.drawPoint(*p)
         if self.selected:
             painter.setPen(QColor(255, 0, 0))
             if self.editing:
                 self.get_rect_dict()
-                for rect in self.rect_dict.values():
-                    painter.drawRect(rect)
+                painter.drawRects(list(self.rect_dict.values()))
             else:
                 painter.drawRect(self.boundingRect())
 
+    def get_state(self):
+        """ 图元的不可变状态，用于撤销/重做（点坐标元组与图元共享） """
+        return self.item_type, tuple(self.p_list), self.algorithm, self.color, self.poly_closed, self.pen_width
+
     def judge_select(self, press_pos) -> bool:
         """ 在画布中直接用鼠标选择图元时，判定图元是否被点击 """
-        for p in self.item_pixels:
-            dx = abs(p[0] - press_pos[0])
-            dy = abs(p[1] - press_pos[1])
-            if dx * dx + dy * dy <= 4:
-                return True
-        return False
+        if self.item_type == 'fill':  # 点击位置在填充的区段内
+            x, y = press_pos
+            spans = self.fill_spans
+            return bool(np.any((spans[:, 0] == y) & (spans[:, 1] <= x) & (x <= spans[:, 2])))
+        d = self.pixel_array - np.array(press_pos, np.int64)
+        return bool(np.any((d * d).sum(axis=1) <= 4))
 
     def get_rect_dict(self):
         """ 图元编辑锚点 """
@@ -435,6 +1191,12 @@ class MyItem(QGraphicsItem):
                 return
         self.edit_rect_key = -1
 
+    def scalable(self) -> bool:
+        """ 能否缩放：填充图元缩放时只移动种子点，总能缩放；其它图元的前两个点重合（一个像素点）时不能缩放 """
+        if self.item_type == 'fill':
+            return True
+        return tuple(self.p_list[0]) != tuple(self.p_list[1])
+
     def get_center(self):
         xsum, ysum = 0, 0
         num = len(self.p_list)
@@ -444,25 +1206,206 @@ class MyItem(QGraphicsItem):
         return [round(xsum / num), round(ysum / num)]
 
     def boundingRect(self) -> QRectF:
-        """ 图元选择框 """
+        """ 图元选择框（编辑模式下包括位移，粗线包括超出中心线的半个线宽） """
         if len(self.p_list) == 0: return QRectF()  # 无效图元
-        if self.item_type == 'line' or self.item_type == 'ellipse':
-            x0, y0 = self.p_list[0]
-            x1, y1 = self.p_list[1]
-            x = min(x0, x1)
-            y = min(y0, y1)
-            w = max(x0, x1) - x
-            h = max(y0, y1) - y
-            return QRectF(x - 1, y - 1, w + 2, h + 2)
-        elif self.item_type == 'polygon' or self.item_type == 'curve':
-            xmax, ymax = self.p_list[0]
-            xmin, ymin = self.p_list[0]
-            for (x, y) in self.p_list:
-               xmax = max(x, xmax)
-               ymax = max(y, ymax)
-               xmin = min(x, xmin)
-               ymin = min(y, ymin)
-            return QRectF(xmin - 1, ymin - 1, xmax - xmin + 2, ymax - ymin + 2)
+        if self.item_type == 'fill' and self.pixel_bounds is not None:  # 填充图元为填充区域的包围盒
+            x0, y0, x1, y1 = self.pixel_bounds
+            return QRectF(x0 - 1, y0 - 1, x1 - x0 + 1, y1 - y0 + 1)
+        if self.p_version != self.p_bounds[0]:  # 每次重绘都会多次调用，只在p_list变化后重新计算
+            xs, ys = zip(*self.p_list)
+            self.p_bounds = self.p_version, (min(xs), min(ys), max(xs), max(ys))
+        xmin, ymin, xmax, ymax = self.p_bounds[1]
+        m = 1 + self.pen_width // 2
+        return QRectF(xmin - m, ymin - m, xmax - xmin + 2 * m, ymax - ymin + 2 * m).translated(*self.mov_dis)
+
+
+class ExportSignals(QObject):
+    """
+    导出任务的信号（QRunnable不是QObject，不能直接定义信号）
+    """
+    progress = pyqtSignal(int)  # 进度（%）
+    finished = pyqtSignal(str)  # 完成，参数为保存路径
+    failed = pyqtSignal(str)    # 失败，参数为错误信息
+
+
+class ExportTask(QRunnable):
+    """
+    后台导出任务：根据图元快照合成画布并保存为位图，不访问画布和图元本身，导出期间可以继续编辑
+    """
+    def __init__(self, snapshot: list, size: tuple, path: str):
+        """
+        :param snapshot: 图元快照，见MyCanvas.get_snapshot
+        :param size: 画布尺寸(w, h)
+        :param path: 保存路径
+        """
+        super().__init__()
+        self.setAutoDelete(False)  # 由MyCanvas.export_tasks持有，完成后释放
+        self.snapshot = snapshot
+        self.size = size
+        self.path = path
+        self.signals = ExportSignals()
+
+    def run(self) -> None:
+        try:
+            w, h = self.size
+            canvas = np.full([h, w, 3], 255, np.uint8)
+            num = len(self.snapshot)
+            progress = -1
+            for i, (item_type, p_list, algorithm, poly_closed, pen_width, color, pixels) in enumerate(self.snapshot):
+                if item_type == 'fill':  # 填充：在已合成的画布上从种子点填充
+                    batch.fill(canvas, p_list[0][0], p_list[0][1], color)
+                else:
+                    if pixels is None:
+                        pixels = rasterize(item_type, p_list, algorithm, poly_closed, 0, pen_width)
+                    batch.draw_pixels(canvas, pixels, color)
+                if (i + 1) * 100 // num > progress:
+                    progress = (i + 1) * 100 // num
+                    self.signals.progress.emit(progress)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            Image.fromarray(canvas).save(self.path, 'bmp')
+            self.signals.finished.emit(self.path)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+
+
+class RasterSignals(QObject):
+    """
+    光栅化任务的信号
+    """
+    finished = pyqtSignal(object, object)  # 完成，参数为像素点(ndarray [N, 2])及各边/段的光栅化结果（见rasterize_pieces）
+
+
+class RasterTask(QRunnable):
+    """
+    后台光栅化任务：按提交时图元参数的快照光栅化，不访问图元本身
+    """
+    def __init__(self, item, generation: int, key: tuple):
+        """
+        :param item: 图元，只用于把结果交回画布
+        :param generation: 提交时图元的光栅化代数（MyItem.raster_gen）
+        :param key: 图元参数的快照，见MyItem.get_raster_key
+        """
+        super().__init__()
+        self.setAutoDelete(False)  # 由MyCanvas.raster_tasks持有，完成后释放
+        self.item = item
+        self.item_type = item.item_type
+        self.generation = generation
+        self.key = key
+        self.piece_cache = item.piece_cache  # 只读；画布总是整体替换图元的piece_cache，不会原地修改
+        self.signals = RasterSignals()
+
+    def run(self) -> None:
+        p_list, algorithm, poly_closed, lod_samples, pen_width = self.key
+        if uses_pieces(self.item_type, p_list, algorithm, pen_width):
+            pixels, pieces = rasterize_pieces(self.item_type, p_list, algorithm, poly_closed, lod_samples, self.piece_cache)
+        else:
+            pixels, pieces = rasterize(self.item_type, p_list, algorithm, poly_closed, lod_samples, pen_width), {}
+        self.signals.finished.emit(pixels, pieces)
+
+
+class ItemListModel(QAbstractListModel):
+    """
+    图元清单的数据模型，配合QListView只为可见的行取数据。
+    图元Id按加入顺序存放在槽位中，删除时只把槽位置空，并用树状数组统计存活的槽位数，
+    查找行号、按行号取Id、加入和删除都是O(log n)；空槽位多于存活槽位时整体压缩
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.slots = []      # 槽位 -> 图元Id，已删除的为None
+        self.slot_dict = {}  # 图元Id -> 槽位
+        self.tree = [0]      # 树状数组（下标从1开始），tree[i]为槽位(i - lowbit(i), i]中存活的个数
+        self.count = 0       # 存活的图元数，即行数
+
+    def _prefix(self, i):
+        """ 槽位[0, i)中存活的个数 """
+        s = 0
+        while i > 0:
+            s += self.tree[i]
+            i -= i & -i
+        return s
+
+    def _update(self, slot, delta):
+        i = slot + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def _find(self, row):
+        """ 第row个（从0开始）存活的槽位 """
+        pos, rest = 0, row + 1
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step > 0:
+            if pos + step < len(self.tree) and self.tree[pos + step] < rest:
+                pos += step
+                rest -= self.tree[pos]
+            step >>= 1
+        return pos
+
+    def _compact(self):
+        """ 去掉空槽位，重建树状数组（行号不变，无需通知视图） """
+        self.slots = [item_id for item_id in self.slots if item_id is not None]
+        self.slot_dict = {item_id: slot for slot, item_id in enumerate(self.slots)}
+        n = len(self.slots)
+        self.tree = [0] + [1] * n
+        for i in range(1, n + 1):
+            j = i + (i & -i)
+            if j <= n:
+                self.tree[j] += self.tree[i]
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else self.count
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return self.id_at(index.row())
+        return None
+
+    def id_at(self, row) -> str:
+        """ 第row行的图元Id """
+        return self.slots[self._find(row)]
+
+    def row_of(self, item_id) -> int:
+        """ 图元所在的行号，不在清单中时返回-1 """
+        slot = self.slot_dict.get(item_id)
+        return -1 if slot is None else self._prefix(slot)
+
+    def index_of(self, item_id) -> QModelIndex:
+        row = self.row_of(item_id)
+        return self.index(row) if row >= 0 else QModelIndex()
+
+    def add_id(self, item_id):
+        """ 在清单末尾加入图元Id（已存在时忽略） """
+        if self.slot_dict.__contains__(item_id):
+            return
+        self.beginInsertRows(QModelIndex(), self.count, self.count)
+        n = len(self.tree)  # 新槽位在树状数组中的下标
+        self.slot_dict[item_id] = len(self.slots)
+        self.slots.append(item_id)
+        self.tree.append(1 + self._prefix(n - 1) - self._prefix(n - (n & -n)))
+        self.count += 1
+        self.endInsertRows()
+
+    def remove_id(self, item_id):
+        """ 从清单中删除图元Id """
+        slot = self.slot_dict.pop(item_id, None)
+        if slot is None:
+            return
+        row = self._prefix(slot)
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.slots[slot] = None
+        self._update(slot, -1)
+        self.count -= 1
+        self.endRemoveRows()
+        if len(self.slots) > 64 and len(self.slots) > 2 * self.count:
+            self._compact()
+
+    def clear(self):
+        self.beginResetModel()
+        self.slots = []
+        self.slot_dict = {}
+        self.tree = [0]
+        self.count = 0
+        self.endResetModel()
 
 
 class MainWindow(QMainWindow):
@@ -472,24 +1415,36 @@ class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
 
-        # 使用QListWidget来记录已有的图元，并用于选择图元
-        self.list_widget = QListWidget(self)
-        self.list_widget.setMinimumWidth(200)
+        # 使用QListView来显示已有的图元，并用于选择图元；清单内容由ItemListModel提供，只有可见的行才会被绘制
+        self.item_model = ItemListModel(self)
+        self.list_view = QListView(self)
+        self.list_view.setModel(self.item_model)
+        self.list_view.setUniformItemSizes(True)  # 行高一致，无需逐行计算尺寸
+        self.list_view.setMinimumWidth(200)
+        self.list_view.setSelectionMode(QAbstractItemView.ExtendedSelection)  # Ctrl/Shift多选，多选时批量变换
 
         # 使用QGraphicsView作为画布
         self.scene = QGraphicsScene(self)
         self.scene.setSceneRect(0, 0, 600, 600)
         self.canvas_widget = MyCanvas(self.scene, self)
-        self.canvas_widget.setFixedSize(600, 600)
+        self.canvas_widget.setMinimumSize(600, 600)
         self.canvas_widget.main_window = self
-        self.canvas_widget.list_widget = self.list_widget
+        self.canvas_widget.list_view = self.list_view
+        self.canvas_widget.item_model = self.item_model
+        self.canvas_widget.export_progress.connect(lambda p: self.statusBar().showMessage('正在保存画布：%d%%' % p))
+        self.canvas_widget.export_finished.connect(lambda path: self.statusBar().showMessage('当前画布已保存：%s' % path))
+        self.canvas_widget.export_failed.connect(lambda error: QMessageBox.warning(self, '注意', '保存失败：' + error, QMessageBox.Yes, QMessageBox.Yes))
 
         # 设置菜单栏
         menubar = self.menuBar()
         file_menu = menubar.addMenu('文件')
         set_pen_act = file_menu.addAction('设置画笔')
+        set_pen_width_act = file_menu.addAction('设置线宽')
         reset_canvas_act = file_menu.addAction('重置画布')
         save_canvas_act = file_menu.addAction('保存画布')
+        record_menu = file_menu.addMenu('录制操作')
+        start_record_act = record_menu.addAction('开始录制')
+        stop_record_act = record_menu.addAction('停止录制')
         exit_act = file_menu.addAction('退出')
         draw_menu = menubar.addMenu('绘制')
         line_menu = draw_menu.addMenu('线段')
@@ -502,7 +1457,13 @@ class MainWindow(QMainWindow):
         curve_menu = draw_menu.addMenu('曲线')
         curve_bezier_act = curve_menu.addAction('Bezier')
         curve_b_spline_act = curve_menu.addAction('B-spline')
+        fill_act = draw_menu.addAction('填充')
         edit_menu = menubar.addMenu('编辑')
+        undo_act = edit_menu.addAction('撤销')
+        undo_act.setShortcut(QKeySequence.Undo)
+        redo_act = edit_menu.addAction('重做')
+        redo_act.setShortcut(QKeySequence.Redo)
+        history_limit_act = edit_menu.addAction('设置撤销步数')
         translate_act = edit_menu.addAction('平移')
         rotate_act = edit_menu.addAction('旋转')
         scale_act = edit_menu.addAction('缩放')
@@ -510,12 +1471,23 @@ class MainWindow(QMainWindow):
         clip_cohen_sutherland_act = clip_menu.addAction('Cohen-Sutherland')
         clip_liang_barsky_act = clip_menu.addAction('Liang-Barsky')
         delete_act = edit_menu.addAction('删除')
+        view_menu = menubar.addMenu('视图')
+        zoom_in_act = view_menu.addAction('放大')
+        zoom_in_act.setShortcut(QKeySequence.ZoomIn)
+        zoom_out_act = view_menu.addAction('缩小')
+        zoom_out_act.setShortcut(QKeySequence.ZoomOut)
+        zoom_reset_act = view_menu.addAction('实际大小')
+        zoom_reset_act.setShortcut(QKeySequence('Ctrl+0'))
 
         # 连接信号和槽函数
-        self.list_widget.itemClicked.connect(self.item_selected)
+        self.list_view.clicked.connect(self.item_selected)
+        self.list_view.selectionModel().selectionChanged.connect(self.items_selected)
         set_pen_act.triggered.connect(self.set_pen_action)
+        set_pen_width_act.triggered.connect(self.set_pen_width_action)
         reset_canvas_act.triggered.connect(self.reset_action)
         save_canvas_act.triggered.connect(self.save_action)
+        start_record_act.triggered.connect(self.start_record_action)
+        stop_record_act.triggered.connect(self.stop_record_action)
         exit_act.triggered.connect(qApp.quit)
         line_dda_act.triggered.connect(self.line_dda_action)
         line_bresenham_act.triggered.connect(self.line_bresenham_action)
@@ -524,17 +1496,24 @@ class MainWindow(QMainWindow):
         ellipse_act.triggered.connect(self.ellipse_action)
         curve_bezier_act.triggered.connect(self.curve_bezier_action)
         curve_b_spline_act.triggered.connect(self.curve_b_spline_action)
+        fill_act.triggered.connect(self.fill_action)
+        undo_act.triggered.connect(self.undo_action)
+        redo_act.triggered.connect(self.redo_action)
+        history_limit_act.triggered.connect(self.history_limit_action)
         translate_act.triggered.connect(self.translate_action)
         rotate_act.triggered.connect(self.rotate_action)
         scale_act.triggered.connect(self.scale_action)
         clip_cohen_sutherland_act.triggered.connect(self.clip_cohen_sutherland_action)
         clip_liang_barsky_act.triggered.connect(self.clip_liang_barsky_action)
         delete_act.triggered.connect(self.delete_action)
+        zoom_in_act.triggered.connect(lambda: self.canvas_widget.set_zoom(self.canvas_widget.zoom_level + 1))
+        zoom_out_act.triggered.connect(lambda: self.canvas_widget.set_zoom(self.canvas_widget.zoom_level - 1))
+        zoom_reset_act.triggered.connect(lambda: self.canvas_widget.set_zoom(0))
 
         # 设置主窗口的布局
         self.hbox_layout = QHBoxLayout()
-        self.hbox_layout.addWidget(self.canvas_widget)
-        self.hbox_layout.addWidget(self.list_widget, stretch=1)
+        self.hbox_layout.addWidget(self.canvas_widget, stretch=3)
+        self.hbox_layout.addWidget(self.list_view, stretch=1)
         self.central_widget = QWidget()
         self.central_widget.setLayout(self.hbox_layout)
         self.setCentralWidget(self.central_widget)
@@ -545,31 +1524,87 @@ class MainWindow(QMainWindow):
         # 其他
         self.setAttribute(Qt.WA_DeleteOnClose)  # 关闭时删除对话框
 
-    def item_selected(self, item):
-        self.canvas_widget.selection_changed(item.text())
+    def item_selected(self, index):
+        if len(self.list_view.selectionModel().selectedRows()) <= 1:
+            self.canvas_widget.record_event('select', self.item_model.id_at(index.row()))
+            self.canvas_widget.selection_changed(self.item_model.id_at(index.row()))
+
+    def items_selected(self):
+        rows = sorted(index.row() for index in self.list_view.selectionModel().selectedRows())
+        if len(rows) > 1:
+            selected_list = [self.item_model.id_at(row) for row in rows]
+            self.canvas_widget.record_event('select', ','.join(selected_list))
+            self.canvas_widget.multi_selection_changed(selected_list)
 
     def set_pen_action(self):
         if not self.canvas_widget.is_drawing:
             color = QColorDialog.getColor()
             if color.isValid():
+                self.canvas_widget.record_event('pen', color.red(), color.green(), color.blue())
                 self.canvas_widget.temp_color = color
 
+    def set_pen_width_action(self):
+        if not self.canvas_widget.is_drawing:
+            width, ok_pressed = QInputDialog.getInt(self, "线宽设置", "线宽（像素）: ", self.canvas_widget.temp_width, 1, 100, 1)
+            if ok_pressed:
+                self.canvas_widget.record_event('pen_width', width)
+                self.canvas_widget.temp_width = width
+
     def reset_action(self):
+        self.canvas_widget.record_event('reset')
         self.statusBar().showMessage('空闲')
-        self.list_widget.clear()
+        self.item_model.clear()
         self.canvas_widget.reset_all()
 
     def save_action(self):
         if self.canvas_widget.status == '' and not self.canvas_widget.is_editing:
             filename, ok_pressed = QInputDialog.getText(self, "保存", "文件名: ", QLineEdit.Normal, "canvas.bmp")
             if ok_pressed:
-                self.statusBar().showMessage('当前画布已保存')
+                self.canvas_widget.record_event('save', filename)
+                self.statusBar().showMessage('正在保存画布')
                 self.canvas_widget.save_all(filename)
         else:
             reply = QMessageBox.warning(self, '注意', '请先进入空闲状态', QMessageBox.Yes, QMessageBox.Yes)
 
+    def start_record_action(self):
+        filename, ok_pressed = QInputDialog.getText(self, "录制操作", "文件名: ", QLineEdit.Normal, "session.txt")
+        if ok_pressed:
+            reply = QMessageBox.question(self, '录制操作', '是否同时录制鼠标和键盘事件（用于cg_replay逐事件回放）？',
+                                         QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            os.makedirs(self.canvas_widget.output_dir, exist_ok=True)
+            path = os.path.join(self.canvas_widget.output_dir, filename)
+            self.canvas_widget.start_recording(path, reply == QMessageBox.Yes)
+            self.statusBar().showMessage('正在录制：%s' % path)
+
+    def stop_record_action(self):
+        self.canvas_widget.stop_recording()
+        self.statusBar().showMessage('录制已停止')
+
+    def undo_action(self):
+        if not self.canvas_widget.is_drawing and not self.canvas_widget.is_editing:
+            self.canvas_widget.record_event('undo')
+            self.canvas_widget.undo()
+        else:
+            reply = QMessageBox.warning(self, '注意', '请先完成绘制并退出编辑模式', QMessageBox.Yes, QMessageBox.Yes)
+
+    def redo_action(self):
+        if not self.canvas_widget.is_drawing and not self.canvas_widget.is_editing:
+            self.canvas_widget.record_event('redo')
+            self.canvas_widget.redo()
+        else:
+            reply = QMessageBox.warning(self, '注意', '请先完成绘制并退出编辑模式', QMessageBox.Yes, QMessageBox.Yes)
+
+    def history_limit_action(self):
+        limit = self.canvas_widget.history.undo_steps.maxlen
+        limit, ok_pressed = QInputDialog.getInt(self, "撤销设置", "最多可撤销的步数: ", limit, 0, 1000000, 1)
+        if ok_pressed:
+            self.canvas_widget.record_event('history_limit', limit)
+            self.canvas_widget.record('setHistoryLimit', limit)
+            self.canvas_widget.history.set_limit(limit)
+
     def line_dda_action(self):
         if not self.canvas_widget.is_editing:
+            self.canvas_widget.record_event('line', 'DDA')
             self.canvas_widget.start_draw_line('DDA')
             self.statusBar().showMessage('DDA算法绘制线段')
             self.canvas_widget.clear_selection()
@@ -578,6 +1613,7 @@ class MainWindow(QMainWindow):
 
     def line_bresenham_action(self):
         if not self.canvas_widget.is_editing:
+            self.canvas_widget.record_event('line', 'Bresenham')
             self.canvas_widget.start_draw_line('Bresenham')
             self.statusBar().showMessage('Bresenham算法绘制线段')
             self.canvas_widget.clear_selection()
@@ -588,6 +1624,7 @@ class MainWindow(QMainWindow):
         if not self.canvas_widget.is_editing:
             vnum, ok_pressed = QInputDialog.getInt(self, "多边形属性设置", "多边形边数: ", 3, 3, 100, 1)
             if ok_pressed:
+                self.canvas_widget.record_event('polygon', 'DDA', vnum)
                 self.canvas_widget.start_draw_polygon('DDA', vnum)
                 self.statusBar().showMessage('DDA算法绘制多边形')
                 self.canvas_widget.clear_selection()
@@ -598,6 +1635,7 @@ class MainWindow(QMainWindow):
         if not self.canvas_widget.is_editing:
             vnum, ok_pressed = QInputDialog.getInt(self, "多边形属性设置", "多边形边数: ", 3, 3, 100, 1)
             if ok_pressed:
+                self.canvas_widget.record_event('polygon', 'Bresenham', vnum)
                 self.canvas_widget.start_draw_polygon('Bresenham', vnum)
                 self.statusBar().showMessage('Bresenham算法绘制多边形')
                 self.canvas_widget.clear_selection()
@@ -606,6 +1644,7 @@ class MainWindow(QMainWindow):
 
     def ellipse_action(self):
         if not self.canvas_widget.is_editing:
+            self.canvas_widget.record_event('ellipse')
             self.canvas_widget.start_draw_ellipse()
             self.statusBar().showMessage('中点圆生成算法绘制椭圆')
             self.canvas_widget.clear_selection()
@@ -616,6 +1655,7 @@ class MainWindow(QMainWindow):
         if not self.canvas_widget.is_editing:
             pnum, ok_pressed = QInputDialog.getInt(self, "曲线属性设置", "Bezier曲线控制点个数: ", 3, 2, 100, 1)
             if ok_pressed:
+                self.canvas_widget.record_event('curve', 'Bezier', pnum)
                 self.canvas_widget.start_draw_curve('Bezier', pnum)
                 self.statusBar().showMessage('Bezier算法绘制曲线')
                 self.canvas_widget.clear_selection()
@@ -626,12 +1666,22 @@ class MainWindow(QMainWindow):
         if not self.canvas_widget.is_editing:
             pnum, ok_pressed = QInputDialog.getInt(self, "曲线属性设置", "B-spline曲线控制点个数: ", 4, 4, 100, 1)
             if ok_pressed:
+                self.canvas_widget.record_event('curve', 'B-spline', pnum)
                 self.canvas_widget.start_draw_curve('B-spline', pnum)
                 self.statusBar().showMessage('B-spline算法绘制曲线')
                 self.canvas_widget.clear_selection()
         else:
             reply = QMessageBox.warning(self, '注意', '请先回车退出编辑模式', QMessageBox.Yes, QMessageBox.Yes)
 
+    def fill_action(self):
+        if not self.canvas_widget.is_editing:
+            self.canvas_widget.record_event('fill')
+            self.canvas_widget.start_fill()
+            self.statusBar().showMessage('扫描线种子填充，点击画布选择种子点')
+            self.canvas_widget.clear_selection()
+        else:
+            reply = QMessageBox.warning(self, '注意', '请先回车退出编辑模式', QMessageBox.Yes, QMessageBox.Yes)
+
     def is_valid_selection(self):
         return self.canvas_widget.selected_id != '' and self.canvas_widget.item_dict.__contains__(self.canvas_widget.selected_id)
 
@@ -639,6 +1689,7 @@ class MainWindow(QMainWindow):
         if self.canvas_widget.status == '' and self.is_valid_selection():  # 可平移
             x_input, y_input, ok_pressed = TranslateDialog('X方向位移: ', 'Y方向位移: ').get_input()
             if ok_pressed:
+                self.canvas_widget.record_event('translate', x_input, y_input)
                 self.canvas_widget.translate_selected_item(x_input, y_input)
         else:
             reply = QMessageBox.warning(self, '注意', '请先选中一个图元', QMessageBox.Yes, QMessageBox.Yes)
@@ -646,12 +1697,11 @@ class MainWindow(QMainWindow):
     def scale_action(self):
         if self.canvas_widget.status == '' and self.is_valid_selection():  # 可缩放
             selected_item = self.canvas_widget.item_dict[self.canvas_widget.selected_id]
-            x0, y0 = selected_item.p_list[0]
-            x1, y1 = selected_item.p_list[1]
-            if x0 != x1 or y0 != y1:
+            if selected_item.scalable():
                 x_default, y_default = selected_item.get_center()
                 x_input, y_input, s_input, ok_pressed = TranslateDialog('X中心: ', 'Y中心: ', True, False, x_default, y_default).get_input()
                 if ok_pressed:
+                    self.canvas_widget.record_event('scale', x_input, y_input, s_input)
                     self.canvas_widget.scale_selected_item(x_input, y_input, s_input)
             else:
                 reply = QMessageBox.warning(self, '注意', '无法缩放一个像素点', QMessageBox.Yes, QMessageBox.Yes)
@@ -667,6 +1717,7 @@ class MainWindow(QMainWindow):
                 x_default, y_default = selected_item.get_center()
                 x_input, y_input, r_input, ok_pressed = TranslateDialog('X中心: ', 'Y中心: ', False, True, x_default, y_default).get_input()
                 if ok_pressed:
+                    self.canvas_widget.record_event('rotate', x_input, y_input, r_input)
                     self.canvas_widget.rotate_selected_item(x_input, y_input, r_input)
         else:
             reply = QMessageBox.warning(self, '注意', '请先选中一个图元', QMessageBox.Yes, QMessageBox.Yes)
@@ -676,6 +1727,7 @@ class MainWindow(QMainWindow):
             if not self.canvas_widget.is_editing:
                 selected_line = self.canvas_widget.item_dict[self.canvas_widget.selected_id]
                 if selected_line.item_type == 'line':
+                    self.canvas_widget.record_event('clip', algorithm)
                     self.canvas_widget.start_clip(algorithm)
                     self.statusBar().showMessage(algorithm + '算法裁剪线段')
                 else:
@@ -694,6 +1746,7 @@ class MainWindow(QMainWindow):
     def delete_action(self):
         if self.is_valid_selection():
             if not self.canvas_widget.is_editing:
+                self.canvas_widget.record_event('delete')
                 self.canvas_widget.delete_selected_item()
             else:
                 reply = QMessageBox.warning(self, '注意', '请先回车退出编辑模式', QMessageBox.Yes, QMessageBox.Yes)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 撤销/重做历史，cg_cli和cg_gui共用
+# 图元状态由调用者定义，须为不可变对象（如元组），None表示图元不存在；图元的先后（绘制顺序）由调用者维护，
+# 被删除的图元记下删除前的位置，撤销时插回原处
+from collections import deque
+from itertools import islice
+
+
+class History:
+    """
+    撤销/重做历史：每一步只记录发生变化的图元变化前后的状态，未变化的图元不复制；
+    同一图元相邻两步的“变化后”与“变化前”是同一个对象；平移只记录位移量。
+    步骤数超出上限时丢弃最早的步骤
+    """
+    def __init__(self, limit: int = 1000):
+        self.undo_steps = deque(maxlen=limit)  # 可撤销的步骤，右端为最近一步
+        self.redo_steps = []                   # 可重做的步骤，末尾为最近撤销的一步
+        self.latest = {}                       # 每个图元最近一次被记录的状态，用于在相邻步骤间共享
+        self.latest_ids = ()                   # 最近一次平移的图元Id，连续平移同一批图元时共享
+
+    def set_limit(self, limit: int):
+        """ 修改历史步骤数上限（保留最近的步骤） """
+        self.undo_steps = deque(self.undo_steps, maxlen=limit)
+        self.redo_steps = self.redo_steps[-limit:] if limit > 0 else []
+
+    def clear(self):
+        self.undo_steps.clear()
+        self.redo_steps.clear()
+        self.latest.clear()
+        self.latest_ids = ()
+
+    def share(self, item_id, state):
+        """ 若state与该图元最近记录的状态相同，则返回已记录的对象，否则记下state """
+        if state is None:
+            self.latest.pop(item_id, None)
+            return None
+        latest = self.latest.get(item_id)
+        if latest is not None and latest == state:
+            return latest
+        self.latest[item_id] = state
+        return state
+
+    def record(self, changes, positions=None):
+        """ 记录一步：changes为[(item_id, before, after), ...]，前后状态相同的图元会被忽略；
+        positions为被删除的图元删除前在图元序列中的位置{item_id: index}，未给出的撤销时加在末尾 """
+        step = []
+        for item_id, before, after in changes:
+            if before != after:
+                before = self.share(item_id, before)
+                after = self.share(item_id, after)
+                step.append((item_id, before, after, positions.get(item_id) if positions is not None else None))
+        if len(step) > 0:
+            self.undo_steps.append(('set', tuple(step)))
+            self.redo_steps.clear()
+
+    def record_translate(self, item_ids, dx, dy):
+        """ 记录一步平移，只保存位移量 """
+        if len(item_ids) > 0 and (dx != 0 or dy != 0):
+            item_ids = tuple(item_ids)
+            if item_ids == self.latest_ids:
+                item_ids = self.latest_ids
+            self.latest_ids = item_ids
+            for item_id in item_ids:
+                self.latest.pop(item_id, None)  # 平移后的状态没有记录下来
+            self.undo_steps.append(('translate', item_ids, dx, dy))
+            self.redo_steps.clear()
+
+    def can_undo(self) -> bool:
+        return len(self.undo_steps) > 0
+
+    def can_redo(self) -> bool:
+        return len(self.redo_steps) > 0
+
+    def undo(self):
+        """ 撤销一步，返回需要执行的操作：('set', {item_id: state}, {item_id: index}) 或 ('translate', item_ids, dx, dy)，
+        无可撤销时返回None；index为被恢复的图元应插回的位置（按位置从小到大依次插入，见restore_order） """
+        if not self.can_undo():
+            return None
+        step = self.undo_steps.pop()
+        self.redo_steps.append(step)
+        if step[0] == 'translate':
+            _, item_ids, dx, dy = step
+            for item_id in item_ids:
+                self.latest.pop(item_id, None)
+            return 'translate', item_ids, -dx, -dy
+        return ('set', {item_id: self.share(item_id, before) for item_id, before, after, index in step[1]},
+                {item_id: index for item_id, before, after, index in step[1] if index is not None})
+
+    def redo(self):
+        """ 重做一步，返回值同undo，无可重做时返回None """
+        if not self.can_redo():
+            return None
+        step = self.redo_steps.pop()
+        self.undo_steps.append(step)
+        if step[0] == 'translate':
+            for item_id in step[1]:
+                self.latest.pop(item_id, None)
+            return step
+        return 'set', {item_id: self.share(item_id, after) for item_id, before, after, index in step[1]}, {}
+
+
+def restore_order(ids, positions):
+    """ 撤销删除后恢复图元的先后：把重新加入的图元移回删除前的位置
+    :param ids: (list) 按当前先后排列的图元Id
+    :param positions: (dict) {item_id: index}，见History.undo
+    :return: (list) 重新排列后的图元Id
+    """
+    rest = iter([item_id for item_id in ids if item_id not in positions])
+    order = []
+    for index, item_id in sorted((index, item_id) for item_id, index in positions.items()):
+        order.extend(islice(rest, index - len(order)))  # 位于其前的其它图元
+        order.append(item_id)
+    order.extend(rest)
+    return order
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 指令输入：input_file为'-'时从标准输入读取；gzip/bz2/xz压缩的输入按文件头识别，边读边解压
+# 输入按块读取、逐行切分，指令文件不必完整读入内存或解压到磁盘，生成器可以一边生成一边交给cg_cli执行
+# 本文件只依赖标准库（cg_client也使用）
+import sys
+import gzip
+import bz2
+import lzma
+
+CHUNK_SIZE = 1 << 20
+""" 每次从输入读取的字节数 """
+
+DECOMPRESSORS = [(b'\x1f\x8b', gzip.open), (b'BZh', bz2.open), (b'\xfd7zXZ\x00', lzma.open)]
+""" 压缩格式的文件头及对应的解压方式 """
+
+
+def open_binary(path):
+    """ 以二进制方式打开指令输入，压缩的输入返回解压后的数据流
+    :param path: (string) 指令文件路径，'-'表示标准输入
+    :return: 文件对象；未压缩时为io.BufferedReader
+    """
+    raw = sys.stdin.buffer if path == '-' else open(path, 'rb', buffering=CHUNK_SIZE)
+    head = raw.peek(6)[:6]  # 只查看文件头，不消耗输入
+    for magic, decompress in DECOMPRESSORS:
+        if head.startswith(magic):
+            return decompress(raw, 'rb')
+    return raw
+
+
+def skip_input(fp, offset):
+    """ 跳过输入开头的offset字节（从检查点恢复时使用）：可定位的输入直接定位（压缩文件向前定位时边读边解压），
+    标准输入等不可定位的输入读取并丢弃
+    :param fp: 以二进制方式打开的指令输入，见open_binary
+    :param offset: (int) 字节偏移（解压后）
+    """
+    if fp.seekable():
+        fp.seek(offset)
+        return
+    while offset > 0:
+        chunk = fp.read(min(offset, CHUNK_SIZE))
+        if not chunk:
+            break
+        offset -= len(chunk)
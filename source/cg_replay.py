@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 回放cg_gui录制的操作（也可以是任意cg_cli指令文件），在无界面环境中驱动MyCanvas，统计每类事件的处理延迟
+# 用法：QT_QPA_PLATFORM=offscreen python cg_replay.py session.txt [--events] [--output dir]
+#   默认逐条回放cg_cli指令；--events则逐个回放以'#@'开头的鼠标/键盘事件和菜单操作（录制时需选择录制事件），
+#   第一个事件之前的指令作为初始状态，不计时
+# 一个事件的延迟：从画布开始处理该事件，到界面更新完毕并重绘视口为止（鼠标移动包括本应由帧定时器完成的预览更新）
+import sys
+import time
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtGui import QColor, QMouseEvent, QKeyEvent
+from PyQt5.QtCore import Qt, QEvent, QPointF
+import cg_gui
+from cg_cli import select_items
+
+
+def draw_item(canvas, item_id, item_type, p_list, algorithm):
+    """ 以当前画笔绘制图元，Id已存在时替换原图元的参数（与cg_cli一致） """
+    if canvas.item_dict.__contains__(item_id):
+        item = canvas.item_dict[item_id]
+        before = item.get_state()
+        item.prepareGeometryChange()
+        item.item_type = item_type
+        item.p_list = p_list
+        item.algorithm = algorithm
+        item.color = QColor(canvas.temp_color)
+        item.poly_closed = item_type == 'polygon'
+        item.pen_width = canvas.temp_width if item_type != 'fill' else 1
+        canvas.history.record([(item_id, before, item.get_state())])
+        canvas.refresh_fills()
+    else:
+        item = cg_gui.MyItem(item_id, item_type, p_list, QColor(canvas.temp_color), algorithm)
+        item.poly_closed = item_type == 'polygon'
+        item.pen_width = canvas.temp_width if item_type != 'fill' else 1
+        canvas.scene().addItem(item)
+        canvas.add_item(item)
+
+
+def select(canvas, item_ids):
+    """ 选中图元，返回是否选中了图元 """
+    if len(item_ids) == 0:
+        return False
+    canvas.multi_selection_changed(item_ids)
+    return True
+
+
+def replay_command(main_window, group_dict, line):
+    """ 在画布上执行一条cg_cli指令
+    :return: (string) 指令名，空行和注释返回None
+    """
+    canvas = main_window.canvas_widget
+    line = line.strip().split(' ')
+    if line[0] == '' or line[0].startswith('#'):
+        return None
+    if line[0] == 'resetCanvas':
+        main_window.reset_action()
+        canvas.scene().setSceneRect(0, 0, int(line[1]), int(line[2]))
+    elif line[0] == 'saveCanvas':
+        canvas.save_all(line[1] + '.bmp')
+    elif line[0] == 'setColor':
+        canvas.temp_color = QColor(int(line[1]), int(line[2]), int(line[3]))
+    elif line[0] == 'setPenWidth':
+        canvas.temp_width = max(int(line[1]), 1)
+    elif line[0] == 'drawLine':
+        draw_item(canvas, line[1], 'line', [(int(line[2]), int(line[3])), (int(line[4]), int(line[5]))], line[6])
+    elif line[0] == 'drawEllipse':
+        draw_item(canvas, line[1], 'ellipse', [(int(line[2]), int(line[3])), (int(line[4]), int(line[5]))], '')
+    elif line[0] == 'drawPolygon' or line[0] == 'drawCurve':
+        points = [(int(line[i]), int(line[i + 1])) for i in range(2, len(line) - 1, 2)]
+        draw_item(canvas, line[1], 'polygon' if line[0] == 'drawPolygon' else 'curve', points, line[-1])
+    elif line[0] == 'fill':
+        if len(line) > 3:
+            item_id = line[1]
+        else:
+            n = 1
+            while canvas.item_dict.__contains__('fill%d' % n):
+                n += 1
+            item_id = 'fill%d' % n
+        draw_item(canvas, item_id, 'fill', [(int(line[-2]), int(line[-1]))], '')
+    elif line[0] == 'group':
+        group_dict[line[1]] = line[2:]
+    elif line[0] == 'translate':
+        if select(canvas, select_items(canvas.item_dict, group_dict, line[1])):
+            canvas.translate_selected_item(int(line[2]), int(line[3]))
+    elif line[0] == 'scale':
+        if select(canvas, select_items(canvas.item_dict, group_dict, line[1])):
+            canvas.scale_selected_item(int(line[2]), int(line[3]), float(line[4]))
+    elif line[0] == 'rotate':
+        if select(canvas, select_items(canvas.item_dict, group_dict, line[1])):
+            canvas.rotate_selected_item(int(line[2]), int(line[3]), float(line[4]))
+    elif line[0] == 'clip':
+        if select(canvas, select_items(canvas.item_dict, group_dict, line[1])):
+            canvas.clip_selected_item(int(line[2]), int(line[3]), int(line[4]), int(line[5]), line[6])
+    elif line[0] == 'delete':
+        if select(canvas, select_items(canvas.item_dict, group_dict, line[1])):
+            canvas.delete_selected_item()
+    elif line[0] == 'undo':
+        for i in range(int(line[1]) if len(line) > 1 else 1):
+            canvas.undo()
+    elif line[0] == 'redo':
+        for i in range(int(line[1]) if len(line) > 1 else 1):
+            canvas.redo()
+    elif line[0] == 'setHistoryLimit':
+        canvas.history.set_limit(int(line[1]))
+    return line[0]
+
+
+def mouse_event(canvas, event_type, x, y, button, modifiers):
+    pos = QPointF(canvas.mapFromScene(QPointF(x, y)))
+    return QMouseEvent(event_type, pos, Qt.MouseButton(button), Qt.MouseButtons(button), Qt.KeyboardModifiers(modifiers))
+
+
+def replay_event(main_window, words):
+    """ 在画布上重现一个录制的界面事件（words为'#@'之后的部分），菜单操作跳过对话框直接使用录制的参数
+    :return: (string) 事件名
+    """
+    canvas = main_window.canvas_widget
+    if words[0] == 'press':
+        x, y, button, modifiers = map(int, words[1:5])
+        canvas.mousePressEvent(mouse_event(canvas, QEvent.MouseButtonPress, x, y, button, modifiers))
+    elif words[0] == 'move':
+        x, y = int(words[1]), int(words[2])
+        canvas.mouseMoveEvent(mouse_event(canvas, QEvent.MouseMove, x, y, Qt.NoButton, Qt.NoModifier))
+        canvas.flush_move()
+    elif words[0] == 'release':
+        x, y, button, modifiers = map(int, words[1:5])
+        canvas.mouseReleaseEvent(mouse_event(canvas, QEvent.MouseButtonRelease, x, y, button, modifiers))
+    elif words[0] == 'key':
+        canvas.keyPressEvent(QKeyEvent(QEvent.KeyPress, int(words[1]), Qt.KeyboardModifiers(int(words[2]))))
+    elif words[0] == 'pen':
+        canvas.temp_color = QColor(int(words[1]), int(words[2]), int(words[3]))
+    elif words[0] == 'pen_width':
+        canvas.temp_width = int(words[1])
+    elif words[0] == 'reset':
+        main_window.reset_action()
+    elif words[0] == 'save':
+        canvas.save_all(words[1])
+    elif words[0] == 'undo':
+        canvas.undo()
+    elif words[0] == 'redo':
+        canvas.redo()
+    elif words[0] == 'history_limit':
+        canvas.history.set_limit(int(words[1]))
+    elif words[0] == 'line':
+        canvas.start_draw_line(words[1])
+        canvas.clear_selection()
+    elif words[0] == 'polygon':
+        canvas.start_draw_polygon(words[1], int(words[2]))
+        canvas.clear_selection()
+    elif words[0] == 'ellipse':
+        canvas.start_draw_ellipse()
+        canvas.clear_selection()
+    elif words[0] == 'curve':
+        canvas.start_draw_curve(words[1], int(words[2]))
+        canvas.clear_selection()
+    elif words[0] == 'translate':
+        canvas.translate_selected_item(int(words[1]), int(words[2]))
+    elif words[0] == 'scale':
+        canvas.scale_selected_item(int(words[1]), int(words[2]), float(words[3]))
+    elif words[0] == 'rotate':
+        canvas.rotate_selected_item(int(words[1]), int(words[2]), int(words[3]))
+    elif words[0] == 'fill':
+        canvas.start_fill()
+        canvas.clear_selection()
+    elif words[0] == 'clip':
+        canvas.start_clip(words[1])
+    elif words[0] == 'delete':
+        canvas.delete_selected_item()
+    elif words[0] == 'zoom':
+        canvas.set_zoom(int(words[1]))
+    elif words[0] == 'scroll':
+        canvas.horizontalScrollBar().setValue(int(words[1]))
+        canvas.verticalScrollBar().setValue(int(words[2]))
+    elif words[0] == 'select':
+        item_ids = words[1].split(',')
+        if len(item_ids) == 1:
+            canvas.selection_changed(item_ids[0])
+        else:
+            canvas.multi_selection_changed(item_ids)
+    return words[0]
+
+
+def replay(main_window, lines, events=False):
+    """ 回放，返回每类事件的延迟：{name: [seconds, ...]} """
+    canvas = main_window.canvas_widget
+    group_dict = {}
+    latency = {}
+    started = not events  # 回放事件时，第一个事件之前的指令只用于建立初始状态
+    for line in lines:
+        is_event = line.startswith('#@')
+        if events and not is_event and started:
+            continue  # 事件产生的指令，由事件本身重现
+        started = started or is_event
+        t = time.perf_counter()
+        if is_event:
+            name = replay_event(main_window, line.split()[1:]) if events else None
+        else:
+            name = replay_command(main_window, group_dict, line)
+        if name is None:
+            continue
+        QApplication.processEvents()  # 事件引起的其他界面更新（如图元清单）
+        canvas.viewport().repaint()
+        if events and not is_event:
+            continue  # 初始状态不计时
+        latency.setdefault(name, []).append(time.perf_counter() - t)
+    while len(canvas.export_tasks) > 0 or len(canvas.raster_tasks) > 0:  # 等待后台导出和光栅化完成
+        QApplication.processEvents()
+    return latency
+
+
+def report(latency):
+    """ 打印每类事件的延迟分位数（毫秒） """
+    print('%-16s %8s %9s %9s %9s %9s' % ('event', 'count', 'p50(ms)', 'p90(ms)', 'p99(ms)', 'max(ms)'))
+    for name, seconds in sorted(latency.items(), key=lambda kv: -sum(kv[1])):
+        ms = np.array(seconds) * 1000
+        p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+        print('%-16s %8d %9.2f %9.2f %9.2f %9.2f' % (name, len(ms), p50, p90, p99, ms.max()))
+
+
+if __name__ == '__main__':
+    input_file = sys.argv[1]
+    events = '--events' in sys.argv
+    app = QApplication(sys.argv)
+    mw = cg_gui.MainWindow()
+    if '--output' in sys.argv:
+        mw.canvas_widget.output_dir = sys.argv[sys.argv.index('--output') + 1]
+    mw.show()
+    QApplication.processEvents()  # 窗口显示后才会真正重绘
+    with open(input_file, 'r') as fp:
+        lines = fp.readlines()
+    if events and not any(line.startswith('#@') for line in lines):
+        print('%s 中没有录制界面事件' % input_file, file=sys.stderr)
+        sys.exit(1)
+    start = time.perf_counter()
+    result = replay(mw, lines, events)
+    report(result)
+    print('total %.2f s' % (time.perf_counter() - start))
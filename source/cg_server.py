@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 常驻的cg_cli绘图服务：进程一直运行，NumPy/PIL及各模块只需加载一次，通过Unix域套接字接收指令流
+# 每个客户端连接是一个独立的会话（cg_cli.Session，图元互不可见），多个连接由不同线程同时处理
+# 用法：python cg_server.py [socket_path]，客户端及协议见cg_client.py
+import sys
+import os
+import io
+import signal
+import socket
+import socketserver
+from cg_cli import Session
+from cg_client import DEFAULT_SOCKET
+
+
+class SessionHandler(socketserver.StreamRequestHandler):
+    """
+    处理一个客户端连接：新建一个会话，逐行执行收到的指令，结束后回复执行结果
+    """
+    def handle(self):
+        rfile = io.TextIOWrapper(self.rfile, encoding='utf-8')
+        reply = 'OK'
+        line_no = 0
+        session = None
+        try:
+            output_dir = rfile.readline().rstrip('\n')
+            session = Session(output_dir)
+            for line_no, line in enumerate(rfile, 1):
+                session.execute(line)
+        except Exception as e:
+            reply = 'ERROR line %d: %s: %s' % (line_no, type(e).__name__, e)
+            for _ in rfile:  # 读完剩余的指令，避免客户端阻塞在发送上
+                pass
+        finally:
+            if session is not None:
+                session.close()
+        self.wfile.write((reply + '\n').encode('utf-8'))
+
+
+def is_serving(socket_path) -> bool:
+    """ 判断是否已有服务在socket_path上监听 """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+            return True
+        except OSError:
+            return False
+
+
+if __name__ == '__main__':
+    socket_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SOCKET
+    if os.path.exists(socket_path):
+        if is_serving(socket_path):
+            print('cg_server is already running on %s' % socket_path, file=sys.stderr)
+            sys.exit(1)
+        os.remove(socket_path)  # 上次未正常退出时留下的套接字文件
+
+    with socketserver.ThreadingUnixStreamServer(socket_path, SessionHandler) as server:
+        server.daemon_threads = True
+        signal.signal(signal.SIGTERM, signal.default_int_handler)  # kill时同样正常退出并删除套接字文件
+        print('cg_server listening on %s' % socket_path)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
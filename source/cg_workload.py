@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 随机场景生成：按随机种子生成可复现的cg_cli指令文件，用于压力测试和性能评估（见cg_bench）
+# 用法：python cg_workload.py output_file [--seed 0] [--size 1000x1000] [--items 1000] [--mix line=1,polygon=1,ellipse=1,curve=1]
+#                                        [--transforms 0.2] [--save-every 100] [--colors 0.05] [--item-size 0.1]
+#   output_file为'-'时写到标准输出，以.gz结尾时压缩保存（cg_cli可以直接读取）
+# 指令逐行生成，百万行的场景也不必整体放在内存中；本文件只依赖标准库
+import sys
+import gzip
+import random
+
+ITEM_TYPES = ('line', 'polygon', 'ellipse', 'curve')
+""" 生成的图元类型，--mix按此顺序给出各类型的权重 """
+
+MAX_POINTS = 8
+""" 多边形顶点数、曲线控制点数的上限 """
+
+
+def option(argv, name, default):
+    """ 命令行选项'--name value'的值（转换为default的类型），未给出时为default """
+    if '--' + name not in argv:
+        return default
+    return type(default)(argv[argv.index('--' + name) + 1])
+
+
+def parse_mix(text):
+    """ 解析图元类型的权重，如'line=4,curve=1'（未给出的类型权重为0）
+    :return: (list of float) 按ITEM_TYPES顺序的权重
+    """
+    weights = dict.fromkeys(ITEM_TYPES, 0.0)
+    for token in text.split(','):
+        name, weight = token.split('=')
+        if name not in weights:
+            raise ValueError('unknown item type: %s' % name)
+        weights[name] = float(weight)
+    return list(weights.values())
+
+
+def generate(seed=0, width=1000, height=1000, items=1000, mix=(1, 1, 1, 1), transforms=0.2, save_every=100,
+             colors=0.05, item_size=0.1):
+    """ 生成随机场景的指令（不含换行符）：依次绘制items个图元，每个图元之后平均进行transforms次变换，
+    每绘制save_every个图元保存一次画布，最后总是保存一次；同样的参数总是生成同样的指令
+    :param mix: (list of float) 线段、多边形、椭圆、曲线的权重
+    :param transforms: (float) 平均每个图元之后的变换（平移/旋转/缩放一个已绘制的图元）次数
+    :param save_every: (int) 保存画布的间隔（图元数），0表示只在最后保存
+    :param colors: (float) 绘制每个图元前更换画笔颜色的概率
+    :param item_size: (float) 图元尺寸（中心到顶点的最大距离）占画布短边的比例上限，大多数图元远小于上限
+    """
+    r = random.Random(seed)
+    yield 'resetCanvas %d %d' % (width, height)
+    ids = []  # 已绘制的图元Id
+    for i in range(items):
+        if r.random() < colors:
+            yield 'setColor %d %d %d' % (r.randrange(256), r.randrange(256), r.randrange(256))
+        item_type = r.choices(ITEM_TYPES, mix)[0]
+        item_id = '%s%d' % (item_type, i)
+        size = max(min(width, height) * item_size * r.random() ** 2, 2)  # 小图元多、大图元少
+        cx, cy = r.randrange(width), r.randrange(height)  # 靠近边缘的图元部分在画布外
+        if item_type == 'line' or item_type == 'ellipse':
+            n = 2
+        else:  # 三次B样条曲线至少需要4个控制点
+            n = r.randint(3 if item_type == 'polygon' else 4, MAX_POINTS)
+        points = [(round(cx + r.uniform(-size, size)), round(cy + r.uniform(-size, size))) for _ in range(n)]
+        coords = ' '.join('%d %d' % p for p in points)
+        if item_type == 'line':
+            yield 'drawLine %s %s %s' % (item_id, coords, r.choice(('DDA', 'Bresenham')))
+        elif item_type == 'polygon':
+            yield 'drawPolygon %s %s %s' % (item_id, coords, r.choice(('DDA', 'Bresenham')))
+        elif item_type == 'ellipse':
+            yield 'drawEllipse %s %s' % (item_id, coords)
+        else:
+            yield 'drawCurve %s %s %s' % (item_id, coords, r.choice(('Bezier', 'B-spline')))
+        ids.append(item_id)
+        for _ in range(int(transforms) + (r.random() < transforms % 1)):
+            target = r.choice(ids)
+            kind = r.randrange(3)
+            if kind == 0:
+                yield 'translate %s %d %d' % (target, r.randint(-20, 20), r.randint(-20, 20))
+            elif kind == 1:
+                yield 'rotate %s %d %d %d' % (target, r.randrange(width), r.randrange(height), r.randint(-30, 30))
+            else:
+                yield 'scale %s %d %d %.2f' % (target, r.randrange(width), r.randrange(height), r.uniform(0.8, 1.25))
+        if save_every > 0 and (i + 1) % save_every == 0:
+            yield 'saveCanvas frame%d' % ((i + 1) // save_every)
+    yield 'saveCanvas final'
+
+
+def write(path, lines):
+    """ 将指令写入文件，'-'为标准输出，以.gz结尾时压缩
+    :return: (int) 写入的指令数
+    """
+    if path == '-':
+        fp = sys.stdout
+    elif path.endswith('.gz'):
+        fp = gzip.open(path, 'wt', compresslevel=6)
+    else:
+        fp = open(path, 'w')
+    n = 0
+    try:
+        for line in lines:
+            fp.write(line + '\n')
+            n += 1
+    finally:
+        if fp is not sys.stdout:
+            fp.close()
+    return n
+
+
+def workload_options(argv):
+    """ 从命令行选项读取generate的参数（cg_bench共用），返回关键字参数字典 """
+    width, height = map(int, option(argv, 'size', '1000x1000').split('x'))
+    return {'seed': option(argv, 'seed', 0), 'width': width, 'height': height, 'items': option(argv, 'items', 1000),
+            'mix': parse_mix(option(argv, 'mix', 'line=1,polygon=1,ellipse=1,curve=1')),
+            'transforms': option(argv, 'transforms', 0.2), 'save_every': option(argv, 'save-every', 100),
+            'colors': option(argv, 'colors', 0.05), 'item_size': option(argv, 'item-size', 0.1)}
+
+
+if __name__ == '__main__':
+    write(sys.argv[1], generate(**workload_options(sys.argv)))
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# cg_algorithms的回归测试：用法 cd source && python -m pytest
+import math
+import random
+import time
+import cg_algorithms as alg
+
+
+def baseline_dda(p_list):
+    """ 最初版本的DDA：从起点逐步累加步长，不裁剪 """
+    x0, y0 = p_list[0]
+    x1, y1 = p_list[1]
+    result = []
+    dis = max(abs(x1 - x0), abs(y1 - y0))
+    if dis > 0:
+        dx = (x1 - x0) / dis
+        dy = (y1 - y0) / dis
+        x, y = x0, y0
+        for i in range(dis):
+            result.append((round(x), round(y)))
+            x += dx
+            y += dy
+    return result
+
+
+def random_segments(n, seed=0):
+    r = random.Random(seed)
+    for _ in range(n):
+        yield [(r.randint(-300, 1300), r.randint(-300, 1300)), (r.randint(-300, 1300), r.randint(-300, 1300))]
+
+
+def test_dda_matches_baseline():
+    for p_list in random_segments(2000):
+        assert alg.draw_line(p_list, 'DDA') == baseline_dda(p_list)
+
+
+def clipped_dda(p_list, region):
+    """ 裁剪时的DDA：第一个主方向坐标落在区域内的步数由起点直接算出坐标，之后逐步累加，只保留区域内的像素点 """
+    x0, y0 = p_list[0]
+    x1, y1 = p_list[1]
+    x_min, y_min, x_max, y_max = region
+    dis = max(abs(x1 - x0), abs(y1 - y0))
+    if dis == 0:
+        return []
+    dx = (x1 - x0) / dis
+    dy = (y1 - y0) / dis
+    x_major = abs(x1 - x0) >= abs(y1 - y0)
+    steps = [i for i in range(dis) if (x_min <= x0 + i * dx <= x_max if x_major else y_min <= y0 + i * dy <= y_max)]
+    result = []
+    if len(steps) > 0:
+        x, y = x0 + steps[0] * dx, y0 + steps[0] * dy
+        for i in steps:
+            if x_min <= round(x) <= x_max and y_min <= round(y) <= y_max:
+                result.append((round(x), round(y)))
+            x += dx
+            y += dy
+    return result
+
+
+def test_dda_region_closed_form():
+    region = [0, 0, 999, 999]
+    for p_list in random_segments(2000, 1):
+        assert alg.draw_line(p_list, 'DDA', region) == clipped_dda(p_list, region)
+
+
+def test_dda_region_close_to_baseline():
+    """ 裁剪时与不裁剪的结果沿主方向逐步对应，次方向至多相差一个像素 """
+    region = [0, 0, 999, 999]
+    for p_list in random_segments(2000, 3):
+        (x0, y0), (x1, y1) = p_list
+        major = 0 if abs(x1 - x0) >= abs(y1 - y0) else 1
+        expected = {p[major]: p for p in baseline_dda(p_list)}
+        for p in alg.draw_line(p_list, 'DDA', region):
+            assert abs(p[1 - major] - expected[p[major]][1 - major]) <= 1
+
+
+def test_dda_region_cost():
+    """ 裁剪的计算量只与区域内的步数有关 """
+    start = time.perf_counter()
+    pixels = alg.draw_line([(-20000000, 50), (50, 51)], 'DDA', [0, 0, 99, 99])
+    assert time.perf_counter() - start < 0.05
+    assert [x for x, y in pixels] == list(range(0, 50))
+
+
+def test_dda_spans_match_pixels():
+    region = [0, 0, 999, 999]
+    for p_list in random_segments(2000, 2):
+        assert alg.draw_line(p_list, 'DDA', spans=True) == alg.to_spans(baseline_dda(p_list))
+        assert alg.draw_line(p_list, 'DDA', region, spans=True) == alg.to_spans(clipped_dda(p_list, region))
+
+
+def expand(spans):
+    """ 区段列表覆盖的像素点集合 """
+    return {(x, y) for y, x0, x1 in spans for x in range(x0, x1 + 1)}
+
+
+def assert_merged(spans):
+    """ 区段按(y, x_start)排序、互不相交且不相邻 """
+    assert spans == sorted(spans)
+    for (y0, a0, b0), (y1, a1, b1) in zip(spans, spans[1:]):
+        assert a0 <= b0 and (y0 < y1 or b0 + 1 < a1)
+
+
+def random_polylines(n, seed=0):
+    r = random.Random(seed)
+    for _ in range(n):
+        yield [(r.randint(-50, 250), r.randint(-50, 250)) for _ in range(r.randint(2, 6))]
+
+
+def test_merge_spans():
+    r = random.Random(4)
+    for _ in range(200):
+        spans = []
+        for _ in range(r.randint(0, 30)):
+            x = r.randint(0, 40)
+            spans.append((r.randint(0, 5), x, x + r.randint(0, 6)))
+        merged = alg.merge_spans(spans)
+        assert_merged(merged)
+        assert expand(merged) == expand(spans)
+
+
+def test_spans_match_pixels():
+    region = [0, 0, 199, 199]
+    for p_list in random_polylines(300, 5):
+        for algorithm in ['DDA', 'Bresenham']:
+            for clip in [None, region]:
+                line = alg.draw_line(p_list[:2], algorithm, clip, spans=True)
+                assert_merged(line)
+                assert expand(line) == set(alg.draw_line(p_list[:2], algorithm, clip))
+                for is_closed in [False, True]:
+                    polygon = alg.draw_polygon(p_list, algorithm, is_closed, clip, spans=True)
+                    assert_merged(polygon)
+                    assert expand(polygon) == set(alg.draw_polygon(p_list, algorithm, is_closed, clip))
+        for algorithm in ['Bezier', 'B-spline']:
+            curve = alg.draw_curve(p_list, algorithm, 50, region, spans=True)
+            assert_merged(curve)
+            assert expand(curve) == set(alg.draw_curve(p_list, algorithm, 50, region))
+        ellipse = alg.draw_ellipse(p_list[:2], spans=True)
+        assert_merged(ellipse)
+        assert expand(ellipse) == set(alg.draw_ellipse(p_list[:2]))
+
+
+def test_stroke_width():
+    """ 水平或竖直的线段恰好覆盖width行或列 """
+    for width in range(1, 8):
+        rows = {y for y, x0, x1 in alg.draw_stroke([(10, 20), (40, 20)], width)}
+        assert len(rows) == width
+        columns = {x for x, y in expand(alg.draw_stroke([(20, 10), (20, 40)], width))}
+        assert len(columns) == width
+
+
+def test_stroke_covers_centerline():
+    region = [0, 0, 199, 199]
+    r = random.Random(6)
+    for p_list in random_polylines(200, 7):
+        width = r.randint(2, 9)
+        for is_closed in [False, True]:
+            stroke = alg.draw_stroke(p_list, width, is_closed)
+            assert_merged(stroke)
+            assert expand(stroke) >= set(alg.draw_polygon(p_list, 'Bresenham', is_closed))
+            clipped = alg.draw_stroke(p_list, width, is_closed, region)
+            assert clipped == [(y, max(x0, 0), min(x1, 199)) for y, x0, x1 in stroke if 0 <= y <= 199 and x0 <= 199 and x1 >= 0]
+
+
+def ring_pixels(p_list, width, margin):
+    """ 像素中心在外椭圆内、内椭圆外的像素点（margin > 0时只取离两个椭圆都较远的，margin < 0时包括边界附近的） """
+    (x0, y0), (x1, y1) = p_list
+    xc, yc = (x0 + x1) / 2, (y0 + y1) / 2
+    a, b, r = abs(x1 - x0) / 2, abs(y1 - y0) / 2, width / 2
+    result = set()
+    for x in range(math.floor(xc - a - r) - 1, math.ceil(xc + a + r) + 2):
+        for y in range(math.floor(yc - b - r) - 1, math.ceil(yc + b + r) + 2):
+            outer = ((x - xc) / (a + r)) ** 2 + ((y - yc) / (b + r)) ** 2
+            inner = ((x - xc) / (a - r)) ** 2 + ((y - yc) / (b - r)) ** 2 if a > r and b > r else math.inf
+            if outer <= 1 - margin and inner >= 1 + margin:
+                result.add((x, y))
+    return result
+
+
+def test_thick_ellipse_ring():
+    """ 粗椭圆是半轴分别加减width / 2的两个椭圆之间的环 """
+    region = [0, 0, 199, 199]
+    r = random.Random(8)
+    for p_list in random_polylines(60, 9):
+        width = r.randint(1, 9)
+        ellipse = alg.draw_thick_ellipse(p_list[:2], width)
+        assert_merged(ellipse)
+        assert ring_pixels(p_list[:2], width, 1e-6) <= expand(ellipse) <= ring_pixels(p_list[:2], width, -1e-6)
+        clipped = alg.draw_thick_ellipse(p_list[:2], width, region)
+        assert expand(clipped) == {(x, y) for x, y in expand(ellipse) if 0 <= x <= 199 and 0 <= y <= 199}
+
+
+def test_thick_circle_covers_outline():
+    """ 圆的环宽处处相同，线宽不小于2时覆盖单像素的圆 """
+    r = random.Random(10)
+    for _ in range(300):
+        x, y, d = r.randint(0, 100), r.randint(0, 100), r.randint(1, 80)
+        for width in [2, 3, 6]:
+            p_list = [(x, y), (x + d, y + d)]
+            assert expand(alg.draw_thick_ellipse(p_list, width)) >= set(alg.draw_ellipse(p_list))
@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# cg_bench的测试：用法 cd source && python -m pytest
+from cg_bench import PHASES, report, run_scale
+from cg_workload import workload_options
+
+
+def test_run_scale(tmp_path, capsys):
+    params = dict(workload_options(['cg_bench.py', '--size', '100x100', '--save-every', '10']), items=30)
+    result = run_scale(params, str(tmp_path))
+    assert (result['items'], result['pixels']) == (30, 4 * 100 * 100)
+    assert result['commands'] == (tmp_path / 'workload_30.txt').read_text().count('\n')
+    assert set(result['phases']) == set(PHASES) | {'import', 'encode', 'other'}
+    assert result['wall'] > 0 and result['peak_rss_mb'] > 0
+    assert sorted(p.name for p in (tmp_path / 'outputs_30').iterdir()) == ['final.bmp', 'frame1.bmp', 'frame2.bmp',
+                                                                            'frame3.bmp']
+    report([result])
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split()[:2] == ['items', 'commands'] and lines[1].split()[:2] == ['30', str(result['commands'])]
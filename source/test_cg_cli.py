@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# cg_cli的测试：用法 cd source && python -m pytest
+import os
+import subprocess
+import sys
+import numpy as np
+from PIL import Image
+from cg_cli import CHECKPOINT_NAME, Session, select_items
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+RED, BLUE = (255, 0, 0), (0, 0, 255)
+
+
+def run(tmp_path, lines):
+    """ 执行指令，返回保存的位图 out.bmp（RGB） """
+    session = Session(str(tmp_path))
+    for line in lines + ['saveCanvas out']:
+        session.execute(line)
+    return np.array(Image.open(tmp_path / 'out.bmp').convert('RGB'))
+
+
+def overlapping_lines():
+    """ 红色线段在下，蓝色线段与之交于(50, 50)并在上 """
+    return ['resetCanvas 100 100',
+            'setColor 255 0 0', 'drawLine red 10 50 90 50 Bresenham',
+            'setColor 0 0 255', 'drawLine blue 50 10 50 90 Bresenham']
+
+
+def test_undo_delete_keeps_stacking_order(tmp_path):
+    canvas = run(tmp_path, overlapping_lines() + ['delete red', 'undo'])
+    assert tuple(canvas[50, 50]) == BLUE
+    assert tuple(canvas[50, 20]) == RED
+
+
+def test_undo_clip_keeps_stacking_order(tmp_path):
+    canvas = run(tmp_path, overlapping_lines() + ['clip red 0 0 5 5 Liang-Barsky', 'undo'])
+    assert tuple(canvas[50, 50]) == BLUE
+    assert tuple(canvas[50, 20]) == RED
+
+
+def test_undo_delete_several_items(tmp_path):
+    lines = ['resetCanvas 100 100']
+    for i, (r, g, b) in enumerate([(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0)]):
+        lines += ['setColor %d %d %d' % (r, g, b), 'drawLine l%d 10 50 90 50 Bresenham' % i]
+    expected = run(tmp_path, lines)
+    assert (run(tmp_path, lines + ['delete l0,l1,l3', 'undo']) == expected).all()
+    assert (run(tmp_path, lines + ['delete l1', 'delete l3', 'undo', 'undo']) == expected).all()
+
+
+def test_group_cycle():
+    item_dict = dict.fromkeys(['line1', 'line2', 'line3'])
+    group_dict = {'a': ['line1', '@b'], 'b': ['line2', '@a'], 'c': ['@c', 'line3']}
+    assert select_items(item_dict, group_dict, '@a') == ['line1', 'line2']
+    assert select_items(item_dict, group_dict, '@c,@b') == ['line3', 'line2', 'line1']
+
+
+def test_translate_cyclic_group(tmp_path):
+    canvas = run(tmp_path, ['resetCanvas 100 100', 'drawLine line1 10 10 20 10 Bresenham',
+                            'group a line1 @b', 'group b @a', 'translate @b 0 30'])
+    assert tuple(canvas[40, 15]) == (0, 0, 0)
+
+
+def test_output_color_mode(tmp_path):
+    lines = overlapping_lines()
+    run(tmp_path, lines)
+    assert Image.open(tmp_path / 'out.bmp').mode == 'RGB'
+    rgb = run(tmp_path, lines)
+    indexed = run(tmp_path, ['setOutputMode bmp indexed'] + lines)
+    assert Image.open(tmp_path / 'out.bmp').mode == 'P'
+    assert (indexed == rgb).all()
+
+
+def test_delete_drops_keyframes(tmp_path):
+    session = Session(str(tmp_path))
+    for line in ['resetCanvas 100 100', 'drawLine line1 10 10 20 10 Bresenham',
+                 'keyframe line1 0 translate 0 0', 'keyframe line1 2 translate 0 40',
+                 'delete line1', 'drawLine line1 10 10 20 10 Bresenham', 'renderFrames f 0 2']:
+        session.execute(line)
+    assert session.tracks == {}
+    canvas = np.array(Image.open(tmp_path / 'f_0002.bmp').convert('RGB'))
+    assert tuple(canvas[10, 15]) == (0, 0, 0)
+
+
+def resume_script():
+    """ 用到检查点中各项会话状态（组、颜色、撤销历史、关键帧）的指令，同名位图在检查点前后各保存一次 """
+    lines = ['resetCanvas 80 60', 'setColor 255 0 0', 'drawPolygon p 5 5 70 10 40 50 Bresenham', 'group g p',
+             'saveCanvas a', 'setPenWidth 3', 'setColor 0 128 255', 'drawEllipse e 10 10 50 40',
+             'keyframe e 0 translate 0 0', 'keyframe e 2 translate 10 5']
+    for i in range(6):
+        lines += ['setColor %d 200 0' % (40 * i), 'drawLine l%d %d 2 %d 58 DDA' % (i, 5 + 10 * i, 15 + 10 * i),
+                  'translate @g 1 1', 'undo' if i % 2 else 'fill 40 25', 'saveCanvas s%d' % i]
+    lines += ['renderFrames f 0 2', 'saveCanvas a']
+    return [line + '\n' for line in lines]
+
+
+def run_cli(input_file, output_dir, *args):
+    result = subprocess.run([sys.executable, os.path.join(SOURCE_DIR, 'cg_cli.py'), str(input_file), str(output_dir)]
+                            + list(args), capture_output=True)
+    assert result.returncode == 0, result.stderr
+
+
+def bitmaps(output_dir):
+    return {name: (output_dir / name).read_bytes() for name in sorted(os.listdir(output_dir))}
+
+
+def test_resume_after_interruption(tmp_path):
+    """ 检查点之后又保存了几张位图时中断，--resume恢复执行后的位图与一次执行完的逐字节相同 """
+    lines = resume_script()
+    input_file = tmp_path / 'input.txt'
+    input_file.write_text(''.join(lines))
+    run_cli(input_file, tmp_path / 'expected', '--checkpoint-interval', '0')
+    out = tmp_path / 'out'
+    session = Session(str(out))
+    for line in lines[:16]:
+        session.execute(line)
+    session.save_checkpoint(str(out / CHECKPOINT_NAME), sum(len(line) for line in lines[:16]))
+    for line in lines[16:27]:  # 检查点之后执行、中断后重新执行的指令
+        session.execute(line)
+    session.close()
+    run_cli(input_file, out, '--resume')
+    assert not (out / CHECKPOINT_NAME).exists()
+    assert bitmaps(out) == bitmaps(tmp_path / 'expected')
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# cg_client/cg_server的测试：用法 cd source && python -m pytest
+import os
+import sys
+import socketserver
+import subprocess
+import threading
+import pytest
+from cg_server import SessionHandler
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+INSTRUCTIONS = 'resetCanvas 100 100\nsetColor 255 0 0\ndrawLine line1 10 10 90 60 Bresenham\nsaveCanvas 1\n'
+
+
+@pytest.fixture
+def server(tmp_path):
+    socket_path = str(tmp_path / 'cg.sock')
+    with socketserver.ThreadingUnixStreamServer(socket_path, SessionHandler) as s:
+        s.daemon_threads = True
+        thread = threading.Thread(target=s.serve_forever)
+        thread.start()
+        yield socket_path
+        s.shutdown()
+        thread.join()
+
+
+def run_client(socket_path, args, stdin=None):
+    env = dict(os.environ, CG_CLI_SOCKET=socket_path)
+    return subprocess.run([sys.executable, os.path.join(SOURCE_DIR, 'cg_client.py')] + args, stdin=stdin, env=env,
+                          capture_output=True)
+
+
+def test_regular_file(server, tmp_path):
+    input_file = tmp_path / 'input.txt'
+    input_file.write_text(INSTRUCTIONS)
+    result = run_client(server, [str(input_file), str(tmp_path / 'out')])
+    assert result.returncode == 0, result.stderr
+    assert (tmp_path / 'out' / '1.bmp').exists()
+
+
+def test_piped_stdin(server, tmp_path):
+    cat = subprocess.Popen(['cat'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    cat.stdin.write(INSTRUCTIONS.encode('utf-8'))
+    cat.stdin.close()
+    result = run_client(server, ['-', str(tmp_path / 'out')], stdin=cat.stdout)
+    cat.wait()
+    assert result.returncode == 0, result.stderr
+    assert (tmp_path / 'out' / '1.bmp').exists()
+
+
+def test_checkpoint_options_rejected(server, tmp_path):
+    input_file = tmp_path / 'input.txt'
+    input_file.write_text(INSTRUCTIONS)
+    result = run_client(server, [str(input_file), str(tmp_path / 'out'), '--resume'])
+    assert result.returncode == 1
+    assert not (tmp_path / 'out').exists()
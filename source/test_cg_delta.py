@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# cg_delta的测试：用法 cd source && python -m pytest
+import io
+import os
+import numpy as np
+import pytest
+from PIL import Image
+from cg_cli import CHECKPOINT_NAME, CHECKPOINT_INTERVAL, Session, save_image
+from cg_delta import KEYFRAME, DELTA, DeltaWriter, read_frame, read_index
+from cg_input import skip_input
+
+
+def test_resume_missing_stream(tmp_path):
+    with pytest.raises(ValueError):
+        DeltaWriter(str(tmp_path / 'frames.cgd'), 100)
+    assert not (tmp_path / 'frames.cgd').exists()
+
+
+def test_resume_truncated_stream(tmp_path):
+    path = str(tmp_path / 'frames.cgd')
+    writer = DeltaWriter(path)
+    writer.write('a', np.zeros([4, 4], np.uint8), [(255, 255, 255)])
+    size = writer.tell()
+    writer.close()
+    with pytest.raises(ValueError):
+        DeltaWriter(path, size + 1)
+    writer = DeltaWriter(path, size)  # 续写已有的帧流
+    writer.write('b', np.ones([4, 4], np.uint8), [(255, 255, 255), (0, 0, 0)])
+    writer.close()
+    assert [record['name'] for record in read_index(path)] == ['a', 'b']
+    assert (read_frame(path, 'a')[0] == 0).all()
+    assert (read_frame(path, 'b')[0] == 1).all()
+
+
+def test_session_closes_stream(tmp_path):
+    session = Session(str(tmp_path))
+    for line in ['resetCanvas 20 20', 'setOutputMode delta', 'drawLine a 0 0 19 19 Bresenham', 'saveCanvas f1']:
+        session.execute(line)
+    writer = session.delta_writer
+    session.execute('setOutputMode bmp')
+    assert session.delta_writer is None and writer.fp.closed
+    for line in ['setOutputMode delta', 'drawLine b 0 19 19 0 Bresenham', 'saveCanvas f2']:  # 续写同一个帧流
+        session.execute(line)
+    writer = session.delta_writer
+    session.close()
+    assert session.delta_writer is None and writer.fp.closed
+    assert [record['name'] for record in read_index(str(tmp_path / 'frames.cgd'))] == ['f1', 'f2']
+
+
+def frame_script(mode):
+    """ 连续小幅编辑并保存的指令：在mode输出方式下保存8帧 """
+    lines = ['resetCanvas 60 40', 'setOutputMode %s' % mode, 'setColor 255 0 0', 'drawPolygon p 5 5 50 8 30 35 Bresenham']
+    for i in range(8):
+        lines += ['setColor %d %d 0' % (30 * i, 255 - 30 * i), 'drawLine l%d %d 2 %d 38 DDA' % (i, 4 + 6 * i, 10 + 6 * i),
+                  'translate p 1 0', 'saveCanvas f%d' % i]
+    return [line + '\n' for line in lines]
+
+
+def expected_frames(tmp_path, mode='bmp'):
+    """ 以完整位图方式保存的各帧（位图文件内容） """
+    out = tmp_path / 'bmp'
+    Session(str(out)).run(io.BytesIO(''.join(frame_script(mode)).encode('utf-8')))
+    return {'f%d' % i: (out / ('f%d.bmp' % i)).read_bytes() for i in range(8)}
+
+
+def reconstructed_frames(tmp_path, stream):
+    """ 由帧流还原的各帧（还原为位图后的文件内容） """
+    frames = {}
+    for i in range(8):
+        canvas, palette = read_frame(str(stream), 'f%d' % i)
+        save_image(canvas, palette, str(tmp_path / 'frame.bmp'))
+        frames['f%d' % i] = (tmp_path / 'frame.bmp').read_bytes()
+    return frames
+
+
+def test_round_trip(tmp_path):
+    out = tmp_path / 'delta'
+    Session(str(out)).run(io.BytesIO(''.join(frame_script('delta 3')).encode('utf-8')))
+    stream = out / 'frames.cgd'
+    kinds = [record['kind'] for record in read_index(str(stream))]
+    assert kinds == [KEYFRAME, DELTA, DELTA, KEYFRAME, DELTA, DELTA, KEYFRAME, DELTA]
+    assert not any(name.endswith('.bmp') for name in os.listdir(out))
+    assert reconstructed_frames(tmp_path, stream) == expected_frames(tmp_path)
+
+
+def test_round_trip_indexed(tmp_path):
+    out = tmp_path / 'delta'
+    Session(str(out)).run(io.BytesIO(''.join(frame_script('delta indexed')).encode('utf-8')))
+    expected = expected_frames(tmp_path, 'bmp indexed')
+    for i in range(8):
+        canvas, palette = read_frame(str(out / 'frames.cgd'), 'f%d' % i)
+        rgb = np.array(palette, np.uint8)[canvas]
+        assert (rgb == np.array(Image.open(io.BytesIO(expected['f%d' % i])).convert('RGB'))).all()
+
+
+def test_resume_round_trip(tmp_path):
+    """ 检查点之后又写入了几帧时中断，恢复执行后帧流与一次执行完的结果相同 """
+    lines = frame_script('delta 3')
+    out = tmp_path / 'delta'
+    checkpoint = str(out / CHECKPOINT_NAME)
+    session = Session(str(out))
+    for line in lines[:15]:
+        session.execute(line)
+    session.save_checkpoint(checkpoint, sum(len(line.encode('utf-8')) for line in lines[:15]))
+    for line in lines[15:30]:  # 检查点之后写入、中断后被丢弃的帧
+        session.execute(line)
+    session.close()
+    session = Session(str(out))
+    offset = session.load_checkpoint(checkpoint)
+    fp = io.BytesIO(''.join(lines).encode('utf-8'))
+    skip_input(fp, offset)
+    session.run(fp, checkpoint, CHECKPOINT_INTERVAL, offset)
+    assert not os.path.exists(checkpoint)
+    assert [record['name'] for record in read_index(str(out / 'frames.cgd'))] == ['f%d' % i for i in range(8)]
+    assert reconstructed_frames(tmp_path, out / 'frames.cgd') == expected_frames(tmp_path)
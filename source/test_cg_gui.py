@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# cg_gui的测试（无界面环境下运行）：用法 cd source && python -m pytest
+import os
+import sys
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+QtWidgets = pytest.importorskip('PyQt5.QtWidgets')
+import cg_gui
+import cg_replay
+
+RED, BLUE = (255, 0, 0), (0, 0, 255)
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+
+
+@pytest.fixture
+def window(app):
+    main_window = cg_gui.MainWindow()
+    group_dict = {}
+    for line in ['resetCanvas 100 100',
+                 'setColor 255 0 0', 'drawLine red 10 50 90 50 Bresenham',
+                 'setColor 0 0 255', 'drawLine blue 50 10 50 90 Bresenham']:
+        cg_replay.replay_command(main_window, group_dict, line)
+    yield main_window
+    main_window.close()
+
+
+def pixel(canvas, x, y):
+    tile = canvas.render_tile(0, 0, 0)[0]
+    return tuple(int(c) for c in tile[y, x])
+
+
+def test_undo_delete_keeps_stacking_order(window):
+    canvas = window.canvas_widget
+    assert pixel(canvas, 50, 50) == BLUE
+    canvas.multi_selection_changed(['red'])
+    canvas.delete_selected_item()
+    canvas.undo()
+    assert list(canvas.item_dict) == ['red', 'blue']
+    assert pixel(canvas, 50, 50) == BLUE
+    assert pixel(canvas, 20, 50) == RED
+
+
+def test_undo_clip_keeps_stacking_order(window):
+    canvas = window.canvas_widget
+    canvas.multi_selection_changed(['red'])
+    canvas.clip_selected_item(0, 0, 5, 5, 'Liang-Barsky')
+    assert 'red' not in canvas.item_dict
+    canvas.undo()
+    assert list(canvas.item_dict) == ['red', 'blue']
+    assert pixel(canvas, 50, 50) == BLUE
+
+
+def test_bounding_rect_follows_p_list(window):
+    item = window.canvas_widget.item_dict['red']
+    assert item.boundingRect().right() == 91
+    item.p_list[1] = (95, 50)
+    item.p_list_changed()
+    assert item.boundingRect().right() == 96
+    item.p_list = [(10, 50), (60, 50)]
+    assert item.boundingRect().right() == 61
+
+
+def test_refill_only_when_boundary_changes(window):
+    canvas = window.canvas_widget
+    for line in ['setColor 0 255 0', 'drawPolygon box 60 60 90 60 90 90 60 90 Bresenham', 'fill inner 75 75']:
+        cg_replay.replay_command(window, {}, line)
+    fill = canvas.item_dict['inner']
+    version, spans = fill.fill_version, fill.fill_spans
+    assert fill.pixel_bounds == (61, 61, 90, 90)
+    cg_replay.replay_command(window, {}, 'drawLine far 5 5 20 5 Bresenham')
+    cg_replay.replay_command(window, {}, 'translate far 0 10')
+    assert fill.fill_version == version
+    cg_replay.replay_command(window, {}, 'drawLine cut 60 75 90 75 Bresenham')  # 在填充之上，不影响填充
+    assert fill.fill_version == version
+    cg_replay.replay_command(window, {}, 'translate box 0 -5')
+    assert fill.fill_version != version and fill.pixel_bounds == (61, 56, 90, 85)
+    canvas.undo()
+    assert fill.pixel_bounds == (61, 61, 90, 90) and (fill.fill_spans == spans).all()
+
+
+def test_scale_fill_moves_seed(window):
+    canvas = window.canvas_widget
+    for line in ['fill inner 20 20', 'drawLine dot 5 5 5 5 Bresenham']:
+        cg_replay.replay_command(window, {}, line)
+    assert canvas.item_dict['inner'].scalable() and not canvas.item_dict['dot'].scalable()
+    cg_replay.replay_command(window, {}, 'scale inner 10 10 2')
+    assert canvas.item_dict['inner'].p_list == [(30, 30)]
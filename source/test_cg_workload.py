@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# cg_workload的测试：用法 cd source && python -m pytest
+import gzip
+import io
+import os
+import pytest
+from cg_cli import Session
+from cg_workload import generate, parse_mix, workload_options, write
+
+PARAMS = {'width': 120, 'height': 80, 'items': 60, 'transforms': 1.5, 'save_every': 20, 'colors': 0.3}
+
+
+def test_same_seed_same_commands():
+    assert list(generate(7, **PARAMS)) == list(generate(7, **PARAMS))
+    assert list(generate(7, **PARAMS)) != list(generate(8, **PARAMS))
+
+
+def test_options():
+    argv = ['cg_workload.py', 'out.txt', '--seed', '3', '--size', '300x200', '--mix', 'line=2,curve=1']
+    params = workload_options(argv)
+    assert (params['seed'], params['width'], params['height'], params['items']) == (3, 300, 200, 1000)
+    assert params['mix'] == [2.0, 0.0, 0.0, 1.0]
+    with pytest.raises(ValueError):
+        parse_mix('line=1,circle=1')
+
+
+def test_write_compressed(tmp_path):
+    lines = list(generate(1, **PARAMS))
+    assert write(str(tmp_path / 'w.txt.gz'), lines) == len(lines)
+    with gzip.open(tmp_path / 'w.txt.gz', 'rt') as fp:
+        assert fp.read().splitlines() == lines
+
+
+def render(tmp_path, seed):
+    """ 用cg_cli执行种子为seed的场景，返回保存的各位图的内容 """
+    out = tmp_path / str(seed)
+    Session(str(out)).run(io.BytesIO(''.join(line + '\n' for line in generate(seed, **PARAMS)).encode('utf-8')))
+    return {name: (out / name).read_bytes() for name in sorted(os.listdir(out))}
+
+
+def test_same_seed_same_output(tmp_path):
+    first = render(tmp_path, 5)
+    assert sorted(first) == ['final.bmp', 'frame1.bmp', 'frame2.bmp', 'frame3.bmp']
+    assert render(tmp_path / 'again', 5) == first
+    assert render(tmp_path, 6) != first